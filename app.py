@@ -1,5 +1,8 @@
+import asyncio
 import gradio as gr
+import os
 import time
+from src.async_pipeline import AsyncRAGPipeline, QueueFullError
 from src.rag_pipeline import build_rag_pipeline
 
 # --- 1. Initialize your existing RAG Pipeline ---
@@ -7,19 +10,52 @@ from src.rag_pipeline import build_rag_pipeline
 # In app.py
 BASE_PATH = "/Users/elbethelzewdie/Downloads/rag-complaint-chatbot/rag-complaint-chatbot"
 
+# The memory-mapped columnar metadata (see src/metadata_store.py) opens
+# without parsing; fall back to the JSON file if it has not been migrated
+META_PATH = f"{BASE_PATH}/metadata.arrow"
+if not os.path.exists(META_PATH):
+    META_PATH = f"{BASE_PATH}/metadata.json"
+
+# One llama.cpp process scales to ~8 cores; on bigger machines several
+# processes answer different questions in parallel (see src/generator_pool.py)
+LLM_WORKERS = int(os.environ.get("LLM_WORKERS", "1"))
+# Answers quote the excerpts, so drafting tokens by lookup in the prompt
+# (speculative decoding) speeds up decoding; 0 turns it off. Costs ~0.5 GB
+# of logits per model; see benchmarks/bench_speculative_decoding.py
+PROMPT_LOOKUP_TOKENS = int(os.environ.get("PROMPT_LOOKUP_TOKENS", "0"))
+
+# Components load in background threads so the UI comes up immediately;
+# the FAISS index is memory-mapped instead of read into RAM
 pipeline = build_rag_pipeline(
     faiss_index_path=f"{BASE_PATH}/faiss.index",  # Changed from faiss_index.bin to faiss.index
-    meta_path=f"{BASE_PATH}/metadata.json",
-    llm_model_path=f"{BASE_PATH}/Mistral-7B-Instruct-v0.3-Q4_K_M.gguf"
+    meta_path=META_PATH,
+    llm_model_path=f"{BASE_PATH}/Mistral-7B-Instruct-v0.3-Q4_K_M.gguf",
+    background=True,
+    mmap_index=True,
+    llm_workers=LLM_WORKERS,
+    llm_prompt_lookup_tokens=PROMPT_LOOKUP_TOKENS,
 )
 
 
-# --- 2. Chat Function (with Streaming and Sources) ---
-def predict(message, history):
-    # ... (Retrieval happens here) ...
-    retrieved_chunks = pipeline.retriever.retrieve(message, k=5)
+# Generation requests queue FIFO in front of the LLM_WORKERS model processes
+# (each answers one question at a time), while retrieval runs concurrently
+# in threads. Beyond MAX_QUEUE waiting requests new questions are turned
+# away politely.
+MAX_QUEUE = 8
+# A request stops after REQUEST_TIMEOUT seconds (queue wait included) and
+# returns what was generated so far; closing the tab or pressing Stop ends
+# its generation right away, so the model moves on to the next user.
+REQUEST_TIMEOUT = 180
+async_pipeline = AsyncRAGPipeline(pipeline, max_queue=MAX_QUEUE, generation_workers=LLM_WORKERS,
+                                  request_timeout=REQUEST_TIMEOUT)
+
+STOP_NOTES = {
+    "deadline": "\n\n_(Answer cut short: time limit reached.)_",
+    "max_tokens": "\n\n_(Answer cut short: length limit reached.)_",
+}
+
 
-    # Create the sources summary for display
+def format_sources(retrieved_chunks):
     sources = "\n\n**Sources:**\n"
     for i, res in enumerate(retrieved_chunks):
         meta = res.get('metadata', {}) # Use .get() for safety
@@ -28,33 +64,48 @@ def predict(message, history):
         product = meta.get('product', 'N/A')
         issue = meta.get('issue', 'N/A')
         sources += f"- [{c_id}] {product}: {issue}\n"
+    return sources
 
-    # Streaming the response (Requirement: Streaming)
-    # Note: We use a generator with 'yield' to stream tokens in Gradio
-    full_response = ""
-
-    # We call the generator's internal model to get a stream
-    # Mistral v0.3 prompt format
-    prompt = f"<s>[INST] Use the context to answer: {message}\n\nCONTEXT:\n{pipeline.generator.build_context(retrieved_chunks)} [/INST]"
 
-    # Using the Llama-CPP model stream directly for the UI
-    stream = pipeline.generator.model(
-        prompt,
-        max_tokens=512,
-        temperature=0.0,
-        stream=True
-    )
+# --- 2. Chat Function (with Streaming and Sources) ---
+async def predict(message, history):
+    if not pipeline.ready:
+        status = ", ".join(f"{name}: {state}" for name, state in pipeline.loader.status().items())
+        yield f"⏳ Models are still loading ({status}). Your question will be answered as soon as they are ready..."
+        await asyncio.to_thread(pipeline.wait_until_ready)
 
-    for chunk in stream:
-        token = chunk['choices'][0]['text']
-        full_response += token
-        # Yield the partial response + the static sources list
-        yield full_response + sources
+    full_response = ""
+    sources = ""
+    try:
+        # Sources arrive first (retrieval), then queue updates, then tokens
+        async for kind, value in async_pipeline.stream(message, k=5):
+            if kind == "sources":
+                sources = format_sources(value)
+            elif kind == "queued":
+                eta = value["estimated_wait_seconds"]
+                eta = f", about {eta:.0f}s" if eta is not None else ""
+                yield f"⏳ You are #{value['position']} in line ({value['ahead']} ahead of you{eta})..." + sources
+            elif kind == "token":
+                full_response += value
+                # Yield the partial response + the static sources list
+                yield full_response + sources
+            elif kind == "done":
+                metrics = value["metrics"]
+                print(f"[{metrics}] {message[:60]!r}")
+                yield value["answer"] + STOP_NOTES.get(metrics.stop_reason, "") + sources
+    except QueueFullError as error:
+        wait = f" (about {error.estimated_wait_seconds:.0f}s of work is queued)" if error.estimated_wait_seconds else ""
+        yield f"🚦 The assistant is busy answering {error.capacity} other questions{wait}. Please try again shortly."
+    except TimeoutError:
+        yield f"⌛ Your question waited longer than {REQUEST_TIMEOUT}s in line. Please try again."
 
 # --- Update the UI section of app.py ---
 # Minimal configuration to ensure compatibility
 demo = gr.ChatInterface(
     fn=predict,
+    # Admission control is done by async_pipeline's queue, not by Gradio's
+    # default of one request at a time
+    concurrency_limit=None,
     title="🛡️ CrediTrust Analyst Assistant",
     description="Ask questions based on local customer complaint data.",
     examples=[
@@ -0,0 +1,66 @@
+"""
+bench_batch_retrieval.py
+
+Compare per-question cost of ComplaintRetriever.retrieve in a Python loop
+against one retrieve_many call (batched encode + one matrix search).
+
+Usage:
+    python -m benchmarks.bench_batch_retrieval --index vector_store/faiss.index \
+        --meta vector_store/metadata.arrow --questions 1000
+    python -m benchmarks.bench_batch_retrieval --vectors 200000   # synthetic store
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.evaluation import EVALUATION_QUESTIONS
+from src.retriever import ComplaintRetriever, MiniLMEmbedder
+from src.vector_store import EMBEDDING_DIM, ComplaintVectorStore
+
+
+def synthetic_store(n: int, seed: int = 42) -> ComplaintVectorStore:
+    rng = np.random.default_rng(seed)
+    store = ComplaintVectorStore()
+    store.add(rng.standard_normal((n, EMBEDDING_DIM), dtype="float32"),
+              [f"chunk {i}" for i in range(n)],
+              [{"complaint_id": str(i)} for i in range(n)])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="FAISS index path (default: synthetic store)")
+    parser.add_argument("--meta", help="Metadata path matching --index")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Size of the synthetic store")
+    parser.add_argument("--questions", type=int, default=512, help="Number of questions")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    store = ComplaintVectorStore.load(args.index, args.meta) if args.index else synthetic_store(args.vectors)
+    retriever = ComplaintRetriever(vector_store=store, embedder=MiniLMEmbedder())
+    # Vary the evaluation questions so the encoder cannot reuse anything
+    questions = [f"{EVALUATION_QUESTIONS[i % len(EVALUATION_QUESTIONS)]} ({i})" for i in range(args.questions)]
+    retriever.retrieve_many(questions[:8], k=args.k)  # warm up
+
+    start = time.perf_counter()
+    looped = [retriever.retrieve(q, k=args.k) for q in questions]
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = retriever.retrieve_many(questions, k=args.k)
+    batch_s = time.perf_counter() - start
+
+    same = [[r["text"] for r in rs] for rs in looped] == [[r["text"] for r in rs] for rs in batched]
+    print("=" * 70)
+    print(f"Questions:        {len(questions):,} (store: {store.index.ntotal:,} chunks)")
+    print(f"retrieve loop:    {1000 * loop_s / len(questions):.2f} ms/question")
+    print(f"retrieve_many:    {1000 * batch_s / len(questions):.2f} ms/question")
+    print(f"Speed-up:         {loop_s / batch_s:.1f}x")
+    print(f"Same results:     {same}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+bench_hybrid_retrieval.py
+
+Latency and recall of BM25-narrowed ("hybrid") and fused retrieval against
+pure dense search, with recall@k measured against exact dense search.
+
+By default a synthetic corpus is generated whose embeddings are built from
+word vectors, so lexical and dense relevance are correlated like they are
+for real chunks. Pass a saved store to measure the real corpus instead.
+
+Usage:
+    python -m benchmarks.bench_hybrid_retrieval --chunks 200000
+    python -m benchmarks.bench_hybrid_retrieval --index vector_store/faiss.index \
+        --meta vector_store/metadata.arrow --questions 200
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.evaluation import EVALUATION_QUESTIONS
+from src.lexical_index import BM25Index
+from src.retriever import ComplaintRetriever
+from src.vector_store import EMBEDDING_DIM, ComplaintVectorStore
+
+
+class BagOfWordsEmbedder:
+    """Sum of fixed random word vectors: a cheap stand-in for MiniLM."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM, seed: int = 0):
+        self.dim = dim
+        self.seed = seed
+        self._vectors = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        if word not in self._vectors:
+            rng = np.random.default_rng(abs(hash((self.seed, word))) % (2 ** 32))
+            self._vectors[word] = rng.standard_normal(self.dim).astype("float32")
+        return self._vectors[word]
+
+    def encode(self, text: str) -> np.ndarray:
+        words = text.lower().split() or ["<empty>"]
+        return np.sum([self._word(w) for w in words], axis=0)
+
+
+def synthetic_corpus(n_chunks: int, vocab_size: int = 20_000, n_topics: int = 500, seed: int = 42):
+    """Chunks of 40-80 words drawn mostly from one topic's vocabulary (Zipf-like)."""
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(vocab_size)])
+    topic_words = rng.integers(vocab_size, size=(n_topics, 60))
+    texts = []
+    for _ in range(n_chunks):
+        topic = topic_words[rng.integers(n_topics)]
+        length = rng.integers(40, 80)
+        own = topic[np.minimum(rng.zipf(1.5, size=length) - 1, len(topic) - 1)]
+        noise = rng.integers(vocab_size, size=length // 4)
+        texts.append(" ".join(vocab[np.concatenate([own, noise])]))
+    questions = [" ".join(vocab[topic_words[rng.integers(n_topics)][rng.integers(60, size=4)]])
+                 for _ in range(1000)]
+    return texts, questions
+
+
+def _time_queries(fn, questions):
+    latencies, results = [], []
+    for question in questions:
+        start = time.perf_counter()
+        results.append(fn(question))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="FAISS index of a saved store (default: synthetic corpus)")
+    parser.add_argument("--meta", help="Metadata path matching --index")
+    parser.add_argument("--chunks", type=int, default=100_000, help="Synthetic corpus size")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=200, help="BM25 candidates per question")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    query_transform = None
+    if args.index:
+        from src.data_preprocessing import ComplaintPreprocessor
+        from src.retriever import build_embedder
+        store = ComplaintVectorStore.load(args.index, args.meta)
+        embedder = build_embedder()
+        # The stored chunks are preprocessed; clean the questions the same way for BM25
+        query_transform = ComplaintPreprocessor(verbose=False).clean_text
+        questions = [EVALUATION_QUESTIONS[i % len(EVALUATION_QUESTIONS)] for i in range(args.questions)]
+    else:
+        texts, questions = synthetic_corpus(args.chunks)
+        embedder = BagOfWordsEmbedder()
+        store = ComplaintVectorStore()
+        store.add(np.vstack([embedder.encode(t) for t in texts]), texts,
+                  [{"complaint_id": str(i)} for i in range(len(texts))])
+        questions = questions[:args.questions]
+
+    start = time.perf_counter()
+    lexical = BM25Index.build(store.texts)
+    print(f"BM25 index over {len(lexical):,} chunks built in {time.perf_counter() - start:.1f}s "
+          f"({(lexical.doc_ids.nbytes + lexical.impacts.nbytes + lexical.indptr.nbytes) / 1e6:.0f} MB CSR)")
+
+    retriever = ComplaintRetriever(store, embedder, lexical_index=lexical, num_candidates=args.candidates,
+                                   query_transform=query_transform)
+    for question in questions[:5]:
+        retriever.embed_question(question)  # warm up
+
+    def ids(results):
+        # Texts identify chunks in both the synthetic and the real store
+        return [r["text"] for r in results]
+
+    runs = {}
+    for mode in ("dense", "hybrid", "fusion"):
+        runs[mode] = _time_queries(lambda q: ids(retriever.retrieve(q, k=args.k, mode=mode)), questions)
+
+    truth = runs["dense"][0]
+    print("=" * 70)
+    print(f"{'mode':<10}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, (found, latencies) in runs.items():
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+        recall = hits / max(sum(len(t) for t in truth), 1)
+        print(f"{mode:<10}{recall:>10.3f}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
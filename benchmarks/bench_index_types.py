@@ -0,0 +1,65 @@
+"""
+bench_index_types.py
+
+Recall@k, p50/p99 query latency and memory of the flat, compressed (fp16,
+int8, PQ; with and without re-ranking over float32 vectors), IVF-Flat,
+IVF-PQ and HNSW index types over the same vectors (see src/index_evaluation.py).
+
+Usage:
+    python -m benchmarks.bench_index_types --vectors 200000
+    python -m benchmarks.bench_index_types --index vector_store/faiss.index
+"""
+
+import argparse
+
+import faiss
+import numpy as np
+
+from src.index_evaluation import evaluate_index_configs, print_index_report
+from src.vector_store import EMBEDDING_DIM, default_nlist
+
+
+def synthetic_vectors(n: int, dim: int = EMBEDDING_DIM, n_clusters: int = 200, seed: int = 42) -> np.ndarray:
+    """Clustered vectors, closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim), dtype="float32")
+    return centers[rng.integers(n_clusters, size=n)] + 0.5 * rng.standard_normal((n, dim), dtype="float32")
+
+
+def default_configs(n: int):
+    nlist = default_nlist(n)
+    return [
+        {"index_type": "flat"},
+        {"index_type": "sq_fp16"},
+        {"index_type": "sq8", "rerank": [0, 4]},
+        {"index_type": "pq", "pq_m": 48, "rerank": [0, 4, 16]},
+        {"index_type": "ivf_flat", "nlist": nlist, "nprobe": [1, 8, 32, 128]},
+        {"index_type": "ivf_pq", "nlist": nlist, "pq_m": 48, "nprobe": [8, 32, 128], "rerank": [0, 8]},
+        {"index_type": "hnsw", "hnsw_m": 32, "ef_search": [16, 64, 256]},
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Existing flat FAISS index to take vectors from (default: synthetic)")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Number of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500, help="Number of queries")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index:
+        index = faiss.read_index(args.index)
+        vectors = index.reconstruct_n(0, index.ntotal)
+    else:
+        vectors = synthetic_vectors(args.vectors)
+    # Queries: perturbed corpus vectors, so each has true near neighbours
+    queries = vectors[rng.integers(len(vectors), size=args.queries)]
+    queries = queries + 0.1 * queries.std() * rng.standard_normal(queries.shape, dtype="float32")
+
+    reports = evaluate_index_configs(vectors, queries, default_configs(len(vectors)), k=args.k)
+    print_index_report(reports, args.k, len(vectors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+bench_speculative_decoding.py
+
+Decoding speed of prompt-lookup speculative decoding against plain
+token-by-token decoding, answering the EVALUATION_QUESTIONS over their
+retrieved excerpts, and whether the answers stay identical (decoding is
+greedy at temperature 0, so speculation must not change them).
+
+Each setting loads the model once and answers every question; tokens/s is
+the decode speed after the first token (prompt evaluation is unaffected by
+speculation and reported separately as time to first token).
+
+Usage:
+    python -m benchmarks.bench_speculative_decoding --model Mistral-7B-Instruct-v0.3-Q4_K_M.gguf \
+        --index vector_store/faiss.index --meta vector_store/metadata.arrow --draft-tokens 4 10
+"""
+
+import argparse
+import gc
+
+import numpy as np
+
+from src.evaluation import EVALUATION_QUESTIONS
+from src.generator import RAGGenerator
+from src.retriever import build_retriever
+from src.streaming import MeteredStream
+
+
+def answer_all(generator, questions, contexts):
+    """(answer, tokens/s, seconds to first token) per question."""
+    rows = []
+    for question, chunks in zip(questions, contexts):
+        stream = MeteredStream(generator.stream(question, chunks))
+        for _ in stream:
+            pass
+        answer = stream.text.strip()
+        metrics = stream.metrics
+        tokens = generator.count_tokens(answer)
+        decode_seconds = metrics.total_seconds - (metrics.first_token_seconds or 0.0)
+        rows.append((answer, (tokens - 1) / decode_seconds if tokens > 1 and decode_seconds > 0 else 0.0,
+                     metrics.first_token_seconds or 0.0))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="GGUF model")
+    parser.add_argument("--index", required=True, help="FAISS index of the vector store")
+    parser.add_argument("--meta", required=True, help="Metadata path matching --index")
+    parser.add_argument("--questions", type=int, default=len(EVALUATION_QUESTIONS))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[4, 10],
+                        help="Draft lengths to compare with plain decoding")
+    parser.add_argument("--threads", type=int, help="llama.cpp threads (default: all cores)")
+    args = parser.parse_args()
+
+    questions = [EVALUATION_QUESTIONS[i % len(EVALUATION_QUESTIONS)] for i in range(args.questions)]
+    retriever = build_retriever(args.index, args.meta)
+    contexts = [retriever.retrieve(q, k=args.k) for q in questions]
+
+    runs = {}
+    for draft in [0] + args.draft_tokens:
+        # No saved prefix state: every setting evaluates its prompts the same way
+        generator = RAGGenerator(model_path=args.model, n_threads=args.threads, cache_prefix=False,
+                                 prompt_lookup_tokens=draft)
+        runs[draft] = answer_all(generator, questions, contexts)
+        print(f"draft={draft}: {np.mean([r[1] for r in runs[draft]]):.1f} tokens/s")
+        del generator
+        gc.collect()
+
+    baseline = runs[0]
+    base_speed = np.mean([r[1] for r in baseline])
+    print("\n" + "=" * 70)
+    print(f"PROMPT-LOOKUP DECODING ({len(questions)} questions, k={args.k})")
+    print("=" * 70)
+    print(f"{'draft tokens':<14}{'tokens/s':>10}{'speed-up':>10}{'p50 TTFT s':>12}{'identical':>12}")
+    for draft, rows in runs.items():
+        speed = np.mean([r[1] for r in rows])
+        same = sum(r[0] == b[0] for r, b in zip(rows, baseline))
+        label = "off" if draft == 0 else str(draft)
+        print(f"{label:<14}{speed:>10.1f}{speed / base_speed if base_speed else 0.0:>9.2f}x"
+              f"{np.percentile([r[2] for r in rows], 50):>12.2f}{f'{same}/{len(rows)}':>12}")
+    print("=" * 70)
+
+    for draft, rows in runs.items():
+        for i, (row, base) in enumerate(zip(rows, baseline)):
+            if row[0] != base[0]:
+                at = next((j for j, (a, b) in enumerate(zip(row[0], base[0])) if a != b),
+                          min(len(row[0]), len(base[0])))
+                print(f"draft={draft} question {i}: answers diverge at character {at}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+bench_vector_store_build.py
+
+Time ComplaintVectorStore.from_parquet on a synthetic corpus of chunk
+embeddings (1M chunks by default), reporting chunks/sec and peak resident
+memory of the build.
+
+Usage:
+    python -m benchmarks.bench_vector_store_build --chunks 1000000
+    python -m benchmarks.bench_vector_store_build --chunks 200000 --meta json
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.chunking import METADATA_TYPE
+from src.vector_store import EMBEDDING_DIM, ComplaintVectorStore
+
+_CATEGORIES = ["Credit card", "Personal loan", "Savings account", "Money transfers"]
+_STATES = ["CA", "NY", "TX", "FL", "WA"]
+
+
+def write_synthetic_embeddings(path: str, n_chunks: int, row_group_size: int = 50_000, seed: int = 42) -> None:
+    """Write a Parquet file shaped like the embedding stage output, one row group at a time."""
+    rng = np.random.default_rng(seed)
+    schema = pa.schema([
+        ("chunk_text", pa.string()),
+        ("metadata", METADATA_TYPE),
+        ("embedding", pa.list_(pa.float32(), EMBEDDING_DIM)),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, n_chunks, row_group_size):
+            rows = min(row_group_size, n_chunks - start)
+            ids = np.arange(start, start + rows)
+            complaint_ids = (ids // 3).astype(str)
+            metadata = pa.StructArray.from_arrays(
+                [
+                    pa.array(complaint_ids),
+                    pa.array(np.array(_CATEGORIES)[ids % len(_CATEGORIES)]),
+                    pa.array(np.array(_CATEGORIES)[ids % len(_CATEGORIES)]),
+                    pa.array(np.full(rows, "Billing dispute")),
+                    pa.array(np.full(rows, "N/A")),
+                    pa.array(np.full(rows, "Bank")),
+                    pa.array(np.array(_STATES)[ids % len(_STATES)]),
+                    pa.array(np.full(rows, "2023-01-01")),
+                    pa.array((ids % 3).astype("int32")),
+                    pa.array(np.full(rows, 3, dtype="int32")),
+                ],
+                fields=list(METADATA_TYPE),
+            )
+            embeddings = rng.standard_normal((rows, EMBEDDING_DIM), dtype="float32")
+            writer.write_table(pa.table({
+                "chunk_text": pa.array(np.char.add("complaint chunk ", ids.astype(str))),
+                "metadata": metadata,
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(embeddings.reshape(-1)), EMBEDDING_DIM),
+            }, schema=schema))
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1_000_000, help="Number of synthetic chunks")
+    parser.add_argument("--input", help="Existing embeddings parquet file or shard directory (skips generation)")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="from_parquet batch size")
+    parser.add_argument("--meta", choices=["arrow", "json"], default="arrow", help="Metadata store format")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet_path = args.input
+        if parquet_path is None:
+            parquet_path = os.path.join(tmp, "embeddings.parquet")
+            start = time.perf_counter()
+            write_synthetic_embeddings(parquet_path, args.chunks)
+            print(f"Generated {args.chunks:,} chunks in {time.perf_counter() - start:.1f}s")
+        rss_before = _peak_rss_mb()
+
+        index_path = os.path.join(tmp, "vector_store", "faiss.index")
+        meta_path = os.path.join(tmp, "vector_store", f"metadata.{args.meta}")
+        start = time.perf_counter()
+        store = ComplaintVectorStore.from_parquet(parquet_path, index_path, meta_path, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+
+        n = store.index.ntotal
+        print("=" * 70)
+        print(f"Chunks indexed:   {n:,}")
+        print(f"Build time:       {elapsed:.1f}s")
+        print(f"Throughput:       {n / elapsed:,.0f} chunks/sec")
+        print(f"Peak RSS:         {_peak_rss_mb():,.0f} MB (before build: {rss_before:,.0f} MB)")
+        print(f"Index size:       {os.path.getsize(index_path) / 1e6:,.0f} MB")
+        print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""
+async_pipeline.py
+
+asyncio front end for RAGPipeline, for serving many users at once.
+
+The llama.cpp model is not thread-safe and generates one answer at a time,
+so concurrent requests must take turns on it; everything else can overlap.
+
+Responsibilities:
+- Run retrieval (embedding + FAISS search) concurrently in a thread pool
+- Queue generation requests FIFO in front of a single worker that owns the
+  model (or one per process of a GeneratorPool), with admission control:
+  beyond ``max_queue`` waiting requests new ones are rejected with
+  QueueFullError instead of piling up
+- Give each client its queue position and an estimated wait while it
+  waits, then the answer (optionally streamed piece by piece) with its
+  latency metrics
+- Answer semantic-cache hits without queueing
+- Stop generations whose client went away, whose deadline passed or whose
+  token budget ran out, so the model moves on to the next request
+
+Public API:
+- QueueFullError
+- GenerationTicket
+- AsyncRAGPipeline
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from .rag_pipeline import RAGPipeline
+from .streaming import CancellationToken, GenerationMetrics, MeteredStream
+
+
+class QueueFullError(RuntimeError):
+    """The generation queue is at capacity; the request was not admitted."""
+
+    def __init__(self, capacity: int, estimated_wait_seconds: Optional[float]):
+        self.capacity = capacity
+        self.estimated_wait_seconds = estimated_wait_seconds
+        wait = f", estimated wait {estimated_wait_seconds:.0f}s" if estimated_wait_seconds is not None else ""
+        super().__init__(f"Generation queue is full ({capacity} requests waiting{wait})")
+
+
+class GenerationTicket:
+    """
+    Handle of one admitted request.
+
+    ``status()`` reports the live queue position; ``events()`` yields
+    ("queued", status) updates while waiting, then ("token", text) pieces
+    when streaming, then ("done", answer); ``await ticket.result()`` gives
+    the answer()-style dict plus ``metrics`` (GenerationMetrics, timed from
+    ``requested_at``).
+    """
+
+    def __init__(self, owner: "AsyncRAGPipeline", question: str, sources: List[Dict[str, Any]],
+                 stream: bool = False, requested_at: Optional[float] = None,
+                 cancellation: Optional[CancellationToken] = None):
+        self.question = question
+        self.sources = sources
+        self.stream = stream
+        self.cancellation = cancellation or CancellationToken()
+        self.requested_at = time.perf_counter() if requested_at is None else requested_at
+        self.metrics: Optional[GenerationMetrics] = None
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._owner = owner
+        self._future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._events: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def done(self) -> bool:
+        return self._future.done()
+
+    @property
+    def started(self) -> bool:
+        return self.started_at is not None
+
+    def status(self) -> Dict[str, Any]:
+        """
+        position: 1-based place among waiting requests (0 once generating);
+        ahead: requests that will be served first, including the one in progress;
+        estimated_wait_seconds: time until generation starts (None before any
+        request has finished and no initial estimate was given).
+        """
+        if self.started or self.done:
+            return {"state": "done" if self.done else "generating", "position": 0, "ahead": 0,
+                    "estimated_wait_seconds": 0.0}
+        position, ahead = self._owner._position(self)
+        return {"state": "queued", "position": position, "ahead": ahead,
+                "estimated_wait_seconds": self._owner._estimate_wait(ahead)}
+
+    async def result(self) -> Dict[str, Any]:
+        return await asyncio.shield(self._future)
+
+    async def events(self, interval: float = 1.0) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Progress of the request. Queue updates are emitted right away and
+        then every ``interval`` seconds while the position changes. A client
+        that stops iterating before the end gives up its place in the queue.
+        """
+        try:
+            last_status = None
+            while True:
+                if not self.started and not self.done:
+                    status = self.status()
+                    if status != last_status:
+                        last_status = status
+                        yield "queued", status
+                    try:
+                        kind, value = await asyncio.wait_for(self._events.get(), timeout=interval)
+                    except asyncio.TimeoutError:
+                        continue
+                else:
+                    kind, value = await self._events.get()
+                if kind == "error":
+                    raise value
+                if kind != "start":
+                    yield kind, value
+                if kind == "done":
+                    return
+        finally:
+            if not self.done:
+                self.cancel()
+
+    def cancel(self) -> bool:
+        """
+        Withdraw a waiting request, or stop one that is generating (within
+        a token). Returns False if the request had already finished.
+        """
+        if self.done:
+            return False
+        if self._owner._withdraw(self):
+            return True
+        self.cancellation.cancel()
+        return True
+
+    # ---------- Called by the worker (on the event loop) ----------
+    def _emit(self, kind: str, value: Any = None) -> None:
+        self._events.put_nowait((kind, value))
+
+    def _finish(self, answer: str, cached: bool = False, metrics: Optional[GenerationMetrics] = None,
+                stop_reason: Optional[str] = None) -> None:
+        self.finished_at = time.monotonic()
+        if metrics is None:
+            # Cached or not streamed: the whole answer arrives at once
+            elapsed = time.perf_counter() - self.requested_at
+            metrics = GenerationMetrics(first_token_seconds=elapsed, total_seconds=elapsed, tokens=1 if cached else 0)
+        if self.started:
+            metrics.queue_seconds = self.started_at - self.enqueued_at
+        metrics.stop_reason = stop_reason
+        self.metrics = metrics
+        if not self._future.done():
+            self._future.set_result({"answer": answer, "sources": self.sources, "cached": cached,
+                                     "metrics": metrics})
+        self._emit("done", answer)
+
+    def _fail(self, error: Exception) -> None:
+        self.finished_at = time.monotonic()
+        if not self._future.done():
+            self._future.set_exception(error)
+            self._future.exception()  # retrieved through events() / result(); silence "never retrieved"
+        self._emit("error", error)
+
+    def _cancel(self, reason: str) -> None:
+        self.finished_at = time.monotonic()
+        self._future.cancel(reason)
+        self._emit("error", asyncio.CancelledError(reason))
+
+
+class AsyncRAGPipeline:
+    """
+    Concurrent, admission-controlled access to a RAGPipeline from asyncio.
+
+    Parameters
+    ----------
+    pipeline : RAGPipeline
+        Loaded (or loading) pipeline whose retriever and generator are used
+    max_queue : int
+        Maximum number of requests waiting for the model (the one being
+        generated is not counted); further requests raise QueueFullError
+    retrieval_workers : int
+        Threads running retrieval concurrently
+    initial_generation_seconds : float, optional
+        Wait-time estimate per request until real timings are available
+    request_timeout : float, optional
+        Default deadline of a request, in seconds from submit(): requests
+        still queued then fail with TimeoutError, generations in progress
+        stop and return the partial answer
+    generation_workers : int
+        Generations run at once. Must stay 1 for an in-process RAGGenerator;
+        set it to the pool size when the generator is a GeneratorPool
+    """
+
+    def __init__(self, pipeline: RAGPipeline, max_queue: int = 8, retrieval_workers: int = 4,
+                 initial_generation_seconds: Optional[float] = None, generation_workers: int = 1,
+                 request_timeout: Optional[float] = None):
+        if max_queue < 1:
+            raise ValueError("max_queue must be at least 1")
+        if generation_workers < 1:
+            raise ValueError("generation_workers must be at least 1")
+        self.generation_workers = generation_workers
+        self.pipeline = pipeline
+        self.max_queue = max_queue
+        self.avg_generation_seconds = initial_generation_seconds
+        self.request_timeout = request_timeout
+        # cancelled: withdrawn or stopped by the client; timed_out: deadline
+        # passed; truncated: answer stopped by its token budget
+        self.stats: Dict[str, int] = {"admitted": 0, "completed": 0, "cached": 0, "rejected": 0,
+                                      "cancelled": 0, "timed_out": 0, "truncated": 0, "failed": 0}
+        self._retrieval = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="retrieval")
+        # The only threads that ever touch the model (one, unless it is a process pool)
+        self._model_thread = ThreadPoolExecutor(max_workers=generation_workers, thread_name_prefix="generation")
+        self._queue: Deque[GenerationTicket] = collections.deque()
+        self._running: List[GenerationTicket] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    # ---------- Public API ----------
+    async def retrieve(self, question: str, k: int = 5,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Top-k chunks, retrieved in the thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._retrieval, self.pipeline.retrieve, question, k, filters)
+
+    async def submit(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                     stream: bool = False, timeout: Optional[float] = None,
+                     max_tokens: Optional[int] = None) -> GenerationTicket:
+        """
+        Retrieve, then queue the question for generation.
+
+        Raises QueueFullError when ``max_queue`` requests are already
+        waiting. Questions answered by the semantic answer cache return a
+        ticket that is already done and take no place in the queue.
+        ``timeout`` (default ``request_timeout``) and ``max_tokens`` bound
+        the request; see CancellationToken.
+        """
+        requested_at = time.perf_counter()
+        cancellation = CancellationToken(timeout=self.request_timeout if timeout is None else timeout,
+                                         max_tokens=max_tokens)
+        sources = await self.retrieve(question, k, filters)
+        ticket = GenerationTicket(self, question, sources, stream=stream, requested_at=requested_at,
+                                  cancellation=cancellation)
+
+        loop = asyncio.get_running_loop()
+        hit = await loop.run_in_executor(self._retrieval, self.pipeline.cached_answer, question, sources)
+        if hit is not None:
+            ticket.sources = hit["sources"]
+            ticket._finish(hit["answer"], cached=True)
+            self.stats["cached"] += 1
+            return ticket
+
+        # Admission is decided after retrieval, against the queue as it is now
+        if len(self._queue) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise QueueFullError(self.max_queue, self._estimate_wait(self._ahead_of_new()))
+        self._queue.append(ticket)
+        self.stats["admitted"] += 1
+        self._ensure_workers()
+        self._wakeup.set()
+        return ticket
+
+    async def answer(self, question: str, k: int = 5,
+                     filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """RAGPipeline.answer() without blocking the event loop."""
+        ticket = await self.submit(question, k, filters)
+        return await ticket.result()
+
+    async def stream(self, question: str, k: int = 5,
+                     filters: Optional[Dict[str, Any]] = None,
+                     interval: float = 1.0, timeout: Optional[float] = None,
+                     max_tokens: Optional[int] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        RAGPipeline.stream() through the queue: ("sources", chunks), then
+        ("queued", status) updates while waiting, ("token", text) pieces and
+        finally ("done", result dict with ``metrics``).
+
+        Raises QueueFullError (before yielding anything) when the queue is
+        full. A client that stops iterating gives up its place in the queue,
+        or stops its generation.
+        """
+        ticket = await self.submit(question, k, filters, stream=True, timeout=timeout, max_tokens=max_tokens)
+        try:
+            yield "sources", ticket.sources
+            async for kind, value in ticket.events(interval=interval):
+                if kind == "done":
+                    result = await ticket.result()
+                    if result["cached"]:
+                        yield "token", value  # nothing was streamed: the answer as a single piece
+                    yield "done", result
+                else:
+                    yield kind, value
+        finally:
+            # Closing this iterator (client gone) must not wait for garbage
+            # collection of events() to free the model
+            if not ticket.done:
+                ticket.cancel()
+
+    def queue_status(self) -> Dict[str, Any]:
+        """Load snapshot for dashboards / health checks."""
+        return {
+            "waiting": len(self._queue),
+            "capacity": self.max_queue,
+            "generating": len(self._running),
+            "avg_generation_seconds": self.avg_generation_seconds,
+            "estimated_wait_seconds": self._estimate_wait(self._ahead_of_new()),
+            **self.stats,
+        }
+
+    async def close(self) -> None:
+        """Stop the workers after the current generations; waiting requests are cancelled."""
+        while self._queue:
+            self._queue.popleft()._cancel("pipeline closed")
+            self.stats["cancelled"] += 1
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._retrieval.shutdown(wait=False)
+        self._model_thread.shutdown(wait=True)
+
+    # ---------- Queue bookkeeping ----------
+    def _ahead_of_new(self) -> int:
+        return len(self._queue) + len(self._running)
+
+    def _position(self, ticket: GenerationTicket) -> Tuple[int, int]:
+        try:
+            position = self._queue.index(ticket) + 1
+        except ValueError:
+            position = 0
+        return position, position - 1 + len(self._running)
+
+    def _estimate_wait(self, ahead: int) -> Optional[float]:
+        if self.avg_generation_seconds is None:
+            return None
+        if ahead < self.generation_workers:
+            return 0.0
+        # Requests start in rounds of generation_workers
+        wait = ((ahead - self.generation_workers) // self.generation_workers + 1) * self.avg_generation_seconds
+        if self._running:
+            # The most advanced request in progress frees its worker first
+            elapsed = time.monotonic() - min(t.started_at for t in self._running)
+            wait -= min(elapsed, self.avg_generation_seconds)
+        return max(wait, 0.0)
+
+    def _withdraw(self, ticket: GenerationTicket) -> bool:
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            return False
+        ticket._cancel("request withdrawn")
+        self.stats["cancelled"] += 1
+        return True
+
+    def _record_generation_time(self, seconds: float) -> None:
+        # Exponential moving average: follows drifts in prompt length / machine load
+        if self.avg_generation_seconds is None:
+            self.avg_generation_seconds = seconds
+        else:
+            self.avg_generation_seconds = 0.8 * self.avg_generation_seconds + 0.2 * seconds
+
+    # ---------- Worker ----------
+    def _ensure_workers(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._workers = [w for w in self._workers if not w.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < self.generation_workers:
+            self._workers.append(loop.create_task(self._run_worker()))
+
+    async def _run_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            ticket = self._queue.popleft()
+            if ticket.cancellation.cancelled:
+                # Deadline passed while waiting: do not spend the model on it
+                self.stats["timed_out"] += 1
+                ticket._fail(TimeoutError("request deadline passed while queued"))
+                continue
+            self._running.append(ticket)
+            ticket.started_at = time.monotonic()
+            ticket._emit("start")
+            try:
+                answer, metrics = await loop.run_in_executor(self._model_thread, self._generate, ticket, loop)
+            except asyncio.CancelledError:
+                ticket._cancel("pipeline closed")
+                raise
+            except Exception as error:
+                self.stats["failed"] += 1
+                ticket._fail(error)
+            else:
+                reason = ticket.cancellation.reason
+                if reason == CancellationToken.CANCELLED:
+                    # Nobody is waiting for the partial answer
+                    self.stats["cancelled"] += 1
+                    ticket._cancel("request cancelled")
+                    continue
+                if reason is None:
+                    self._record_generation_time(time.monotonic() - ticket.started_at)
+                    self.stats["completed"] += 1
+                else:
+                    self.stats["timed_out" if reason == CancellationToken.DEADLINE else "truncated"] += 1
+                ticket._finish(answer, metrics=metrics, stop_reason=reason)
+                if reason is None:
+                    # Not awaited: caching must not hold up the next generation
+                    loop.run_in_executor(self._retrieval, self.pipeline.remember_answer,
+                                         ticket.question, ticket.sources, answer)
+            finally:
+                self._running.remove(ticket)
+
+    def _generate(self, ticket: GenerationTicket,
+                  loop: asyncio.AbstractEventLoop) -> Tuple[str, Optional[GenerationMetrics]]:
+        """Runs on a model thread (which also waits for the model to finish loading)."""
+        generator, cancellation = self.pipeline.generator, ticket.cancellation
+        if not ticket.stream:
+            return generator.generate(ticket.question, ticket.sources, cancellation=cancellation), None
+        # Forward each piece to the event loop as it is produced
+        tokens = MeteredStream(generator.stream(ticket.question, ticket.sources, cancellation=cancellation),
+                               start=ticket.requested_at)
+        for piece in tokens:
+            loop.call_soon_threadsafe(ticket._emit, "token", piece)
+        return tokens.text.strip(), tokens.metrics
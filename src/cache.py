@@ -0,0 +1,443 @@
+"""
+cache.py
+
+In-process caches for the query path.
+
+Responsibilities:
+- Size-bounded LRU cache with hit / miss / eviction counters
+- Cache question embeddings in front of any Embedder, optionally persisted
+  to disk so repeated questions skip the transformer after a restart
+- Cache generated answers by question embedding, so a rephrased question
+  that retrieves the same chunks skips the LLM
+- Keep the llama.cpp state after the static prompt prefix (persisted to
+  disk), so each generation only evaluates its question-specific tokens
+
+Public API:
+- CacheStats
+- LRUCache
+- normalize_question(...)
+- CachedEmbedder
+- SemanticAnswerCache
+- PromptPrefixCache
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class CacheStats:
+    """Counters used to size a cache."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache:
+    """
+    Thread-safe dict with least-recently-used eviction beyond ``max_size`` entries.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Value for ``key`` (marking it most recently used), counting a hit or miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.stats.hits += 1
+                return self._data[key]
+            self.stats.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def items(self) -> List[tuple]:
+        """Snapshot of (key, value) pairs, least recently used first."""
+        with self._lock:
+            return list(self._data.items())
+
+
+# ----------------------------
+# Question embedding cache
+# ----------------------------
+
+def normalize_question(question: str) -> str:
+    """
+    Cache key for a question: lower-cased with whitespace collapsed.
+
+    all-MiniLM-L6-v2 uses an uncased tokenizer that also ignores whitespace
+    runs, so questions with the same key have identical embeddings.
+    """
+    return " ".join(question.lower().split())
+
+
+class CachedEmbedder:
+    """
+    Embedder wrapper that caches vectors by normalised question.
+
+    Parameters
+    ----------
+    embedder : Embedder
+        Wrapped embedder (encode, and optionally encode_batch)
+    max_size : int
+        Maximum number of cached questions (LRU eviction)
+    persist_path : str, optional
+        ``.npz`` file loaded at start-up and written by save() and at exit
+    """
+
+    def __init__(self, embedder: Any, max_size: int = 1024, persist_path: Optional[str] = None):
+        self.embedder = embedder
+        self.cache = LRUCache(max_size)
+        self.persist_path = persist_path
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def encode(self, text: str) -> np.ndarray:
+        key = normalize_question(text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = np.asarray(self.embedder.encode(text), dtype="float32")
+            embedding.setflags(write=False)  # shared between callers
+            self.cache.put(key, embedding)
+        return embedding
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode only the texts that are not cached, in one batch."""
+        keys = [normalize_question(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            embedding = self.cache.get(key)
+            if embedding is None:
+                missing[key] = text
+            else:
+                found[key] = embedding
+
+        if missing:
+            encode_batch = getattr(self.embedder, "encode_batch", None)
+            if encode_batch is not None:
+                encoded = np.asarray(encode_batch(list(missing.values())), dtype="float32")
+            else:
+                encoded = np.vstack([self.embedder.encode(t) for t in missing.values()]).astype("float32")
+            for key, embedding in zip(missing, encoded):
+                embedding = embedding.copy()
+                embedding.setflags(write=False)
+                self.cache.put(key, embedding)
+                found[key] = embedding
+        return np.vstack([found[key] for key in keys])
+
+    # ---------- Persistence ----------
+    def save(self) -> None:
+        """Write the cached embeddings to ``persist_path`` (atomically)."""
+        if not self.persist_path:
+            return
+        items = self.cache.items()
+        keys = np.array([key for key, _ in items], dtype=str)
+        vectors = np.vstack([v for _, v in items]) if items else np.empty((0, 0), dtype="float32")
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        tmp_path = f"{self.persist_path}.tmp.npz"
+        np.savez(tmp_path, keys=keys, vectors=vectors)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self) -> int:
+        """Load embeddings saved by save(); returns how many were loaded."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return 0
+        with np.load(self.persist_path) as data:
+            keys, vectors = data["keys"], data["vectors"]
+        # Saved least recently used first, so the recency order is restored
+        for key, vector in zip(keys.tolist(), vectors):
+            vector.setflags(write=False)
+            self.cache.put(key, vector)
+        return len(keys)
+
+
+# ----------------------------
+# Semantic answer cache
+# ----------------------------
+
+def chunk_set_key(chunks: List[Dict[str, Any]]) -> FrozenSet[Tuple[Any, Any, str]]:
+    """Order-independent identity of a retrieval result."""
+    return frozenset(
+        (chunk.get("metadata", {}).get("complaint_id"), chunk.get("metadata", {}).get("chunk_index"),
+         chunk.get("text", ""))
+        for chunk in chunks
+    )
+
+
+@dataclass
+class _AnswerEntry:
+    embedding: np.ndarray
+    chunk_key: FrozenSet[Tuple[Any, Any, str]]
+    answer: str
+    sources: List[Dict[str, Any]]
+    created: float
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by question embedding.
+
+    A lookup hits when a cached question is within ``threshold`` cosine
+    similarity of the new one *and* its retrieval returned the same chunk
+    set, so the cached answer was generated from the same evidence.
+    Entries expire after ``ttl_seconds`` and the least recently used are
+    evicted beyond ``max_size``. Everything is dropped when the vector store
+    ``version`` passed to lookup / store changes.
+
+    Parameters
+    ----------
+    threshold : float
+        Minimum cosine similarity between question embeddings
+    max_size : int
+        Maximum number of cached answers
+    ttl_seconds : float, optional
+        Entry lifetime (None: no expiry)
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 256, ttl_seconds: Optional[float] = 3600.0):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.cache = LRUCache(max_size)
+        self._version: Any = None
+        self._next_key = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def _check_version(self, version: Any) -> None:
+        if version != self._version:
+            self.cache.clear()
+            self._version = version
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def lookup(self, embedding: np.ndarray, chunks: List[Dict[str, Any]],
+               version: Any = None) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """(answer, sources) of a matching entry, or None."""
+        self._check_version(version)
+        now = time.monotonic()
+        entries = []
+        for key, entry in self.cache.items():
+            if self.ttl_seconds is not None and now - entry.created > self.ttl_seconds:
+                self.cache.pop(key)
+            else:
+                entries.append((key, entry))
+
+        if entries:
+            similarities = np.stack([e.embedding for _, e in entries]) @ self._unit(embedding)
+            chunk_key = chunk_set_key(chunks)
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.threshold:
+                    break
+                key, entry = entries[i]
+                if entry.chunk_key == chunk_key:
+                    self.cache.get(key)  # counts the hit, refreshes recency
+                    return entry.answer, entry.sources
+        self.cache.stats.misses += 1
+        return None
+
+    def store(self, embedding: np.ndarray, chunks: List[Dict[str, Any]], answer: str,
+              version: Any = None) -> None:
+        self._check_version(version)
+        self._next_key += 1
+        self.cache.put(self._next_key, _AnswerEntry(
+            embedding=self._unit(embedding),
+            chunk_key=chunk_set_key(chunks),
+            answer=answer,
+            sources=list(chunks),
+            created=time.monotonic(),
+        ))
+
+
+# ----------------------------
+# LLM prompt-prefix state cache
+# ----------------------------
+
+class PromptPrefixCache:
+    """
+    llama.cpp state (KV cache) after evaluating the prompt prefix that every
+    request shares, restored before each completion so llama.cpp's prefix
+    matching skips those tokens.
+
+    Parameters
+    ----------
+    model : llama_cpp.Llama
+        Model whose state is cached
+    prefix : str
+        Static start of every prompt
+    persist_path : str, optional
+        ``.npz`` file with the saved state: reused at start-up when its
+        fingerprint matches, (re)written after evaluating the prefix
+    fingerprint : str
+        Identifies the model file and context settings; combined with the
+        prefix tokens to decide whether a saved state is still valid
+
+    Attributes
+    ----------
+    stats : CacheStats
+        hits: the KV cache already started with the prefix;
+        misses: the saved state had to be loaded back
+    source : str
+        "disk" or "evaluated": where the state came from at start-up
+    """
+
+    def __init__(self, model: Any, prefix: str, persist_path: Optional[str] = None, fingerprint: str = ""):
+        self.model = model
+        self.prefix = prefix
+        self.persist_path = persist_path
+        # Tokenised the way create_completion() tokenises a prompt
+        self.tokens: List[int] = list(model.tokenize(prefix.encode("utf-8"), add_bos=True, special=True))
+        digest = hashlib.blake2b(fingerprint.encode("utf-8"), digest_size=16)
+        digest.update(np.asarray(self.tokens, dtype=np.int64).tobytes())
+        self.fingerprint = digest.hexdigest()
+        self.stats = CacheStats()
+        self.state: Any = None
+        self.source: Optional[str] = None
+        if self.tokens:
+            self.warm()
+
+    def warm(self) -> None:
+        """Load the prefix state from disk, or evaluate the prefix and save it."""
+        self.state = self.load()
+        if self.state is not None:
+            self.source = "disk"
+            return
+        self.model.reset()
+        self.model.eval(self.tokens)
+        self.state = self.model.save_state()
+        self.source = "evaluated"
+        self.save()
+
+    def restore(self) -> None:
+        """Make the model's KV cache start with the prefix (call before a completion)."""
+        if self.state is None:
+            return
+        n = len(self.tokens)
+        if self.model.n_tokens >= n and np.array_equal(self.model.input_ids[:n], self.tokens):
+            self.stats.hits += 1
+            return
+        self.model.load_state(self.state)
+        self.stats.misses += 1
+
+    # ---------- Persistence ----------
+    def save(self) -> None:
+        """
+        Write the state to ``persist_path`` (atomically); failures only warn.
+
+        Pool workers warm the same prefix at the same time: each writes its
+        own temporary file, and a worker finding a valid state already saved
+        skips the write.
+        """
+        if not self.persist_path or self.state is None or self._saved_fingerprint() == self.fingerprint:
+            return
+        state = self.state
+        directory, name = os.path.split(os.path.abspath(self.persist_path))
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    fingerprint=np.array(self.fingerprint),
+                    input_ids=state.input_ids,
+                    scores=state.scores,
+                    n_tokens=np.array(state.n_tokens),
+                    llama_state=np.frombuffer(state.llama_state, dtype=np.uint8),
+                    seed=np.array(state.seed),
+                )
+            os.replace(tmp_path, self.persist_path)
+        except OSError as error:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            warnings.warn(f"Could not save the prompt prefix state to {self.persist_path}: {error}")
+
+    def _saved_fingerprint(self) -> Optional[str]:
+        """Fingerprint of the state in ``persist_path`` (only that entry is read), or None."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return None
+        try:
+            with np.load(self.persist_path) as data:
+                return str(data["fingerprint"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load(self) -> Any:
+        """State saved by save() for the same fingerprint, or None."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return None
+        try:
+            with np.load(self.persist_path) as data:
+                if str(data["fingerprint"]) != self.fingerprint:
+                    return None
+                fields = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError):
+            return None  # unreadable: evaluate the prefix again
+
+        from llama_cpp.llama import LlamaState
+        llama_state = fields["llama_state"].tobytes()
+        return LlamaState(
+            input_ids=fields["input_ids"],
+            scores=fields["scores"],
+            n_tokens=int(fields["n_tokens"]),
+            llama_state=llama_state,
+            llama_state_size=len(llama_state),
+            seed=int(fields["seed"]),
+        )
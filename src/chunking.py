@@ -0,0 +1,241 @@
+"""
+chunking.py
+
+Production chunking stage: splits preprocessed complaint narratives into
+overlapping chunks on all cores and writes them as columnar batches.
+
+Responsibilities:
+- Stream the preprocessed dataset in row batches (data_loader.stream_batches)
+- Split narratives with the 500/100 RecursiveCharacterTextSplitter selected in
+  notebooks/chunking_and_embedding.ipynb
+- Attach the metadata struct ComplaintVectorStore.from_parquet reads, plus
+  chunk_index / total_chunks and character offsets
+- Emit Arrow record batches (or a Parquet file) instead of a list of dicts
+
+Public API:
+- chunk_record_batch(...)
+- chunk_batches(...)
+- chunk_file(...)
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .data_loader import stream_batches
+from .parallel import WorkerThroughput, ordered_map, print_worker_throughput
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+TEXT_COLUMN = "Consumer complaint narrative"
+
+# metadata field -> column of the preprocessed complaints dataset
+METADATA_COLUMNS: Dict[str, str] = {
+    "complaint_id": "Complaint ID",
+    "product_category": "Product_category",
+    "product": "Product",
+    "issue": "Issue",
+    "sub_issue": "Sub-issue",
+    "company": "Company",
+    "state": "State",
+    "date_received": "Date received",
+}
+
+METADATA_TYPE = pa.struct(
+    [(field, pa.string()) for field in METADATA_COLUMNS]
+    + [("chunk_index", pa.int32()), ("total_chunks", pa.int32())]
+)
+
+CHUNK_SCHEMA = pa.schema([
+    ("chunk_text", pa.string()),
+    ("metadata", METADATA_TYPE),
+    ("start_char", pa.int32()),
+    ("end_char", pa.int32()),
+])
+
+
+# ----------------------------
+# Splitting
+# ----------------------------
+
+def build_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> RecursiveCharacterTextSplitter:
+    """Splitter with the configuration chosen in the chunking notebook."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+
+def split_with_offsets(splitter: RecursiveCharacterTextSplitter, text: str) -> List[Tuple[str, int, int]]:
+    """Split text and locate each chunk in it; returns (chunk, start_char, end_char)."""
+    spans = []
+    search_from = 0
+    for chunk in splitter.split_text(text):
+        # Chunks are (stripped) substrings in order, so each one starts after the previous start
+        start = text.find(chunk, search_from)
+        if start == -1:
+            start = text.find(chunk)
+        spans.append((chunk, start, start + len(chunk)))
+        search_from = start + 1
+    return spans
+
+
+def _as_str(value) -> str:
+    if value is None or value != value:  # None or NaN
+        return "N/A"
+    return str(value)
+
+
+def chunk_record_batch(
+    batch: pa.RecordBatch,
+    splitter: RecursiveCharacterTextSplitter,
+    text_column: str = TEXT_COLUMN,
+    metadata_columns: Dict[str, str] = METADATA_COLUMNS,
+) -> pa.RecordBatch:
+    """
+    Chunk one batch of complaints into a batch following CHUNK_SCHEMA.
+
+    Empty narratives are skipped; metadata columns missing from the batch are
+    filled with "N/A", the same default from_parquet uses.
+    """
+    if text_column not in batch.schema.names:
+        raise ValueError(f"Column '{text_column}' not found in batch.")
+
+    texts = batch.column(text_column).to_pylist()
+    source = {
+        field: batch.column(column).to_pylist() if column in batch.schema.names else None
+        for field, column in metadata_columns.items()
+    }
+
+    chunk_texts: List[str] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    meta_values: Dict[str, List] = {field: [] for field in METADATA_TYPE.names}
+
+    for row, text in enumerate(texts):
+        if text is None or not str(text).strip():
+            continue
+        spans = split_with_offsets(splitter, str(text))
+        row_meta = {
+            field: _as_str(values[row]) if values is not None else "N/A"
+            for field, values in source.items()
+        }
+        for chunk_index, (chunk, start, end) in enumerate(spans):
+            chunk_texts.append(chunk)
+            starts.append(start)
+            ends.append(end)
+            for field, value in row_meta.items():
+                meta_values[field].append(value)
+            meta_values["chunk_index"].append(chunk_index)
+            meta_values["total_chunks"].append(len(spans))
+
+    metadata = pa.StructArray.from_arrays(
+        [pa.array(meta_values[f.name], type=f.type) for f in METADATA_TYPE],
+        fields=list(METADATA_TYPE),
+    )
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(chunk_texts, type=pa.string()),
+            metadata,
+            pa.array(starts, type=pa.int32()),
+            pa.array(ends, type=pa.int32()),
+        ],
+        schema=CHUNK_SCHEMA,
+    )
+
+
+# ----------------------------
+# Multi-process stage
+# ----------------------------
+
+# Per-process splitter, built once by the pool initializer
+_worker_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def _init_worker(chunk_size: int, chunk_overlap: int) -> None:
+    global _worker_splitter
+    _worker_splitter = build_splitter(chunk_size, chunk_overlap)
+
+
+def _chunk_batch(batch: pa.RecordBatch, text_column: str, metadata_columns: Dict[str, str]):
+    start = time.perf_counter()
+    chunks = chunk_record_batch(batch, _worker_splitter, text_column, metadata_columns)
+    return os.getpid(), batch.num_rows, chunks, time.perf_counter() - start
+
+
+def chunk_batches(
+    batches: Iterable[pa.RecordBatch],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    text_column: str = TEXT_COLUMN,
+    metadata_columns: Dict[str, str] = METADATA_COLUMNS,
+    n_workers: Optional[int] = None,
+    stats: Optional[Dict[int, WorkerThroughput]] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Chunk a stream of complaint batches on a process pool.
+
+    Chunk batches are yielded in input order, with at most ``2 * n_workers``
+    batches in flight. Pass a dict as ``stats`` to collect per-worker
+    throughput (complaints in, chunks out).
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    stats = stats if stats is not None else {}
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(chunk_size, chunk_overlap)) as pool:
+        results = ordered_map(pool, _chunk_batch, batches, 2 * n_workers, text_column, metadata_columns)
+        for pid, rows_in, chunks, seconds in results:
+            stats.setdefault(pid, WorkerThroughput(pid=pid)).record(rows_in, chunks.num_rows, seconds)
+            yield chunks
+
+
+def chunk_file(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    text_column: str = TEXT_COLUMN,
+    metadata_columns: Dict[str, str] = METADATA_COLUMNS,
+    batch_size: int = 10_000,
+    n_workers: Optional[int] = None,
+    verbose: bool = True,
+    column_types: Optional[Dict[str, pa.DataType]] = None,
+) -> Dict[int, WorkerThroughput]:
+    """
+    Chunk a preprocessed complaints file (CSV / JSON-lines / Parquet) into a
+    Parquet file of chunks. Only the narrative and metadata columns are read;
+    CSV columns are read as strings unless typed in ``column_types``.
+
+    Returns:
+        Throughput counters per worker process id.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Only project columns that exist, so optional metadata can be absent
+    first = next(stream_batches(input_path, batch_size=1, column_types=column_types), None)
+    schema_names = first.schema.names if first is not None else []
+    columns = [text_column] + [c for c in metadata_columns.values() if c in schema_names]
+
+    stats: Dict[int, WorkerThroughput] = {}
+    start = time.perf_counter()
+    with pq.ParquetWriter(output_path, CHUNK_SCHEMA, compression="zstd") as writer:
+        batches = stream_batches(input_path, columns=columns, batch_size=batch_size,
+                                 column_types=column_types)
+        for chunks in chunk_batches(batches, chunk_size, chunk_overlap, text_column,
+                                    metadata_columns, n_workers, stats):
+            writer.write_batch(chunks)
+
+    if verbose:
+        print_worker_throughput(f"CHUNKING COMPLETED ({chunk_size}/{chunk_overlap})",
+                                stats, time.perf_counter() - start)
+    return stats
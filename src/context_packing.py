@@ -0,0 +1,170 @@
+"""
+context_packing.py
+
+Fit retrieved chunks into the LLM's context window, measured in tokens.
+
+Adjacent chunks of one complaint share CHUNK_OVERLAP characters and every
+excerpt repeats its metadata header, so joining k raw chunks wastes prompt
+tokens (prompt evaluation dominates CPU time to first token) and can
+overflow n_ctx for larger k.
+
+Responsibilities:
+- Group chunks by complaint and merge them in chunk order, removing the
+  text that consecutive chunks share
+- Hoist header fields shared by every excerpt into a single line
+- Add chunks in retrieval (score) order while the context fits a token
+  budget counted with the model's own tokenizer
+
+Public API:
+- merge_overlapping(...)
+- PackedContext
+- pack_context(...)
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Header fields shown for every excerpt
+HEADER_FIELDS: Tuple[Tuple[str, str], ...] = (("company", "Company"), ("issue", "Issue"))
+# Shorter suffix/prefix matches between chunks are treated as coincidence
+MIN_OVERLAP = 10
+# Longest shared text searched for (chunking.CHUNK_OVERLAP plus slack for stripped whitespace)
+MAX_OVERLAP = 200
+GAP = " [...] "
+_UNKNOWN = (None, "", "N/A", "nan")
+
+
+def merge_overlapping(left: str, right: str, max_overlap: int = MAX_OVERLAP,
+                      min_overlap: int = MIN_OVERLAP) -> str:
+    """Join two consecutive chunks, dropping the start of ``right`` that repeats the end of ``left``."""
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    # No shared text found: the splitter cut at a separator
+    return f"{left} {right}"
+
+
+@dataclass
+class PackedContext:
+    """Packed context text and what went into it."""
+
+    text: str
+    tokens: int
+    included: List[int] = field(default_factory=list)  # positions in retrieved_chunks
+    dropped: List[int] = field(default_factory=list)
+
+
+def _complaint_key(position: int, meta: Dict[str, Any]) -> Any:
+    complaint_id = meta.get("complaint_id")
+    return position if complaint_id in _UNKNOWN else str(complaint_id)
+
+
+def _chunk_index(meta: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(meta.get("chunk_index"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _section_text(chunks: List[Dict[str, Any]]) -> str:
+    """One complaint's chunks in document order, overlaps removed."""
+    ordered = sorted(chunks, key=lambda c: (_chunk_index(c.get("metadata", {})) is None,
+                                            _chunk_index(c.get("metadata", {})) or 0))
+    text = ordered[0].get("text", "")
+    previous = _chunk_index(ordered[0].get("metadata", {}))
+    for chunk in ordered[1:]:
+        index = _chunk_index(chunk.get("metadata", {}))
+        if index is not None and previous is not None and index == previous + 1:
+            text = merge_overlapping(text, chunk.get("text", ""))
+        else:
+            text = f"{text}{GAP}{chunk.get('text', '')}"
+        previous = index
+    return text
+
+
+def _render(sections: List[List[Dict[str, Any]]]) -> str:
+    headers = [
+        {name: chunks[0].get("metadata", {}).get(key) for key, name in HEADER_FIELDS}
+        for chunks in sections
+    ]
+    # Fields identical in every excerpt are stated once
+    shared = [name for _, name in HEADER_FIELDS
+              if len(sections) > 1 and len({str(h[name]) for h in headers}) == 1]
+
+    parts = []
+    if shared:
+        parts.append("All excerpts: " + " | ".join(f"{name}: {headers[0][name]}" for name in shared))
+    for i, (chunks, header) in enumerate(zip(sections, headers), 1):
+        fields = [f"{name}: {value}" for name, value in header.items() if name not in shared]
+        title = f"[Excerpt {i}] " + " | ".join(fields) if fields else f"[Excerpt {i}]"
+        parts.append(f"{title}\n{_section_text(chunks)}")
+    return "\n\n".join(parts)
+
+
+def _truncate_to_fit(chunk: Dict[str, Any], count_tokens: Callable[[str], int], budget: int) -> Optional[Dict[str, Any]]:
+    """Longest word prefix of ``chunk`` whose rendered excerpt fits ``budget`` tokens."""
+    words = chunk.get("text", "").split()
+    low, high = 0, len(words)
+    while low < high:  # binary search on the number of words kept
+        middle = (low + high + 1) // 2
+        candidate = dict(chunk, text=" ".join(words[:middle]) + " [...]")
+        if count_tokens(_render([[candidate]])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return dict(chunk, text=" ".join(words[:low]) + " [...]") if low else None
+
+
+def pack_context(retrieved_chunks: List[Dict[str, Any]], count_tokens: Callable[[str], int],
+                 budget: Optional[int] = None) -> PackedContext:
+    """
+    Build the prompt context from retrieved chunks within a token budget.
+
+    Chunks are taken in the order given (the retriever's score order); a
+    chunk that would exceed the budget is skipped so smaller, lower-ranked
+    ones can still fill the remaining space. Chunks of the same complaint
+    share one excerpt. If not even the best chunk fits, its first words are
+    kept.
+
+    Parameters
+    ----------
+    retrieved_chunks : list of dict
+        Retrieval results (text, metadata)
+    count_tokens : callable
+        Number of tokens of a string (the generator model's tokenizer)
+    budget : int, optional
+        Maximum context tokens (None: no limit)
+
+    Returns
+    -------
+    PackedContext
+    """
+    sections: Dict[Any, List[Dict[str, Any]]] = {}  # insertion order = best rank first
+    included: List[int] = []
+    dropped: List[int] = []
+    text, tokens = "", 0
+
+    for position, chunk in enumerate(retrieved_chunks):
+        key = _complaint_key(position, chunk.get("metadata", {}))
+        candidate = {k: list(v) for k, v in sections.items()}
+        candidate.setdefault(key, []).append(chunk)
+        candidate_text = _render(list(candidate.values()))
+        candidate_tokens = count_tokens(candidate_text) if budget is not None else 0
+        if budget is None or candidate_tokens <= budget:
+            sections, text, tokens = candidate, candidate_text, candidate_tokens
+            included.append(position)
+        else:
+            dropped.append(position)
+
+    if not included and retrieved_chunks and budget is not None:
+        truncated = _truncate_to_fit(retrieved_chunks[0], count_tokens, budget)
+        if truncated is not None:
+            text = _render([[truncated]])
+            tokens = count_tokens(text)
+            included, dropped = [0], dropped[1:]
+
+    if budget is None and text:
+        tokens = count_tokens(text)
+    return PackedContext(text=text, tokens=tokens, included=included, dropped=dropped)
@@ -1,11 +1,21 @@
 """
 Data loading utilities for various file formats.
 Supports CSV, Excel, JSON, and plain text files.
+
+For files too large to load at once, stream_batches() yields column-projected
+Arrow record batches from CSV, JSON-lines and Parquet (single files or
+partitioned datasets), and write_partitioned_parquet() saves data as
+zstd-compressed Parquet partitioned by product category.
 """
 
+import itertools
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.json as pa_json
 from pathlib import Path
-from typing import Union, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Union, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -83,3 +93,224 @@ def load_data(file_path: Union[str, Path]) -> Union[pd.DataFrame, str]:
         raise ValueError(f"Failed to decode file '{file_path}'. Try specifying encoding.") from e
     except Exception as e:
         raise ValueError(f"Failed to load file '{file_path}': {e}") from e
+
+
+def _rebatch(batches: Iterable[pa.RecordBatch], batch_size: int) -> Iterator[pa.RecordBatch]:
+    """Re-slice a stream of record batches into batches of exactly batch_size rows (last may be short)."""
+    pending: List[pa.RecordBatch] = []
+    pending_rows = 0
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= batch_size:
+            table = pa.Table.from_batches(pending)
+            yield from table.slice(0, batch_size).combine_chunks().to_batches()
+            rest = table.slice(batch_size)
+            pending, pending_rows = rest.to_batches(), rest.num_rows
+    if pending_rows:
+        yield from pa.Table.from_batches(pending).combine_chunks().to_batches()
+
+
+def _filters_to_expression(filters: Dict[str, Any]) -> "ds.Expression":
+    expression = None
+    for column, value in filters.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        condition = ds.field(column).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _fill_null_types(schema: pa.Schema, names: Optional[List[str]] = None,
+                     column_types: Optional[Dict[str, pa.DataType]] = None) -> pa.Schema:
+    """
+    Schema for the columns ``names`` (default: all of ``schema``) in which
+    types inferred as null (a column empty in the sampled rows) or missing
+    become strings, and ``column_types`` overrides the rest.
+    """
+    column_types = column_types or {}
+    fields = []
+    for name in (names if names is not None else schema.names):
+        if name in column_types:
+            fields.append(pa.field(name, column_types[name]))
+        elif name in schema.names and not pa.types.is_null(schema.field(name).type):
+            fields.append(schema.field(name))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def stream_batches(
+    file_path: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    batch_size: int = 65_536,
+    filters: Optional[Dict[str, Any]] = None,
+    column_types: Optional[Dict[str, pa.DataType]] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream a CSV, JSON-lines or Parquet source as Arrow record batches.
+
+    Only the requested columns are decoded, and at most a few batches are held
+    in memory at a time, so files larger than RAM can be processed.
+
+    Args:
+        file_path: Path to a .csv, .json / .jsonl (line-delimited) or .parquet
+            file, or to a directory holding a (hive-partitioned) Parquet dataset
+            such as the one written by write_partitioned_parquet().
+        columns: Columns to read. None reads all columns.
+        batch_size: Maximum number of rows per yielded batch.
+        filters: Parquet only. Mapping of column -> value or list of values;
+            partitions and row groups that cannot match are skipped.
+        column_types: Arrow types of columns to convert. Arrow otherwise fixes
+            types from the first block and fails on later rows that do not fit
+            (a sparse column inferred as null) or loses data (leading zeros of
+            ZIP codes inferred as integers). Other CSV columns are read as
+            (nullable) strings; other JSON-lines fields keep their first-block
+            type, except that fields null or absent there are read as strings.
+            JSON fields absent from the first block are only read when listed
+            in ``columns``.
+
+    Yields:
+        pyarrow.RecordBatch objects; call .to_pandas() for a DataFrame.
+
+    Raises:
+        FileNotFoundError: If the path doesn't exist.
+        ValueError: If the file type is unsupported.
+
+    Examples:
+        >>> for batch in stream_batches("complaints.csv", columns=["Complaint ID", "Product"]):
+        ...     df = batch.to_pandas()
+        >>> batches = stream_batches("data/partitioned", filters={"Product_category": "Credit card"})
+    """
+    file_path = Path(file_path)
+
+    if not file_path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    file_ext = "parquet" if file_path.is_dir() else file_path.suffix.lower().lstrip('.')
+
+    if filters and file_ext != "parquet":
+        raise ValueError("filters are only supported for Parquet sources")
+
+    if file_ext == "parquet":
+        logger.info(f"Streaming Parquet data: {file_path}")
+        dataset = ds.dataset(file_path, format="parquet", partitioning="hive")
+        scanner = dataset.scanner(
+            columns=columns,
+            filter=_filters_to_expression(filters) if filters else None,
+            batch_size=batch_size,
+        )
+        yield from _rebatch(scanner.to_batches(), batch_size)
+
+    elif file_ext == "csv":
+        logger.info(f"Streaming CSV file: {file_path}")
+        # Complaint narratives contain quoted line breaks
+        parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+        names = columns if columns is not None else pa_csv.open_csv(file_path, parse_options=parse_options).schema.names
+        types = {name: pa.string() for name in names}
+        types.update(column_types or {})
+        reader = pa_csv.open_csv(
+            file_path,
+            parse_options=parse_options,
+            # Empty cells become nulls, as with pandas.read_csv
+            convert_options=pa_csv.ConvertOptions(include_columns=columns, column_types=types,
+                                                  strings_can_be_null=True),
+        )
+        yield from _rebatch(reader, batch_size)
+
+    elif file_ext in ("json", "jsonl"):
+        logger.info(f"Streaming JSON-lines file: {file_path}")
+        try:
+            sampled = pa_json.open_json(file_path).schema
+            # Fields are projected and typed while parsing; other fields are skipped
+            reader = pa_json.open_json(file_path, parse_options=pa_json.ParseOptions(
+                explicit_schema=_fill_null_types(sampled, columns, column_types),
+                unexpected_field_behavior="ignore",
+            ))
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Failed to stream '{file_path}': only line-delimited JSON can be streamed ({e})") from e
+        yield from _rebatch(reader, batch_size)
+
+    else:
+        supported_formats = ["csv", "json", "jsonl", "parquet"]
+        raise ValueError(
+            f"Unsupported file type for streaming: .{file_ext}. "
+            f"Supported formats: {', '.join(supported_formats)}"
+        )
+
+
+def write_partitioned_parquet(
+    data: Union[pd.DataFrame, pa.Table, Iterable[Union[pd.DataFrame, pa.RecordBatch]]],
+    output_dir: Union[str, Path],
+    partition_col: str = "Product_category",
+    compression: str = "zstd",
+    column_types: Optional[Dict[str, pa.DataType]] = None,
+) -> Path:
+    """
+    Write data as a zstd-compressed Parquet dataset partitioned by product category.
+
+    Each category ends up in its own hive-style directory
+    (``output_dir/Product_category=Credit%20card/part-0.parquet``), so readers can
+    use stream_batches(output_dir, filters=...) to skip other categories.
+
+    Args:
+        data: A DataFrame, an Arrow table, or an iterable of DataFrames /
+            record batches (e.g. the output of stream_batches) sharing one schema.
+        output_dir: Dataset root directory. Existing files with the same names
+            are overwritten.
+        partition_col: Top-level column to partition by.
+        compression: Parquet compression codec.
+        column_types: Arrow types of columns whose type should not come from
+            the first batch. Columns that are all-null in the first batch
+            are written as strings, so later batches with values still fit.
+
+    Returns:
+        The dataset root directory.
+
+    Raises:
+        ValueError: If partition_col is not a column of the data.
+    """
+    output_dir = Path(output_dir)
+
+    if isinstance(data, pd.DataFrame):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+
+    if isinstance(data, pa.Table):
+        schema = _fill_null_types(data.schema, column_types=column_types)
+        batches = iter(data.cast(schema).to_batches())
+    else:
+        items = iter(data)
+        first = next(items, None)
+        if first is None:
+            raise ValueError("No data to write")
+        if isinstance(first, pd.DataFrame):
+            first = pa.RecordBatch.from_pandas(first, preserve_index=False)
+        schema = _fill_null_types(first.schema, column_types=column_types)
+
+        def as_batches():
+            for item in itertools.chain([first], items):
+                if isinstance(item, pd.DataFrame):
+                    # Reuse the writer schema so per-batch type inference cannot drift
+                    item = pa.RecordBatch.from_pandas(item, schema=schema, preserve_index=False)
+                elif item.schema != schema:
+                    item = item.cast(schema)
+                yield item
+
+        batches = as_batches()
+
+    if partition_col not in schema.names:
+        raise ValueError(f"Partition column '{partition_col}' not found in data.")
+
+    logger.info(f"Writing partitioned Parquet dataset: {output_dir}")
+    ds.write_dataset(
+        batches,
+        output_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=[partition_col],
+        partitioning_flavor="hive",
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return output_dir
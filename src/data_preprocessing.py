@@ -1,9 +1,112 @@
 # data_preprocessing.py
 
-import pandas as pd
+import hashlib
+import json
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
 from nltk.stem import WordNetLemmatizer
-from .data_loader import load_data
+from .data_loader import load_data, stream_batches
+from .parallel import WorkerThroughput, ordered_map, print_worker_throughput
+
+# Patterns used by the cleaning steps, compiled once at import time
+EMAIL_PATTERN = re.compile(r"\S+@\S+\.\S+")
+PHONE_PATTERN = re.compile(r"(\+?\d{1,2}\s?)?(\(?\d{3}\)?[\s.-]?)?\d{3}[\s.-]?\d{4}")
+SPECIAL_CHARS_PATTERN = re.compile(r"[^a-zA-Z0-9\s\.?]")
+# Every phone match starts with '+', '(' or a digit; the lookahead lets the
+# regex engine skip all other start positions without changing the matches.
+FAST_PHONE_PATTERN = re.compile(r"(?=[+(\d])" + PHONE_PATTERN.pattern)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Replacing every disallowed character with a space and then collapsing
+# whitespace runs is the same as collapsing each run of disallowed or
+# whitespace characters into a single space.
+NON_TEXT_RUN_PATTERN = re.compile(r"[^a-zA-Z0-9\.?]+")
+
+
+class TokenTransform:
+    """
+    Memoized per-token stopword removal, lemmatization and placeholder removal.
+
+    Every distinct token is mapped once to its final form ("" when the token is
+    dropped); after that each occurrence costs a single dict lookup. Complaint
+    text reuses a small vocabulary, so the table stays far smaller than the
+    corpus. It can be bounded with ``max_size`` (oldest entries are evicted
+    first) and saved / loaded between runs.
+
+    Because no placeholder contains whitespace, stripping placeholders token by
+    token gives the same result as stripping them from the joined text.
+    """
+
+    def __init__(
+        self,
+        stop_words: Iterable[str],
+        lemmatize: Callable[[str], str],
+        placeholders: Iterable[str] = (),
+        max_size: Optional[int] = None,
+    ):
+        self.stop_words = frozenset(stop_words)
+        self.lemmatize = lemmatize
+        self.placeholders = list(placeholders)
+        self.max_size = max_size
+        self.table: Dict[str, str] = {}
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the stopword / placeholder configuration a saved table belongs to."""
+        payload = json.dumps([sorted(self.stop_words), self.placeholders])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _resolve(self, token: str) -> str:
+        if token in self.stop_words:
+            result = ""
+        else:
+            result = self.lemmatize(token)
+            for ph in self.placeholders:
+                result = result.replace(ph, "")
+            result = " ".join(result.split())
+
+        if self.max_size is not None and len(self.table) >= self.max_size:
+            del self.table[next(iter(self.table))]
+        self.table[token] = result
+        return result
+
+    def transform(self, text: str) -> str:
+        """Apply the transform to every whitespace-separated token of text."""
+        table = self.table
+        resolve = self._resolve
+        out = []
+        for token in text.split():
+            result = table.get(token)
+            if result is None:
+                result = resolve(token)
+            if result:
+                out.append(result)
+        return " ".join(out)
+
+    def save(self, path: Union[str, Path]) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "table": self.table}, f)
+
+    def load(self, path: Union[str, Path]) -> None:
+        """
+        Merge a table saved by save(); it must come from the same configuration.
+        With ``max_size`` only the newest entries are kept.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("fingerprint") != self.fingerprint:
+            raise ValueError(f"Vocabulary table '{path}' was built with different stopwords or placeholders")
+        self.table.update(payload["table"])
+        if self.max_size is not None and len(self.table) > self.max_size:
+            for token in list(self.table)[:len(self.table) - self.max_size]:
+                del self.table[token]
+
 
 class ComplaintPreprocessor:
     """
@@ -17,11 +120,18 @@ class ComplaintPreprocessor:
     - Remove placeholders
     - Drop empty rows
     - Informative logging of cleaning steps
+
+    ``preprocess(..., fast=True)`` runs the same steps as a single fused pass
+    per row with precompiled patterns and a memoized TokenTransform for
+    stopwords, lemmatization and placeholders; the output is identical to the
+    step-by-step pipeline. The token table can be persisted with
+    save_vocabulary() and reused through ``vocabulary_file``.
     """
 
     PLACEHOLDERS = ["xxxx", "xxxxx", "xxxxxx", "---", "n/a", "na", "unknown"]
 
-    def __init__(self, boilerplate_file: str = None, stopwords_file: str = None, verbose: bool = True):
+    def __init__(self, boilerplate_file: str = None, stopwords_file: str = None, verbose: bool = True,
+                 vocabulary_file: str = None, max_vocabulary_size: int = None):
         self.lemmatizer = WordNetLemmatizer()
         self.verbose = verbose
 
@@ -34,6 +144,14 @@ class ComplaintPreprocessor:
                 raise ValueError(f"Expected a text file for boilerplate, got {type(raw)}")
         else:
             self.boilerplate = []
+        self._boilerplate_patterns = [
+            re.compile(re.escape(sentence), re.IGNORECASE) for sentence in self.boilerplate
+        ]
+        # One alternation over every phrase, used to skip rows without boilerplate
+        self._boilerplate_any = (
+            re.compile("|".join(re.escape(s) for s in self.boilerplate), re.IGNORECASE)
+            if self.boilerplate else None
+        )
 
         # Load stopwords
         if stopwords_file:
@@ -44,6 +162,13 @@ class ComplaintPreprocessor:
                 raise ValueError(f"Expected a text file for stopwords, got {type(raw)}")
         else:
             self.stop_words = []
+        self._stop_set = frozenset(self.stop_words)
+
+        self.token_transform = TokenTransform(
+            self._stop_set, self._lemmatize_word, self.PLACEHOLDERS, max_size=max_vocabulary_size
+        )
+        if vocabulary_file and os.path.exists(vocabulary_file):
+            self.token_transform.load(vocabulary_file)
 
     # -------------------------
     # Text cleaning methods
@@ -58,26 +183,29 @@ class ComplaintPreprocessor:
         if pd.isna(text):
             return ""
         text = str(text)
-        text = re.sub(r"\S+@\S+\.\S+", "", text)  # Remove emails
-        text = re.sub(r"(\+?\d{1,2}\s?)?(\(?\d{3}\)?[\s.-]?)?\d{3}[\s.-]?\d{4}", "", text)  # Remove phones
-        text = re.sub(r"[^a-zA-Z0-9\s\.?]", " ", text)  # Keep letters, numbers, space, '.' and '?'
-        text = re.sub(r"\s+", " ", text).strip()
+        text = EMAIL_PATTERN.sub("", text)  # Remove emails
+        text = PHONE_PATTERN.sub("", text)  # Remove phones
+        text = SPECIAL_CHARS_PATTERN.sub(" ", text)  # Keep letters, numbers, space, '.' and '?'
+        text = WHITESPACE_PATTERN.sub(" ", text).strip()
         return text
 
     def _remove_boilerplate(self, text: str) -> str:
         if pd.isna(text):
             return ""
-        for sentence in self.boilerplate:
-            text = re.sub(re.escape(sentence), "", text, flags=re.IGNORECASE)
-        return re.sub(r"\s+", " ", text).strip()
+        for pattern in self._boilerplate_patterns:
+            text = pattern.sub("", text)
+        return WHITESPACE_PATTERN.sub(" ", text).strip()
 
     def _remove_stopwords(self, text: str) -> str:
         if pd.isna(text):
             return ""
         words = text.split()
-        filtered_words = [word for word in words if word not in self.stop_words]
+        filtered_words = [word for word in words if word not in self._stop_set]
         return " ".join(filtered_words)
 
+    def _lemmatize_word(self, word: str) -> str:
+        return self.lemmatizer.lemmatize(word)
+
     def _lemmatize_text(self, text: str) -> str:
         return " ".join([self.lemmatizer.lemmatize(word) for word in text.split()])
 
@@ -87,15 +215,51 @@ class ComplaintPreprocessor:
             return ""
         for ph in cls.PLACEHOLDERS:
             text = text.replace(ph, "")
-        return re.sub(r"\s+", " ", text).strip()
+        return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+    def _clean_row(self, text) -> str:
+        """
+        Fused equivalent of clean_text -> boilerplate -> stopwords -> lemmatize
+        -> placeholders for one already-lowercased value.
+        """
+        if not isinstance(text, str):
+            return ""
+        if "@" in text:  # every email match contains '@'
+            text = EMAIL_PATTERN.sub("", text)
+        text = FAST_PHONE_PATTERN.sub("", text)
+        text = NON_TEXT_RUN_PATTERN.sub(" ", text).strip()
+
+        # Boilerplate phrases are removed one after another, because removing
+        # one phrase can create a match for the next; most rows contain none,
+        # so a single search over the alternation decides whether to bother.
+        if self._boilerplate_any is not None and self._boilerplate_any.search(text):
+            for pattern in self._boilerplate_patterns:
+                text = pattern.sub("", text)
+            text = WHITESPACE_PATTERN.sub(" ", text).strip()
+
+        return self.token_transform.transform(text)
+
+    def clean_text(self, text: str) -> str:
+        """
+        Clean one raw string (e.g. a search query) the way preprocess() cleans
+        each row, so its terms match the indexed chunk text.
+        """
+        return self._clean_row(text.lower() if isinstance(text, str) else text)
+
+    def save_vocabulary(self, path: str) -> None:
+        """Persist the memoized token table so later runs can skip lemmatization."""
+        self.token_transform.save(path)
 
     # -------------------------
     # Main preprocessing pipeline
     # -------------------------
-    def preprocess(self, df: pd.DataFrame, column: str, sample_size: int = 3) -> pd.DataFrame:
+    def preprocess(self, df: pd.DataFrame, column: str, sample_size: int = 3, fast: bool = False) -> pd.DataFrame:
         if column not in df.columns:
             raise ValueError(f"Column '{column}' not found in DataFrame.")
 
+        if fast:
+            return self._preprocess_fast(df, column, sample_size)
+
         if self.verbose:
             print("="*70)
             print("STARTING PREPROCESSING PIPELINE")
@@ -165,3 +329,159 @@ class ComplaintPreprocessor:
             print("="*70)
 
         return df
+
+    def _preprocess_fast(self, df: pd.DataFrame, column: str, sample_size: int = 3) -> pd.DataFrame:
+        """
+        Single-pass variant of preprocess: vectorized lowercasing followed by
+        one fused cleaning call per row. Intermediate samples are not printed.
+        """
+        if self.verbose:
+            print("="*70)
+            print("STARTING PREPROCESSING PIPELINE (FAST MODE)")
+            print(f"Initial number of rows: {len(df):,}")
+            print("="*70)
+            print(f"Sample before any cleaning ({sample_size} rows):")
+            print(df[column].head(sample_size))
+            print("-"*70)
+
+        before_rows = len(df)
+
+        df = self._lowercase_text(df, column)
+        clean_row = self._clean_row
+        df[column] = [clean_row(text) for text in df[column].tolist()]
+        if self.verbose:
+            print(f"After FUSED CLEANING ({sample_size} rows):")
+            print(df[column].head(sample_size))
+            print("-"*70)
+
+        # Drop empty rows
+        df = df[df[column].str.strip() != ""].copy()
+        after_rows = len(df)
+        if self.verbose:
+            print(f"Rows removed because they were empty after cleaning: {before_rows - after_rows:,}")
+            print(f"Remaining rows: {after_rows:,}")
+            print("="*70)
+            print("PREPROCESSING PIPELINE COMPLETED")
+            print("="*70)
+
+        return df
+
+
+# -------------------------
+# Parallel, chunked preprocessing
+# -------------------------
+# Per-process preprocessor, built once by the pool initializer
+_worker_preprocessor: Optional[ComplaintPreprocessor] = None
+
+
+def _init_worker(boilerplate_file: Optional[str], stopwords_file: Optional[str],
+                 vocabulary_file: Optional[str]) -> None:
+    global _worker_preprocessor
+    _worker_preprocessor = ComplaintPreprocessor(boilerplate_file, stopwords_file, verbose=False,
+                                                 vocabulary_file=vocabulary_file)
+
+
+def _preprocess_batch(batch: pd.DataFrame, column: str, fast: bool):
+    start = time.perf_counter()
+    cleaned = _worker_preprocessor.preprocess(batch, column, fast=fast)
+    return os.getpid(), len(batch), cleaned, time.perf_counter() - start
+
+
+class _BatchWriter:
+    """Appends cleaned batches, in order, to a CSV or Parquet file."""
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.format = output_path.suffix.lower().lstrip(".")
+        if self.format not in ("csv", "parquet"):
+            raise ValueError(f"Unsupported output type: .{self.format}. Supported formats: csv, parquet")
+        self._parquet_writer = None
+        self._schema = None
+        self._wrote_csv_header = False
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.format == "csv":
+            df.to_csv(self.output_path, mode="a" if self._wrote_csv_header else "w",
+                      header=not self._wrote_csv_header, index=False)
+            self._wrote_csv_header = True
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._parquet_writer is None:
+            self._schema = table.schema
+            self._parquet_writer = pq.ParquetWriter(self.output_path, self._schema)
+        self._parquet_writer.write_table(table)
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def preprocess_file_parallel(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    column: str,
+    boilerplate_file: str = None,
+    stopwords_file: str = None,
+    batch_size: int = 50_000,
+    n_workers: Optional[int] = None,
+    fast: bool = True,
+    verbose: bool = True,
+    columns: Optional[List[str]] = None,
+    vocabulary_file: Optional[str] = None,
+    column_types: Optional[Dict[str, pa.DataType]] = None,
+) -> Dict[int, WorkerThroughput]:
+    """
+    Preprocess a large CSV / JSON-lines / Parquet file on all cores without loading it whole.
+
+    The input is streamed in ``batch_size`` row batches and fanned out to a
+    process pool; every worker builds its own ComplaintPreprocessor (lemmatizer,
+    stopwords, boilerplate patterns) once. Cleaned batches are written to
+    ``output_path`` (.csv or .parquet) in input order. At most ``2 * n_workers``
+    batches are in flight, so peak memory does not grow with the input size.
+    ``columns`` restricts which input columns are read and written (it must
+    include ``column``); by default all columns are kept. A token table saved
+    with ComplaintPreprocessor.save_vocabulary() can be passed as
+    ``vocabulary_file`` to warm every worker's TokenTransform. CSV columns are
+    read as strings unless typed in ``column_types`` (see stream_batches).
+
+    Returns:
+        Throughput counters per worker process id.
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    if not input_path.exists():
+        raise FileNotFoundError(f"File not found: {input_path}")
+
+    n_workers = n_workers or os.cpu_count() or 1
+    max_pending = 2 * n_workers
+    stats: Dict[int, WorkerThroughput] = {}
+    writer = _BatchWriter(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def input_batches():
+        for record_batch in stream_batches(input_path, columns=columns, batch_size=batch_size,
+                                           column_types=column_types):
+            batch = record_batch.to_pandas()
+            if column not in batch.columns:
+                raise ValueError(f"Column '{column}' not found in {input_path}.")
+            yield batch
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(boilerplate_file, stopwords_file, vocabulary_file)) as pool:
+            results = ordered_map(pool, _preprocess_batch, input_batches(), max_pending, column, fast)
+            for pid, rows_in, cleaned, seconds in results:
+                stats.setdefault(pid, WorkerThroughput(pid=pid)).record(rows_in, len(cleaned), seconds)
+                writer.write(cleaned)
+    finally:
+        writer.close()
+
+    if verbose:
+        print_worker_throughput(f"PARALLEL PREPROCESSING COMPLETED ({n_workers} workers)",
+                                stats, time.perf_counter() - start)
+
+    return stats
@@ -0,0 +1,328 @@
+"""
+deduplication.py
+
+Near-duplicate removal stage between chunking and indexing.
+
+CFPB narratives contain many templated and copy-pasted complaints; their
+chunks would be embedded, stored and retrieved several times over. This
+stage keeps one canonical copy of each group of (near-)identical chunks.
+
+Responsibilities:
+- Exact duplicates: hash of the whitespace-normalised chunk text
+- Near duplicates: MinHash signatures over word shingles, bucketed with
+  LSH (banding) and confirmed by estimated Jaccard similarity
+- Signatures are computed on all cores (same process-pool pattern as
+  chunking.py); the first occurrence of a group is its canonical chunk
+- Write the kept chunks (same schema as the input) and a mapping of every
+  dropped chunk to its canonical chunk, so sources can still be attributed
+- Report how much the chunk set / index shrank
+
+Public API:
+- minhash_signature(...)
+- DedupReport
+- deduplicate_chunks(...)
+- load_duplicate_map(...)
+- with_duplicate_sources(...)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .data_loader import stream_batches
+from .parallel import WorkerThroughput, ordered_map, print_worker_throughput
+
+# Universal hashing modulo a Mersenne prime; products of 31-bit values fit in uint64
+_PRIME = np.uint64((1 << 31) - 1)
+
+MAPPING_SCHEMA = pa.schema([
+    ("row", pa.int64()),             # position of the dropped chunk in the input
+    ("canonical_id", pa.int64()),    # position of its canonical chunk in the output (= FAISS id)
+    ("kind", pa.string()),           # "exact" or "near"
+    ("similarity", pa.float32()),    # estimated Jaccard similarity (1.0 for exact)
+    ("complaint_id", pa.string()),
+    ("chunk_index", pa.int32()),
+    ("canonical_complaint_id", pa.string()),
+    ("canonical_chunk_index", pa.int32()),
+])
+
+
+# ----------------------------
+# Hashing
+# ----------------------------
+
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def exact_key(text: str) -> bytes:
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=8).digest()
+
+
+def minhash_signature(text: str, a: np.ndarray, b: np.ndarray, shingle_size: int = 3) -> np.ndarray:
+    """MinHash signature (one uint32 per permutation) of the word shingles of ``text``."""
+    words = text.split()
+    if len(words) <= shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    hashes %= _PRIME
+    return ((np.outer(a, hashes) + b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+# Per-process permutations, built once by the pool initializer
+_worker_perms: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+
+def _init_worker(num_perm: int, seed: int) -> None:
+    global _worker_perms
+    _worker_perms = _permutations(num_perm, seed)
+
+
+def _hash_batch(batch: pa.RecordBatch, text_column: str, shingle_size: int):
+    start = time.perf_counter()
+    a, b = _worker_perms
+    texts = [text or "" for text in batch.column(text_column).to_pylist()]
+    keys = [exact_key(text) for text in texts]
+    signatures = np.vstack([minhash_signature(text, a, b, shingle_size) for text in texts]) if texts else None
+    return os.getpid(), batch, keys, signatures, time.perf_counter() - start
+
+
+# ----------------------------
+# Report
+# ----------------------------
+
+@dataclass
+class DedupReport:
+    """Outcome of a deduplication run."""
+
+    input_chunks: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+    complaints: int = 0
+    complaints_fully_duplicated: int = 0
+
+    @property
+    def kept_chunks(self) -> int:
+        return self.input_chunks - self.exact_duplicates - self.near_duplicates
+
+    @property
+    def shrink(self) -> float:
+        """Fraction of chunks removed."""
+        return 1 - self.kept_chunks / self.input_chunks if self.input_chunks else 0.0
+
+    def index_bytes_saved(self, dim: int = 384) -> int:
+        """float32 flat-index memory no longer needed for the dropped chunks."""
+        return (self.input_chunks - self.kept_chunks) * dim * 4
+
+
+def print_dedup_report(report: DedupReport, dim: int = 384) -> None:
+    print("=" * 70)
+    print("DEDUPLICATION COMPLETED")
+    print("=" * 70)
+    print(f"Input chunks:             {report.input_chunks:,}")
+    print(f"Exact duplicates:         {report.exact_duplicates:,}")
+    print(f"Near duplicates:          {report.near_duplicates:,}")
+    print(f"Kept chunks:              {report.kept_chunks:,} ({report.shrink:.1%} smaller)")
+    print(f"Complaints fully dropped: {report.complaints_fully_duplicated:,} of {report.complaints:,}")
+    print(f"Index memory saved:       {report.index_bytes_saved(dim) / 1e6:,.1f} MB (flat, {dim}-d float32)")
+    print("=" * 70)
+
+
+# ----------------------------
+# Stage
+# ----------------------------
+
+def _metadata_columns(batch: pa.RecordBatch) -> Tuple[List[Any], List[Any]]:
+    """(complaint_id, chunk_index) per row, from the chunk metadata struct if present."""
+    if "metadata" not in batch.schema.names:
+        return [None] * batch.num_rows, [None] * batch.num_rows
+    metadata = batch.column("metadata")
+    names = metadata.type.names
+    complaint_ids = pc.struct_field(metadata, "complaint_id").to_pylist() if "complaint_id" in names else [None] * len(metadata)
+    chunk_indexes = pc.struct_field(metadata, "chunk_index").to_pylist() if "chunk_index" in names else [None] * len(metadata)
+    return complaint_ids, chunk_indexes
+
+
+def _input_schema(input_path: Union[str, Path]) -> pa.Schema:
+    """Schema of a chunk Parquet file / dataset, read the way stream_batches reads it."""
+    return ds.dataset(input_path, format="parquet", partitioning="hive").schema
+
+
+def deduplicate_chunks(
+    input_path: Union[str, Path],
+    output_path: Union[str, Path],
+    mapping_path: Optional[Union[str, Path]] = None,
+    text_column: str = "chunk_text",
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    bands: int = 8,
+    shingle_size: int = 3,
+    batch_size: int = 10_000,
+    n_workers: Optional[int] = None,
+    seed: int = 1,
+    verbose: bool = True,
+) -> DedupReport:
+    """
+    Drop exact and near-duplicate chunks from a chunk Parquet file / dataset
+    (chunking.chunk_file or embedding.embed_chunks output).
+
+    Two chunks are near duplicates when the estimated Jaccard similarity of
+    their word ``shingle_size``-grams is at least ``threshold``. Candidates
+    come from LSH with ``bands`` bands of ``num_perm / bands`` rows, which
+    catches pairs above roughly (1 / bands) ** (bands / num_perm).
+
+    Kept chunks are written to ``output_path`` in input order, so their row
+    number there is the FAISS id from_parquet will assign. Every dropped
+    chunk is recorded in ``mapping_path`` (default: ``<output>.duplicates.parquet``)
+    with the output row of its canonical chunk.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    rows_per_band = num_perm // bands
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    mapping_path = Path(mapping_path) if mapping_path else output_path.with_suffix(".duplicates.parquet")
+
+    report = DedupReport()
+    exact_owner: Dict[bytes, int] = {}
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+    kept_signatures: List[np.ndarray] = []
+    kept_meta: List[Tuple[Any, Any]] = []
+    chunks_per_complaint: Dict[Any, List[int]] = {}  # complaint -> [chunks, dropped]
+
+    n_workers = n_workers or os.cpu_count() or 1
+    stats: Dict[int, WorkerThroughput] = {}
+    start = time.perf_counter()
+    writer = None
+    mapping_writer = pq.ParquetWriter(mapping_path, MAPPING_SCHEMA, compression="zstd")
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(num_perm, seed)) as pool:
+            batches = stream_batches(input_path, batch_size=batch_size)
+            results = ordered_map(pool, _hash_batch, batches, 2 * n_workers, text_column, shingle_size)
+            for pid, batch, keys, signatures, seconds in results:
+                complaint_ids, chunk_indexes = _metadata_columns(batch)
+                keep = np.zeros(batch.num_rows, dtype=bool)
+                dropped: Dict[str, list] = {name: [] for name in MAPPING_SCHEMA.names}
+
+                for i in range(batch.num_rows):
+                    row = report.input_chunks + i
+                    counts = chunks_per_complaint.setdefault(complaint_ids[i], [0, 0])
+                    counts[0] += 1
+
+                    canonical, kind, similarity = exact_owner.get(keys[i]), "exact", 1.0
+                    band_keys = None
+                    if canonical is None:
+                        signature = signatures[i]
+                        band_keys = [signature[j * rows_per_band:(j + 1) * rows_per_band].tobytes()
+                                     for j in range(bands)]
+                        candidates = {c for j, key in enumerate(band_keys) for c in buckets[j].get(key, ())}
+                        best = -1.0
+                        for candidate in candidates:
+                            estimate = float(np.mean(kept_signatures[candidate] == signature))
+                            if estimate > best:
+                                best, canonical = estimate, candidate
+                        if best < threshold:
+                            canonical = None
+                        kind, similarity = "near", best
+
+                    if canonical is None:
+                        # New canonical chunk: its output row is the number kept so far
+                        out_id = len(kept_signatures)
+                        keep[i] = True
+                        exact_owner[keys[i]] = out_id
+                        kept_signatures.append(signatures[i])
+                        kept_meta.append((complaint_ids[i], chunk_indexes[i]))
+                        for j, key in enumerate(band_keys):
+                            buckets[j].setdefault(key, []).append(out_id)
+                        continue
+
+                    counts[1] += 1
+                    # Later exact copies of this dropped chunk take the exact path to the same canonical
+                    exact_owner.setdefault(keys[i], canonical)
+                    if kind == "exact":
+                        report.exact_duplicates += 1
+                    else:
+                        report.near_duplicates += 1
+                    for name, value in zip(MAPPING_SCHEMA.names, (
+                        row, canonical, kind, similarity,
+                        None if complaint_ids[i] is None else str(complaint_ids[i]), chunk_indexes[i],
+                        None if kept_meta[canonical][0] is None else str(kept_meta[canonical][0]),
+                        kept_meta[canonical][1],
+                    )):
+                        dropped[name].append(value)
+
+                report.input_chunks += batch.num_rows
+                stats.setdefault(pid, WorkerThroughput(pid=pid)).record(batch.num_rows, int(keep.sum()), seconds)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, batch.schema, compression="zstd")
+                writer.write_batch(batch.filter(pa.array(keep)))
+                if dropped["row"]:
+                    mapping_writer.write_table(pa.table(dropped, schema=MAPPING_SCHEMA))
+        if writer is None:
+            # No input rows: still write an empty output for from_parquet
+            writer = pq.ParquetWriter(output_path, _input_schema(input_path), compression="zstd")
+    finally:
+        if writer is not None:
+            writer.close()
+        mapping_writer.close()
+
+    report.complaints = len(chunks_per_complaint)
+    report.complaints_fully_duplicated = sum(1 for total, gone in chunks_per_complaint.values() if total == gone)
+    if verbose:
+        print_worker_throughput(f"MINHASH SIGNATURES ({num_perm} permutations, {bands} bands)",
+                                stats, time.perf_counter() - start)
+        print_dedup_report(report)
+    return report
+
+
+# ----------------------------
+# Source attribution
+# ----------------------------
+
+def load_duplicate_map(mapping_path: Union[str, Path]) -> Dict[Tuple[str, Any], List[Tuple[str, Any]]]:
+    """(complaint_id, chunk_index) of a canonical chunk -> the chunks dropped in its favour."""
+    duplicates: Dict[Tuple[str, Any], List[Tuple[str, Any]]] = {}
+    table = pq.read_table(mapping_path, columns=["complaint_id", "chunk_index",
+                                                 "canonical_complaint_id", "canonical_chunk_index"])
+    for row in table.to_pylist():
+        key = (row["canonical_complaint_id"], row["canonical_chunk_index"])
+        duplicates.setdefault(key, []).append((row["complaint_id"], row["chunk_index"]))
+    return duplicates
+
+
+def with_duplicate_sources(results: Sequence[Dict[str, Any]],
+                           duplicate_map: Dict[Tuple[str, Any], List[Tuple[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Copy of retrieval results where each metadata dict lists the complaint
+    ids whose duplicate chunks were folded into the retrieved chunk.
+    """
+    attributed = []
+    for result in results:
+        meta = result.get("metadata", {})
+        key = (str(meta.get("complaint_id")), meta.get("chunk_index"))
+        duplicates = duplicate_map.get(key, [])
+        attributed.append({
+            **result,
+            "metadata": {**meta, "duplicate_complaint_ids": sorted({c for c, _ in duplicates})},
+        })
+    return attributed
@@ -0,0 +1,222 @@
+"""
+embedding.py
+
+Offline corpus embedding stage for CPU-only machines.
+
+Responsibilities:
+- Stream chunk batches (output of chunking.chunk_file) in fixed-size shards
+- Bucket each shard by token length so every encoder batch has little padding
+- Run several encoder processes, each with a controlled number of torch threads
+- Write float32 embeddings shard by shard, atomically, so an interrupted run
+  resumes from the last finished shard
+
+The shard directory is a Parquet dataset with the columns
+ComplaintVectorStore.from_parquet expects (chunk_text, embedding, metadata).
+
+Public API:
+- length_buckets(...)
+- embed_chunks(...)
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .data_loader import stream_batches
+from .parallel import WorkerThroughput, ordered_map, print_worker_throughput
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Underscore-prefixed, so Parquet dataset readers ignore it
+MANIFEST_NAME = "_manifest.json"
+
+
+def load_sentence_transformer(model_name: str):
+    """Default encoder factory (imported lazily so the parent never loads torch)."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+# ----------------------------
+# Length bucketing
+# ----------------------------
+
+def token_lengths(model: Any, texts: Sequence[str]) -> List[int]:
+    """Token count per text using the encoder's tokenizer (character count if it has none)."""
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return [len(text) for text in texts]
+    max_length = getattr(model, "max_seq_length", None)
+    encoded = tokenizer(list(texts), add_special_tokens=True,
+                        truncation=max_length is not None, max_length=max_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def length_buckets(lengths: Sequence[int], max_batch_tokens: int, max_batch_size: int) -> List[List[int]]:
+    """
+    Group row indices into encoder batches of similar length.
+
+    Rows are sorted by length and batches are closed once their padded size
+    (rows x longest row) would exceed ``max_batch_tokens``, so short chunks
+    are encoded in large batches and long chunks in small ones.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for idx in np.argsort(np.asarray(lengths), kind="stable"):
+        padded_len = max(int(lengths[idx]), 1)  # ascending, so this row is the longest so far
+        if current and ((len(current) + 1) * padded_len > max_batch_tokens or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+        current.append(int(idx))
+    if current:
+        batches.append(current)
+    return batches
+
+
+# ----------------------------
+# Encoder worker processes
+# ----------------------------
+
+# Per-process encoder, loaded once by the pool initializer
+_worker_model: Any = None
+
+
+def _init_worker(encoder_factory: Callable[[str], Any], model_name: str, num_threads: int) -> None:
+    global _worker_model
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    _worker_model = encoder_factory(model_name)
+
+
+def _shard_path(output_dir: Path, shard: int) -> Path:
+    return output_dir / f"shard-{shard:05d}.parquet"
+
+
+def _embed_shard(job, output_dir: Path, text_column: str, max_batch_tokens: int, max_batch_size: int):
+    shard, batch = job
+    start = time.perf_counter()
+    texts = [text or "" for text in batch.column(text_column).to_pylist()]
+
+    embeddings = None
+    for rows in length_buckets(token_lengths(_worker_model, texts), max_batch_tokens, max_batch_size):
+        encoded = _worker_model.encode(
+            [texts[i] for i in rows],
+            batch_size=len(rows),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        ).astype("float32", copy=False)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), encoded.shape[1]), dtype="float32")
+        embeddings[rows] = encoded
+
+    table = pa.Table.from_batches([batch]).append_column(
+        "embedding", pa.FixedSizeListArray.from_arrays(pa.array(embeddings.reshape(-1)), embeddings.shape[1])
+    )
+
+    # Write under a hidden name and rename, so a shard file is either complete or absent
+    final_path = _shard_path(output_dir, shard)
+    tmp_path = output_dir / f".{final_path.name}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, final_path)
+    return os.getpid(), shard, len(texts), time.perf_counter() - start
+
+
+def _check_manifest(output_dir: Path, manifest: Dict[str, Any]) -> None:
+    path = output_dir / MANIFEST_NAME
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+        if existing != manifest:
+            raise ValueError(
+                f"'{output_dir}' holds shards from a different run ({existing}); "
+                "use a new output directory or matching settings to resume"
+            )
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+
+def embed_chunks(
+    input_path: Union[str, Path],
+    output_dir: Union[str, Path],
+    model_name: str = DEFAULT_MODEL_NAME,
+    text_column: str = "chunk_text",
+    shard_size: int = 50_000,
+    n_workers: Optional[int] = None,
+    threads_per_worker: Optional[int] = None,
+    max_batch_tokens: int = 16_384,
+    max_batch_size: int = 256,
+    encoder_factory: Callable[[str], Any] = load_sentence_transformer,
+    verbose: bool = True,
+) -> Dict[int, WorkerThroughput]:
+    """
+    Embed every chunk of ``input_path`` into Parquet shards under ``output_dir``.
+
+    Each shard of ``shard_size`` chunks is encoded by one of ``n_workers``
+    processes running ``threads_per_worker`` torch threads (by default the
+    cores are split evenly). Shards that already exist are skipped, so
+    re-running after a crash resumes where the previous run stopped; settings
+    that change shard boundaries are refused on resume.
+
+    ``encoder_factory(model_name)`` must return an object with a
+    SentenceTransformer-style ``encode`` method; it is called once per worker.
+
+    Returns:
+        Throughput counters (chunks embedded) per worker process id.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    _check_manifest(output_dir, {
+        "input_path": str(Path(input_path).resolve()),
+        "model_name": model_name,
+        "text_column": text_column,
+        "shard_size": shard_size,
+    })
+
+    cores = os.cpu_count() or 1
+    n_workers = n_workers or max(1, cores // 4)
+    threads_per_worker = threads_per_worker or max(1, cores // n_workers)
+
+    skipped = 0
+
+    def pending_shards():
+        nonlocal skipped
+        for shard, batch in enumerate(stream_batches(input_path, batch_size=shard_size)):
+            if _shard_path(output_dir, shard).exists():
+                skipped += 1
+                continue
+            yield shard, batch
+
+    stats: Dict[int, WorkerThroughput] = {}
+    start = time.perf_counter()
+    # Spawned workers start without the parent's torch / OpenMP state
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(encoder_factory, model_name, threads_per_worker)) as pool:
+        results = ordered_map(pool, _embed_shard, pending_shards(), 2 * n_workers,
+                              output_dir, text_column, max_batch_tokens, max_batch_size)
+        for pid, shard, rows, seconds in results:
+            stats.setdefault(pid, WorkerThroughput(pid=pid)).record(rows, rows, seconds)
+
+    if verbose:
+        if skipped:
+            print(f"Resumed: skipped {skipped} finished shard(s)")
+        print_worker_throughput(
+            f"EMBEDDING COMPLETED ({n_workers} workers x {threads_per_worker} threads)",
+            stats, time.perf_counter() - start,
+        )
+    return stats
@@ -69,12 +69,13 @@ def run_evaluation(
         settings={"num_questions": len(questions), "retrieval_k": k}
     )
 
-    for i, question in enumerate(questions, 1):
+    # Retrieve chunks for every question in one batched search
+    all_chunks = rag_pipeline.retriever.retrieve_many(questions, k=k)
+
+    for i, (question, retrieved_chunks) in enumerate(zip(questions, all_chunks), 1):
         if verbose:
             print(f"\n[{i}/{len(questions)}] {question[:50]}...")
 
-        # Retrieve chunks
-        retrieved_chunks = rag_pipeline.retriever.retrieve(question, k=k)
         answer = rag_pipeline.generator.generate(question, retrieved_chunks)
 
         # Create evaluation result
@@ -1,34 +1,175 @@
-from llama_cpp import Llama
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
+
+from .cache import PromptPrefixCache
+from .context_packing import pack_context
+from .prompt import split_rag_prompt
+from .streaming import CancellationToken, iterate_in_thread
+
+# llama_cpp loads its native library on import, so it is imported on first
+# use (see _llama_class); tests patch this module attribute
+Llama = None
+
+
+def _llama_class():
+    global Llama
+    if Llama is None:
+        from llama_cpp import Llama as _Llama
+        Llama = _Llama
+    return Llama
+
+
+# Analyst instructions (identical for every request) and the per-request rest
+PROMPT_PREFIX, PROMPT_TEMPLATE = split_rag_prompt()
+N_CTX = 4096
+MAX_TOKENS = 512  # answer length
+
+
+def prompt_lookup_draft(num_pred_tokens: int, max_ngram_size: int = 2):
+    """
+    Speculative-decoding draft "model" that proposes the tokens following
+    the latest n-gram's previous occurrence in the prompt. Answers quoting
+    the retrieved excerpts get several tokens verified per model pass.
+    """
+    from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+    return LlamaPromptLookupDecoding(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+
+
+def model_fingerprint(model_path: str, n_ctx: int = N_CTX, *settings: Any) -> str:
+    """Identifies a model file and context settings, to invalidate saved llama.cpp states."""
+    try:
+        from llama_cpp import __version__ as llama_version
+    except ImportError:
+        llama_version = ""
+    parts = [os.path.abspath(model_path), str(n_ctx), llama_version, *map(str, settings)]
+    if os.path.exists(model_path):
+        info = os.stat(model_path)
+        parts += [str(info.st_size), str(info.st_mtime_ns)]
+    return "|".join(parts)
+
 
 class RAGGenerator:
-    def __init__(self, model_path: str = "/Users/elbethelzewdie/Downloads/rag-complaint-chatbot/rag-complaint-chatbot/Mistral-7B-Instruct-v0.3-Q4_K_M.gguf"):
+    # Set by __init__ unless cache_prefix=False
+    prefix_cache: Optional[PromptPrefixCache] = None
+    # Token budget of the retrieved context (None: what n_ctx leaves free)
+    context_tokens: Optional[int] = None
+
+    def __init__(self, model_path: str = "/Users/elbethelzewdie/Downloads/rag-complaint-chatbot/rag-complaint-chatbot/Mistral-7B-Instruct-v0.3-Q4_K_M.gguf",
+                 n_threads: Optional[int] = None, cache_prefix: bool = True,
+                 prefix_cache_path: Optional[str] = None, context_tokens: Optional[int] = None,
+                 prompt_lookup_tokens: int = 0):
+        """
+        ``prompt_lookup_tokens > 0`` turns on prompt-lookup speculative
+        decoding with that many draft tokens per step. Greedy output is
+        unchanged, but llama.cpp then keeps logits for every context
+        position (n_ctx x vocabulary floats, about 0.5 GB for Mistral 7B).
+        """
+        self.context_tokens = context_tokens
+        self.prompt_lookup_tokens = prompt_lookup_tokens
         # Use the llama-cpp-python library you installed
-        self.model = Llama(
+        self.model = _llama_class()(
             model_path=model_path,
             n_gpu_layers=-1, # Ensures Metal GPU use on your MacBook Air
-            n_ctx=4096,
+            n_ctx=N_CTX,
+            n_threads=n_threads, # None: llama.cpp default (all physical cores)
+            n_threads_batch=n_threads,
+            draft_model=prompt_lookup_draft(prompt_lookup_tokens) if prompt_lookup_tokens > 0 else None,
             verbose=False
         )
+        if cache_prefix:
+            # The analyst instructions are evaluated once (or loaded from
+            # <model>.prefix.npz) instead of on every request
+            self.prefix_cache = PromptPrefixCache(
+                self.model, self.prompt_prefix(),
+                persist_path=prefix_cache_path or f"{model_path}.prefix.npz",
+                fingerprint=model_fingerprint(model_path, N_CTX, f"draft={prompt_lookup_tokens}"),
+            )
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def build_context(self, retrieved_chunks: List[Dict[str, Any]], budget: Optional[int] = None) -> str:
+        # Chunks of one complaint are merged, shared headers stated once and
+        # lower-ranked chunks dropped once ``budget`` tokens are used
+        return pack_context(retrieved_chunks, self.count_tokens, budget).text
+
+    def context_budget(self, question: str) -> int:
+        """Tokens left for the context once the rest of the prompt and the answer fit in n_ctx."""
+        rest = self.prompt_prefix() + PROMPT_TEMPLATE.format(context="", question=question) + " [/INST]"
+        available = N_CTX - MAX_TOKENS - self.count_tokens(rest) - 1  # BOS
+        return available if self.context_tokens is None else min(self.context_tokens, available)
+
+    def prompt_prefix(self) -> str:
+        """Start of every prompt, before any question-specific text."""
+        # Mistral v0.3 prompt format; llama.cpp adds the <s> (BOS) token itself
+        return f"[INST] {PROMPT_PREFIX}"
 
-    def build_context(self, retrieved_chunks: List[Dict[str, Any]]) -> str:
-        sections = []
-        for i, item in enumerate(retrieved_chunks, 1):
-            meta = item.get("metadata", {})
-            header = f"[Excerpt {i}] Company: {meta.get('company')} | Issue: {meta.get('issue')}"
-            sections.append(f"{header}\n{item.get('text','')}")
-        return "\n\n".join(sections)
+    def build_prompt(self, question: str, retrieved_chunks: List[Dict[str, Any]]) -> str:
+        context = self.build_context(retrieved_chunks, budget=self.context_budget(question))
+        return self.prompt_prefix() + PROMPT_TEMPLATE.format(context=context, question=question) + " [/INST]"
 
-    def generate(self, question: str, retrieved_chunks: List[Dict[str, Any]]) -> str:
-        context = self.build_context(retrieved_chunks)
-        # Use your prompt.py template
-        prompt = f"<s>[INST] Use the context to answer: {question}\n\nCONTEXT:\n{context} [/INST]"
+    @staticmethod
+    def _completion_options(cancellation: Optional[CancellationToken]) -> Dict[str, Any]:
+        if cancellation is None:
+            return {"max_tokens": MAX_TOKENS, "temperature": 0.0}
+        # Checked after every token: a cancelled or expired request frees the model
+        return {"max_tokens": cancellation.token_limit(MAX_TOKENS), "temperature": 0.0,
+                "stopping_criteria": cancellation}
 
-        output = self.model(prompt, max_tokens=512, temperature=0.0)
+    @staticmethod
+    def _note_finish(choice: Dict[str, Any], cancellation: Optional[CancellationToken]) -> None:
+        if cancellation is not None and choice.get('finish_reason') == "length":
+            cancellation.cancel(CancellationToken.MAX_TOKENS)
+
+    def generate(self, question: str, retrieved_chunks: List[Dict[str, Any]],
+                 cancellation: Optional[CancellationToken] = None) -> str:
+        """
+        Answer, or the part of it produced before ``cancellation`` stopped
+        the model (its ``reason`` tells why).
+        """
+        if cancellation is not None and cancellation.cancelled:
+            return ""
+        prompt = self.build_prompt(question, retrieved_chunks)
+        if self.prefix_cache is not None:
+            self.prefix_cache.restore()
+
+        output = self.model(prompt, **self._completion_options(cancellation))
         # Note: Fixed the index [0] here which was missing in your text but needed for llama-cpp
+        self._note_finish(output['choices'][0], cancellation)
         return output['choices'][0]['text'].strip()
 
+    def stream(self, question: str, retrieved_chunks: List[Dict[str, Any]],
+               cancellation: Optional[CancellationToken] = None) -> Iterator[str]:
+        """Yield the answer text piece by piece as the model produces it."""
+        if cancellation is not None and cancellation.cancelled:
+            return
+        prompt = self.build_prompt(question, retrieved_chunks)
+        if self.prefix_cache is not None:
+            self.prefix_cache.restore()
+        for chunk in self.model(prompt, stream=True, **self._completion_options(cancellation)):
+            self._note_finish(chunk['choices'][0], cancellation)
+            yield chunk['choices'][0]['text']
+
+    def astream(self, question: str, retrieved_chunks: List[Dict[str, Any]],
+                cancellation: Optional[CancellationToken] = None) -> AsyncIterator[str]:
+        """stream() for asyncio: the model runs in a worker thread."""
+        return iterate_in_thread(self.stream(question, retrieved_chunks, cancellation=cancellation))
+
 # --- ADD THIS PART BELOW ---
-def build_generator(llm_model_path: str) -> RAGGenerator:
-    """Factory function used by rag_pipeline.py"""
-    return RAGGenerator(model_path=llm_model_path)
+def build_generator(llm_model_path: str, n_workers: int = 1, n_threads: Optional[int] = None,
+                    prompt_lookup_tokens: int = 0):
+    """
+    Factory function used by rag_pipeline.py
+
+    With ``n_workers > 1`` a GeneratorPool of that many llama.cpp processes
+    (``n_threads`` each) is returned; it has the same generate / stream
+    interface and answers several questions at once.
+    ``prompt_lookup_tokens`` enables speculative decoding (see RAGGenerator).
+    """
+    if n_workers > 1:
+        from functools import partial
+        from .generator_pool import GeneratorPool, default_generator_factory
+        factory = partial(default_generator_factory, prompt_lookup_tokens=prompt_lookup_tokens)
+        return GeneratorPool(llm_model_path, n_workers=n_workers, threads_per_worker=n_threads,
+                             generator_factory=factory)
+    return RAGGenerator(model_path=llm_model_path, n_threads=n_threads, prompt_lookup_tokens=prompt_lookup_tokens)
@@ -0,0 +1,338 @@
+"""
+generator_pool.py
+
+Multi-process LLM backend: N llama.cpp workers answering questions in parallel.
+
+One llama.cpp context generates one answer at a time and stops scaling
+past roughly 8 threads, so a many-core server is best used by several
+model processes with a few threads each.
+
+Responsibilities:
+- Start ``n_workers`` processes, each loading its own RAGGenerator with a
+  ``threads_per_worker`` thread budget
+- Dispatch every request to the worker with the fewest requests in flight
+- Keep RAGGenerator's interface: blocking generate() and a token stream(),
+  both safe to call from many threads at once
+- Record per-worker throughput and latency, and fail requests (instead of
+  hanging) when a worker process dies
+- Forward CancellationTokens: a cancelled request stops its worker's model
+  within a token
+
+Public API:
+- GenerationWorkerStats
+- GeneratorPool
+- print_generator_pool_stats(...)
+"""
+
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .streaming import CancellationToken
+
+# llama.cpp contexts stop scaling linearly beyond about this many threads
+THREADS_PER_CONTEXT = 8
+
+
+@dataclass
+class GenerationWorkerStats:
+    """Throughput and latency of one worker process."""
+
+    worker: int
+    pid: int
+    threads: int
+    completed: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    busy_seconds: float = 0.0      # time spent generating
+    output_chars: int = 0
+    started: float = field(default_factory=time.monotonic)
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))  # end-to-end seconds
+
+    @property
+    def answers_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return 60 * self.completed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def utilization(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.busy_seconds / elapsed if elapsed > 0 else 0.0
+
+    def latency_percentile(self, q: float) -> float:
+        return float(np.percentile(self.latencies, q)) if self.latencies else 0.0
+
+
+def default_generator_factory(model_path: str, n_threads: Optional[int], **options: Any):
+    """Build the RAGGenerator a worker process serves (runs in the worker)."""
+    from .generator import RAGGenerator
+    return RAGGenerator(model_path=model_path, n_threads=n_threads, **options)
+
+
+class _SharedCancellation(CancellationToken):
+    """Worker-side token of one request, also stopped when the parent sets ``cancel_id`` to it."""
+
+    def __init__(self, cancel_id: Any, request_id: int, timeout: Optional[float], max_tokens: Optional[int]):
+        super().__init__(timeout=timeout, max_tokens=max_tokens)
+        self._cancel_id = cancel_id
+        self._request_id = request_id
+
+    @property
+    def cancelled(self) -> bool:
+        if self._cancel_id.value == self._request_id:
+            self.cancel()
+        return super().cancelled
+
+
+def _worker_main(worker: int, model_path: str, n_threads: int, factory: Callable,
+                 requests: mp.Queue, results: mp.Queue, cancel_id: Any) -> None:
+    """Worker process: load the model once, then serve requests until told to stop."""
+    try:
+        generator = factory(model_path, n_threads)
+    except Exception as error:
+        results.put(("failed", worker, None, repr(error)))
+        return
+    results.put(("ready", worker, None, os.getpid()))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, stream, question, chunks, limits = request
+        start = time.perf_counter()
+        options: Dict[str, Any] = {}
+        if limits is not None:
+            options["cancellation"] = _SharedCancellation(cancel_id, request_id, *limits)
+        try:
+            if stream:
+                pieces = []
+                for piece in generator.stream(question, chunks, **options):
+                    pieces.append(piece)
+                    results.put(("token", worker, request_id, piece))
+                answer = "".join(pieces).strip()
+            else:
+                answer = generator.generate(question, chunks, **options)
+        except Exception as error:
+            results.put(("error", worker, request_id, repr(error)))
+        else:
+            reason = options["cancellation"].reason if options else None
+            results.put(("done", worker, request_id, (answer, time.perf_counter() - start, reason)))
+
+
+class GeneratorPool:
+    """
+    RAGGenerator-compatible front end for a pool of llama.cpp processes.
+
+    Parameters
+    ----------
+    model_path : str
+        GGUF model loaded by every worker
+    n_workers : int, optional
+        Number of worker processes (default: one per THREADS_PER_CONTEXT cores)
+    threads_per_worker : int, optional
+        llama.cpp threads of each worker (default: cores / n_workers)
+    generator_factory : callable, optional
+        ``factory(model_path, n_threads)`` building a worker's generator;
+        must be picklable (a module-level function)
+    start_timeout : float
+        Seconds to wait for every worker to load its model
+    """
+
+    def __init__(self, model_path: str, n_workers: Optional[int] = None,
+                 threads_per_worker: Optional[int] = None,
+                 generator_factory: Callable = default_generator_factory,
+                 start_timeout: float = 600.0):
+        cores = os.cpu_count() or 1
+        self.n_workers = n_workers or max(1, cores // THREADS_PER_CONTEXT)
+        self.threads_per_worker = threads_per_worker or max(1, cores // self.n_workers)
+
+        # spawn: llama.cpp / BLAS thread pools do not survive fork
+        context = mp.get_context("spawn")
+        self._results: mp.Queue = context.Queue()
+        self._requests: List[mp.Queue] = [context.Queue() for _ in range(self.n_workers)]
+        # Request id each worker must stop (checked by its model after every token)
+        self._cancel_ids = [context.Value("q", -1, lock=False) for _ in range(self.n_workers)]
+        self._processes = [
+            context.Process(target=_worker_main, name=f"llm-worker-{i}", daemon=True,
+                            args=(i, model_path, self.threads_per_worker, generator_factory,
+                                  self._requests[i], self._results, self._cancel_ids[i]))
+            for i in range(self.n_workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self.stats: List[GenerationWorkerStats] = []
+        try:
+            self._wait_for_workers(start_timeout)
+        except Exception:
+            self.close()
+            raise
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending: Dict[int, queue.Queue] = {}
+        self._closed = False
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_results, name="llm-pool-results", daemon=True)
+        self._reader.start()
+
+    def _wait_for_workers(self, timeout: float) -> None:
+        pids: Dict[int, int] = {}
+        deadline = time.monotonic() + timeout
+        while len(pids) < self.n_workers:
+            try:
+                kind, worker, _, value = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [i for i, p in enumerate(self._processes) if i not in pids and not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"LLM worker {dead[0]} exited while starting "
+                                       f"(exit code {self._processes[dead[0]].exitcode})") from None
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"LLM workers not ready after {timeout:.0f}s") from None
+                continue
+            if kind == "failed":
+                raise RuntimeError(f"LLM worker {worker} failed to load the model: {value}")
+            pids[worker] = value
+        now = time.monotonic()
+        self.stats = [GenerationWorkerStats(worker=i, pid=pids[i], threads=self.threads_per_worker, started=now)
+                      for i in range(self.n_workers)]
+
+    # ---------- RAGGenerator interface ----------
+    def generate(self, question: str, retrieved_chunks: List[Dict[str, Any]],
+                 cancellation: Optional[CancellationToken] = None) -> str:
+        answer = ""
+        for kind, value in self._request(question, retrieved_chunks, stream=False, cancellation=cancellation):
+            if kind == "done":
+                answer = value
+        return answer
+
+    def stream(self, question: str, retrieved_chunks: List[Dict[str, Any]],
+               cancellation: Optional[CancellationToken] = None) -> Iterator[str]:
+        """Yield the answer text piece by piece as the worker produces it."""
+        for kind, value in self._request(question, retrieved_chunks, stream=True, cancellation=cancellation):
+            if kind == "token":
+                yield value
+
+    # ---------- Dispatch ----------
+    def _request(self, question: str, retrieved_chunks: List[Dict[str, Any]], stream: bool,
+                 cancellation: Optional[CancellationToken] = None):
+        if self._closed:
+            raise RuntimeError("GeneratorPool is closed")
+        inbox: queue.Queue = queue.Queue()
+        with self._lock:
+            # Least loaded: fewest requests in flight, then least busy so far
+            worker = min(self.stats, key=lambda s: (s.in_flight, s.busy_seconds)).worker
+            self.stats[worker].in_flight += 1
+            request_id = next(self._ids)
+            self._pending[request_id] = inbox
+        start = time.perf_counter()
+        limits = None
+        if cancellation is not None:
+            limits = (cancellation.remaining_seconds(), cancellation.max_tokens)
+        self._requests[worker].put((request_id, stream, question, list(retrieved_chunks), limits))
+
+        finished = stopping = False
+        try:
+            while True:
+                if cancellation is not None and not stopping and cancellation.cancelled:
+                    self._cancel_ids[worker].value = request_id
+                    stopping = True
+                try:
+                    # Poll faster while the caller may cancel
+                    kind, value = inbox.get(timeout=1.0 if cancellation is None else 0.05)
+                except queue.Empty:
+                    if not self._processes[worker].is_alive():
+                        self._finish(worker, request_id, failed=True)
+                        raise RuntimeError(f"LLM worker {worker} died (exit code "
+                                           f"{self._processes[worker].exitcode})") from None
+                    continue
+                if kind == "error":
+                    finished = True
+                    raise RuntimeError(f"LLM worker {worker} failed: {value}")
+                if kind == "done":
+                    finished = True
+                    answer, seconds, reason = value
+                    if reason is not None and cancellation is not None:
+                        cancellation.cancel(reason)
+                    with self._lock:
+                        stats = self.stats[worker]
+                        stats.busy_seconds += seconds
+                        stats.output_chars += len(answer)
+                        stats.latencies.append(time.perf_counter() - start)
+                    yield "done", answer
+                    return
+                yield kind, value
+        finally:
+            if not finished and self._processes[worker].is_alive():
+                # Abandoned stream: free the worker for the next request
+                self._cancel_ids[worker].value = request_id
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def _read_results(self) -> None:
+        # Polls instead of waiting for a sentinel: a worker that died while
+        # writing can leave the shared results queue unusable
+        while not self._stop.is_set():
+            try:
+                message = self._results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            kind, worker, request_id, value = message
+            if kind in ("done", "error"):
+                self._finish(worker, request_id, failed=kind == "error")
+            with self._lock:
+                inbox = self._pending.get(request_id)
+            if inbox is not None:
+                inbox.put((kind, value))
+
+    def _finish(self, worker: int, request_id: int, failed: bool) -> None:
+        with self._lock:
+            stats = self.stats[worker]
+            stats.in_flight = max(0, stats.in_flight - 1)
+            if failed:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+
+    # ---------- Lifecycle ----------
+    def close(self, timeout: float = 30.0) -> None:
+        """Let the workers finish their current request and exit."""
+        self._closed = True
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        if getattr(self, "_reader", None) is not None:
+            self._stop.set()
+            self._reader.join(timeout)
+
+    def __enter__(self) -> "GeneratorPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def print_generator_pool_stats(pool: GeneratorPool) -> None:
+    total = sum(s.answers_per_minute for s in pool.stats)
+    print("\n" + "=" * 70)
+    print(f"LLM WORKER POOL ({pool.n_workers} workers x {pool.threads_per_worker} threads, "
+          f"{total:.1f} answers/min)")
+    print("=" * 70)
+    print(f"{'worker':<8}{'pid':>8}{'done':>7}{'failed':>8}{'busy':>7}{'ans/min':>9}{'p50 s':>8}{'p95 s':>8}")
+    for s in pool.stats:
+        print(f"{s.worker:<8}{s.pid:>8}{s.completed:>7}{s.failed:>8}{s.utilization:>7.0%}"
+              f"{s.answers_per_minute:>9.1f}{s.latency_percentile(50):>8.2f}{s.latency_percentile(95):>8.2f}")
+    print("=" * 70)
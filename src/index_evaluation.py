@@ -0,0 +1,160 @@
+"""
+index_evaluation.py
+
+Recall / latency / memory trade-off report for the FAISS index types
+supported by ComplaintVectorStore.
+
+Responsibilities:
+- Build each candidate index (flat, fp16 / int8 / PQ compressed, IVF-Flat,
+  IVF-PQ, HNSW) over the same vectors, training on a random sample
+- Sweep the query-time knobs (nprobe / efSearch, and the rerank factor
+  over full-precision vectors) of each index
+- Measure recall@k against exact float32 search, single-query p50 / p99
+  latency and index memory relative to float32
+- Print a table to pick a configuration for a deployment size
+
+Public API:
+- IndexReport
+- recall_at_k(...)
+- evaluate_index_configs(...)
+- print_index_report(...)
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from .vector_store import ComplaintVectorStore, create_index, default_nlist, default_train_size
+
+
+@dataclass
+class IndexReport:
+    """Quality and cost of one index configuration at one query-time setting."""
+
+    config: str
+    build_seconds: float
+    size_mb: float
+    recall: float
+    p50_ms: float
+    p99_ms: float
+    disk_mb: float = 0.0      # full-precision vectors read from disk when re-ranking
+    float32_mb: float = 0.0   # size of the raw float32 vectors, the flat-index baseline
+
+    @property
+    def compression(self) -> float:
+        """How many times smaller than the float32 vectors the index is."""
+        return self.float32_mb / self.size_mb if self.size_mb else 0.0
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k ids that were retrieved, over all queries."""
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+_QUERY_KNOBS = ("index_type", "nprobe", "ef_search", "rerank")
+
+
+def _search_one_by_one(store: ComplaintVectorStore, queries: np.ndarray, k: int, **knobs):
+    """Run queries individually (as the chatbot does) and time each one."""
+    ids = np.empty((len(queries), k), dtype="int64")
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids[i:i + 1] = store.search_ids(queries[i:i + 1], k, normalize=False, **knobs)
+        latencies[i] = time.perf_counter() - start
+    return ids, latencies * 1000
+
+
+def _config_name(config: Dict[str, Any]) -> str:
+    options = ", ".join(f"{k}={v}" for k, v in config.items() if k not in _QUERY_KNOBS)
+    return f"{config['index_type']}({options})" if options else config["index_type"]
+
+
+def evaluate_index_configs(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    configs: Sequence[Dict[str, Any]],
+    k: int = 5,
+    normalize: bool = True,
+    train_size: Optional[int] = None,
+    seed: int = 42,
+) -> List[IndexReport]:
+    """
+    Build every index configuration over ``vectors`` and report its recall@k
+    and latency on ``queries``.
+
+    Each config is a dict with ``index_type`` plus create_index options, and
+    optionally a list of ``nprobe`` (IVF) or ``ef_search`` (HNSW) values to
+    sweep, e.g. ``{"index_type": "ivf_flat", "nlist": 256, "nprobe": [1, 8, 32]}``.
+    A list of ``rerank`` factors re-scores ``rerank * k`` candidates against
+    the float32 vectors, as ComplaintVectorStore.search(rerank=...) does
+    with its memory-mapped copy, e.g. ``{"index_type": "pq", "rerank": [0, 4]}``.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    if normalize:
+        vectors, queries = vectors.copy(), queries.copy()
+        faiss.normalize_L2(vectors)
+        faiss.normalize_L2(queries)
+
+    exact = create_index("flat", vectors.shape[1], normalize)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rng = np.random.default_rng(seed)
+    reports: List[IndexReport] = []
+    for config in configs:
+        options = {key: value for key, value in config.items() if key not in _QUERY_KNOBS}
+        if config["index_type"] in ("ivf_flat", "ivf_pq"):
+            options.setdefault("nlist", default_nlist(len(vectors)))
+
+        start = time.perf_counter()
+        index = create_index(config["index_type"], vectors.shape[1], normalize, **options)
+        if not index.is_trained:
+            n_train = min(len(vectors), train_size or default_train_size(
+                config["index_type"], options.get("nlist"), options.get("pq_bits", 8)))
+            index.train(vectors[np.sort(rng.choice(len(vectors), size=n_train, replace=False))])
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(index)) / 1e6
+        store = ComplaintVectorStore(index=index)
+        store.full_vectors = vectors
+
+        knob = next((name for name in ("nprobe", "ef_search") if name in config), None)
+        name = _config_name({"index_type": config["index_type"], **options})
+        for value in config[knob] if knob else [None]:
+            for rerank in config.get("rerank", [0]):
+                knobs = {knob: value} if knob else {}
+                ids, latencies = _search_one_by_one(store, queries, k, rerank=rerank, **knobs)
+                label = " ".join([name] + [f"{key}={v}" for key, v in knobs.items()]
+                                 + ([f"rerank={rerank}"] if rerank > 1 else []))
+                reports.append(IndexReport(
+                    config=label,
+                    build_seconds=build_seconds,
+                    size_mb=size_mb,
+                    recall=recall_at_k(ids, truth),
+                    p50_ms=float(np.percentile(latencies, 50)),
+                    p99_ms=float(np.percentile(latencies, 99)),
+                    disk_mb=vectors.nbytes / 1e6 if rerank > 1 else 0.0,
+                    float32_mb=vectors.nbytes / 1e6,
+                ))
+    return reports
+
+
+def print_index_report(reports: Sequence[IndexReport], k: int, num_vectors: int) -> None:
+    print("\n" + "=" * 70)
+    print(f"INDEX TRADE-OFF REPORT ({num_vectors:,} vectors, recall@{k} vs exact float32)")
+    print("=" * 70)
+    print(f"{'config':<48}{'recall':>8}{'p50 ms':>9}{'p99 ms':>9}{'build s':>9}"
+          f"{'RAM MB':>9}{'vs f32':>8}{'disk MB':>9}")
+    for r in reports:
+        print(f"{r.config:<48}{r.recall:>8.3f}{r.p50_ms:>9.3f}{r.p99_ms:>9.3f}{r.build_seconds:>9.1f}"
+              f"{r.size_mb:>9.1f}{r.compression:>7.1f}x{r.disk_mb:>9.1f}")
+    print("=" * 70)
@@ -0,0 +1,191 @@
+"""
+lexical_index.py
+
+Sparse BM25 inverted index over the (already cleaned) chunk texts.
+
+Responsibilities:
+- Tokenise chunk texts and build term -> chunk posting lists as CSR arrays
+  (indptr / doc_ids / impacts), with the BM25 weight of every posting
+  precomputed so a query is a gather plus a bincount
+- Return top-n lexical candidates for a query, to narrow dense scoring or
+  to fuse with the dense ranking
+- Save / load the arrays as a single .npz file
+
+Row ids are FAISS ids of the ComplaintVectorStore the texts came from.
+Chunks added to the store after the index was built are not covered until
+it is rebuilt.
+
+Public API:
+- tokenize(...)
+- BM25Index
+- reciprocal_rank_fusion(...)
+"""
+
+from __future__ import annotations
+
+import itertools
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens (the chunks are already cleaned by the preprocessor)."""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class BM25Index:
+    """
+    BM25 inverted index stored as CSR arrays.
+
+    Postings of term ``t`` are ``doc_ids[indptr[t]:indptr[t + 1]]`` with
+    precomputed BM25 impacts in ``impacts`` at the same positions.
+
+    Parameters
+    ----------
+    vocabulary : dict
+        term -> term id
+    indptr, doc_ids, impacts : np.ndarray
+        CSR arrays (int64, int32, float32)
+    num_docs : int
+        Number of indexed chunks
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray,
+                 impacts: np.ndarray, num_docs: int):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.num_docs = num_docs
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75,
+              batch_size: int = 10_000) -> "BM25Index":
+        """
+        Index every text; the position in ``texts`` is the row id.
+
+        Texts are tokenised ``batch_size`` at a time and each batch is reduced
+        to compact (term, doc, tf) arrays, so only one batch of token ids is
+        ever held as Python ints.
+        """
+        vocabulary: Dict[str, int] = {}
+        length_parts: List[np.ndarray] = [np.empty(0, dtype="int32")]
+        term_parts: List[np.ndarray] = [np.empty(0, dtype="int32")]
+        doc_parts: List[np.ndarray] = [np.empty(0, dtype="int32")]
+        tf_parts: List[np.ndarray] = [np.empty(0, dtype="int32")]
+        num_docs = 0
+        texts = iter(texts)
+        while True:
+            batch = list(itertools.islice(texts, batch_size))
+            if not batch:
+                break
+            lengths = np.empty(len(batch), dtype="int64")
+            term_ids: List[int] = []
+            for i, text in enumerate(batch):
+                tokens = tokenize(text)
+                lengths[i] = len(tokens)
+                term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+
+            # Term frequency per (term, doc) pair of this batch
+            docs = np.repeat(np.arange(len(batch), dtype="int64"), lengths)
+            pairs, tf = np.unique(np.asarray(term_ids, dtype="int64") * len(batch) + docs, return_counts=True)
+            batch_terms, batch_docs = np.divmod(pairs, len(batch))
+            length_parts.append(lengths.astype("int32"))
+            term_parts.append(batch_terms.astype("int32"))
+            doc_parts.append((batch_docs + num_docs).astype("int32"))
+            tf_parts.append(tf.astype("int32"))
+            num_docs += len(batch)
+
+        lengths = np.concatenate(length_parts)
+        # Batches cover increasing doc ids, so a stable sort by term keeps each posting list sorted by doc
+        posting_terms = np.concatenate(term_parts)
+        order = np.argsort(posting_terms, kind="stable")
+        posting_terms = posting_terms[order]
+        posting_docs = np.concatenate(doc_parts)[order]
+        tf = np.concatenate(tf_parts)[order]
+        del term_parts, doc_parts, tf_parts, order
+
+        df = np.bincount(posting_terms, minlength=len(vocabulary))
+        indptr = np.concatenate([[0], np.cumsum(df)]).astype("int64")
+
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+        avg_length = lengths.mean() if num_docs else 0.0
+        norm = k1 * (1 - b + b * lengths[posting_docs] / max(avg_length, 1e-9))
+        impacts = idf[posting_terms] * tf * (k1 + 1) / (tf + norm)
+        return cls(vocabulary, indptr, posting_docs, impacts.astype("float32"), num_docs)
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def scores(self, query: str, max_df: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (doc_ids, scores) of every chunk sharing a term with ``query``.
+
+        Terms found in more than ``max_df`` of the chunks are skipped: their
+        BM25 weight is small and their posting lists are the longest.
+        """
+        spans = []
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            if end - start <= max_df * self.num_docs:
+                spans.append((start, end))
+        if not spans:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        docs = np.concatenate([self.doc_ids[s:e] for s, e in spans])
+        impacts = np.concatenate([self.impacts[s:e] for s, e in spans])
+        matched, inverse = np.unique(docs, return_inverse=True)
+        return matched.astype("int64"), np.bincount(inverse, weights=impacts).astype("float32")
+
+    def search(self, query: str, k: int = 100, exclude: Optional[np.ndarray] = None,
+               allowed: Optional[np.ndarray] = None, max_df: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k (doc_ids, scores) by BM25, best first. ``exclude`` drops ids
+        (e.g. tombstones); ``allowed`` keeps only the given sorted ids.
+        """
+        docs, scores = self.scores(query, max_df)
+        if exclude is not None and len(exclude) and len(docs):
+            keep = ~np.isin(docs, exclude)
+            docs, scores = docs[keep], scores[keep]
+        if allowed is not None and len(docs):
+            keep = np.isin(docs, allowed, assume_unique=True)
+            docs, scores = docs[keep], scores[keep]
+        if len(docs) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return docs[order], scores[order]
+
+    # ---------- Persistence ----------
+    def save(self, path: str) -> None:
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, term_id in self.vocabulary.items():
+            terms[term_id] = term
+        np.savez(path, terms=terms.astype(str), indptr=self.indptr, doc_ids=self.doc_ids,
+                 impacts=self.impacts, num_docs=np.array(self.num_docs))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            vocabulary = {term: i for i, term in enumerate(data["terms"].tolist())}
+            return cls(vocabulary, data["indptr"], data["doc_ids"], data["impacts"], int(data["num_docs"]))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int,
+                           constant: int = 60) -> Tuple[List[int], List[float]]:
+    """
+    Fuse several rankings of row ids, best first: score(id) is the sum over
+    rankings of 1 / (constant + rank). Returns the top-k (ids, scores).
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (constant + rank)
+    top = sorted(fused, key=fused.get, reverse=True)[:k]
+    return top, [fused[row] for row in top]
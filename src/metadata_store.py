@@ -0,0 +1,246 @@
+"""
+metadata_store.py
+
+Columnar, memory-mapped storage for chunk texts and metadata.
+
+ComplaintVectorStore used to keep every chunk text and metadata dict in one
+JSON file that had to be parsed fully at startup. This module stores them in
+an uncompressed Arrow IPC file instead: opening it memory-maps the file, and
+a row is only decoded into Python objects when a search returns its FAISS id.
+Load time and resident memory therefore stay roughly flat as the corpus grows.
+
+Layout: one row per FAISS id with a ``text`` string column and a ``metadata``
+struct column; tombstoned ids are kept in the schema metadata.
+
+Public API:
+- LazyColumn
+- ArrowMetadataWriter
+- write_metadata_arrow(...)
+- open_metadata_arrow(...)
+- migrate_metadata_json(...)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TEXT_COLUMN = "text"
+METADATA_COLUMN = "metadata"
+DELETED_IDS_KEY = b"deleted_ids"
+
+
+def is_arrow_path(path: str) -> bool:
+    """Metadata paths ending in .arrow use the columnar store; anything else is legacy JSON."""
+    return str(path).lower().endswith(".arrow")
+
+
+# ----------------------------
+# Lazy column view
+# ----------------------------
+
+class LazyColumn:
+    """
+    List-like view over a memory-mapped Arrow column plus an in-memory tail.
+
+    Indexing decodes a single row; rows appended after loading (incremental
+    ingestion) live in the tail until the store is saved again.
+    """
+
+    def __init__(self, mapped: pa.ChunkedArray, tail: Optional[List[Any]] = None):
+        self.mapped = mapped
+        self._mapped_len = len(mapped)
+        self.tail: List[Any] = tail or []
+
+    def __len__(self) -> int:
+        return self._mapped_len + len(self.tail)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < self._mapped_len:
+            return self.mapped[idx].as_py()
+        return self.tail[idx - self._mapped_len]
+
+    def __iter__(self) -> Iterator[Any]:
+        for chunk in self.mapped.iterchunks():
+            yield from chunk.to_pylist()
+        yield from self.tail
+
+    def append(self, value: Any) -> None:
+        self.tail.append(value)
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self.tail.extend(values)
+
+    def take(self, rows: Sequence[int]) -> List[Any]:
+        """Decode several rows at once (faster than indexing one by one)."""
+        mapped_rows = [r for r in rows if r < self._mapped_len]
+        decoded = iter(self.mapped.take(pa.array(mapped_rows, type=pa.int64())).to_pylist()) if mapped_rows else iter(())
+        return [next(decoded) if r < self._mapped_len else self.tail[r - self._mapped_len] for r in rows]
+
+    def field(self, name: str) -> List[Any]:
+        """Values of one struct field for every row, without decoding whole rows."""
+        if not self._mapped_len:
+            values = []
+        elif pa.types.is_struct(self.mapped.type) and self.mapped.type.get_field_index(name) != -1:
+            values = pc.struct_field(self.mapped, name).to_pylist()
+        else:
+            # No saved row has the field (partial metadata): None, as dict.get gives
+            values = [None] * self._mapped_len
+        return values + [row.get(name) if isinstance(row, dict) else None for row in self.tail]
+
+    def to_arrow(self) -> pa.Array:
+        if not self.tail:
+            return self.mapped.combine_chunks()
+        try:
+            tail = pa.array(self.tail, type=self.mapped.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return _to_array(list(self))
+        return pa.concat_arrays(self.mapped.chunks + [tail])
+
+
+def metadata_field(metadatas: Sequence[Dict[str, Any]], name: str) -> List[Any]:
+    """One metadata field for every row, for lists of dicts and LazyColumns alike."""
+    if isinstance(metadatas, LazyColumn):
+        return metadatas.field(name)
+    return [meta.get(name) for meta in metadatas]
+
+
+def take_rows(values: Sequence[Any], rows: Sequence[int]) -> List[Any]:
+    if isinstance(values, LazyColumn):
+        return values.take(rows)
+    return [values[i] for i in rows]
+
+
+# ----------------------------
+# Writing
+# ----------------------------
+
+def _to_array(values: List[Any]) -> pa.Array:
+    """Arrow array from Python values; struct fields with mixed types are stored as strings."""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not values or not all(v is None or isinstance(v, dict) for v in values):
+            raise
+    keys: Dict[str, None] = {}
+    for value in values:
+        keys.update(dict.fromkeys(value or {}))
+    arrays = []
+    for key in keys:
+        column = [value.get(key) if value else None for value in values]
+        try:
+            arrays.append(pa.array(column))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if v is None else str(v) for v in column], type=pa.string()))
+    return pa.StructArray.from_arrays(arrays, names=list(keys))
+
+
+def _batch(texts: Sequence[str], metadatas: Sequence[Dict[str, Any]], metadata_type=None) -> pa.RecordBatch:
+    metadata = pa.array(list(metadatas), type=metadata_type) if metadata_type is not None else _to_array(list(metadatas))
+    return pa.RecordBatch.from_arrays([pa.array(list(texts), type=pa.string()), metadata],
+                                      names=[TEXT_COLUMN, METADATA_COLUMN])
+
+
+class ArrowMetadataWriter:
+    """
+    Incremental writer: appends each batch to the IPC file as it arrives, so a
+    build never re-serialises rows it already wrote. The first batch fixes the
+    metadata schema. The file is written under a temporary name and renamed
+    into place by close().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+        self._metadata_type = None
+        self.num_rows = 0
+
+    def write(self, texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        if not len(texts):
+            return
+        batch = _batch(texts, metadatas, self._metadata_type)
+        if self._writer is None:
+            self._metadata_type = batch.schema.field(METADATA_COLUMN).type
+            self._writer = pa.ipc.new_file(self._tmp_path, batch.schema)
+        self._writer.write_batch(batch)
+        self.num_rows += len(texts)
+
+    def write_arrays(self, texts: pa.Array, metadatas: pa.StructArray) -> None:
+        """Columnar variant of write(): no per-row Python objects are created."""
+        if not len(texts):
+            return
+        if self._metadata_type is not None and metadatas.type != self._metadata_type:
+            metadatas = metadatas.cast(self._metadata_type)
+        batch = pa.RecordBatch.from_arrays([texts, metadatas], names=[TEXT_COLUMN, METADATA_COLUMN])
+        if self._writer is None:
+            self._metadata_type = metadatas.type
+            self._writer = pa.ipc.new_file(self._tmp_path, batch.schema)
+        self._writer.write_batch(batch)
+        self.num_rows += len(texts)
+
+    def close(self) -> None:
+        if self._writer is None:
+            schema = pa.schema([(TEXT_COLUMN, pa.string()), (METADATA_COLUMN, pa.struct([]))])
+            self._writer = pa.ipc.new_file(self._tmp_path, schema)
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def write_metadata_arrow(
+    path: str,
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    deleted_ids: Iterable[int] = (),
+    batch_size: int = 65_536,
+) -> None:
+    """Write texts and metadata (lists or LazyColumns) as a memory-mappable Arrow IPC file."""
+    if isinstance(texts, LazyColumn) and isinstance(metadatas, LazyColumn):
+        table = pa.table({TEXT_COLUMN: texts.to_arrow(), METADATA_COLUMN: metadatas.to_arrow()})
+    else:
+        table = pa.Table.from_batches([_batch(list(texts), list(metadatas))])
+
+    deleted = sorted(deleted_ids)
+    if deleted:
+        table = table.replace_schema_metadata({DELETED_IDS_KEY: json.dumps(deleted).encode("utf-8")})
+
+    # Written next to the target and renamed: the old file may still be memory-mapped
+    tmp_path = f"{path}.tmp"
+    with pa.ipc.new_file(tmp_path, table.schema) as writer:
+        writer.write_table(table, max_chunksize=batch_size)
+    os.replace(tmp_path, path)
+
+
+# ----------------------------
+# Reading
+# ----------------------------
+
+def open_metadata_arrow(path: str) -> Tuple[LazyColumn, LazyColumn, List[int]]:
+    """
+    Memory-map a metadata file; returns (texts, metadatas, deleted_ids).
+
+    Nothing is decoded up front: the views fetch rows lazily by FAISS id.
+    """
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    schema_meta = table.schema.metadata or {}
+    deleted = json.loads(schema_meta[DELETED_IDS_KEY]) if DELETED_IDS_KEY in schema_meta else []
+    return LazyColumn(table.column(TEXT_COLUMN)), LazyColumn(table.column(METADATA_COLUMN)), deleted
+
+
+def migrate_metadata_json(json_path: str, arrow_path: str) -> int:
+    """
+    Convert an existing metadata.json (as written by from_parquet / save) to
+    the columnar format. Returns the number of rows written.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    write_metadata_arrow(arrow_path, payload["texts"], payload["metadatas"], payload.get("deleted_ids", []))
+    return len(payload["texts"])
@@ -0,0 +1,72 @@
+"""
+parallel.py
+
+Shared helpers for the multi-process batch stages (preprocessing, chunking,
+embedding).
+
+Public API:
+- WorkerThroughput
+- ordered_map(...)
+- print_worker_throughput(...)
+"""
+
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+
+@dataclass
+class WorkerThroughput:
+    """Throughput counters for one worker process."""
+    pid: int
+    batches: int = 0
+    rows_in: int = 0
+    rows_out: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_in / self.seconds if self.seconds else 0.0
+
+    def record(self, rows_in: int, rows_out: int, seconds: float) -> None:
+        self.batches += 1
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+        self.seconds += seconds
+
+
+def ordered_map(
+    executor: Executor,
+    fn: Callable[..., Any],
+    items: Iterable[Any],
+    max_pending: int,
+    *args: Any,
+) -> Iterator[Any]:
+    """
+    Like executor.map(fn, items), but lazy: at most ``max_pending`` items are
+    submitted ahead of the consumer, so memory stays bounded for unbounded
+    inputs. Results are yielded in input order.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def print_worker_throughput(title: str, stats: Dict[int, WorkerThroughput], elapsed: float) -> None:
+    """Print overall and per-worker throughput of a finished stage."""
+    rows_in = sum(w.rows_in for w in stats.values())
+    rows_out = sum(w.rows_out for w in stats.values())
+    print("="*70)
+    print(title)
+    print(f"Rows read: {rows_in:,} | Rows written: {rows_out:,} | "
+          f"{rows_in / max(elapsed, 1e-9):,.0f} rows/sec overall")
+    print("-"*70)
+    for worker in sorted(stats.values(), key=lambda w: w.pid):
+        print(f"Worker {worker.pid}: {worker.batches} batches, {worker.rows_in:,} rows, "
+              f"{worker.rows_per_sec:,.0f} rows/sec")
+    print("="*70)
@@ -5,6 +5,8 @@ Prompt templates for the RAG system.
 Centralizes all prompt formatting for consistency and easy modification.
 """
 
+from typing import Tuple
+
 # ----------------------------
 # RAG Prompt Template
 # ----------------------------
@@ -39,3 +41,17 @@ def format_rag_prompt(context: str, question: str) -> str:
     Format the RAG analyst prompt with retrieved context and user question.
     """
     return RAG_ANALYST_PROMPT.format(context=context, question=question)
+
+
+def split_rag_prompt(template: str = RAG_ANALYST_PROMPT) -> Tuple[str, str]:
+    """
+    Split a prompt template into its static prefix (everything before the
+    first placeholder, identical for every request) and the templated rest.
+
+    ``prefix + rest.format(context=..., question=...)`` equals
+    ``template.format(context=..., question=...)``.
+    """
+    cut = template.find("{")
+    if cut < 0:
+        return template, ""
+    return template[:cut], template[cut:]
@@ -8,14 +8,25 @@ Features:
 - Initializes retriever
 - Initializes CPU-friendly Mistral generator
 - Provides a single run(question, k) method
+- Optional semantic answer cache for rephrased repeat questions
+- Loads the vector store, the embedder and the LLM in parallel, optionally
+  in the background
+- Optionally serves the LLM from a pool of worker processes (generator_pool.py)
+- Streams answers (sources first, then tokens) with latency metrics
+- Stops generations that are cancelled, past their deadline or over their
+  token budget (CancellationToken), and counts them
 
 Designed to be imported and used in Jupyter notebooks, pipelines, or scripts.
 """
 
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 
-from .retriever import build_retriever, ComplaintRetriever
+from .cache import SemanticAnswerCache
+from .retriever import build_embedder, load_vector_store, ComplaintRetriever
 from .generator import build_generator, RAGGenerator
+from .startup import BackgroundLoader
+from .streaming import CancellationToken, GenerationMetrics, MeteredStream, iterate_in_thread
 
 
 class RAGPipeline:
@@ -30,18 +41,96 @@ class RAGPipeline:
         Path to metadata JSON
     llm_model_path : str
         Path to quantized GGUF Mistral model
+    answer_cache : SemanticAnswerCache, optional
+        Reuse answers of near-duplicate questions that retrieve the same chunks
+    background : bool
+        Return immediately and load the components in background threads;
+        ``ready`` is set once they are in, and the first use of
+        ``retriever`` / ``generator`` waits for them
+    mmap_index : bool
+        Memory-map the FAISS index instead of reading it into RAM
+    llm_workers : int
+        Number of llama.cpp worker processes (1: in-process RAGGenerator)
+    llm_threads : int, optional
+        llama.cpp threads per model instance
+    llm_prompt_lookup_tokens : int
+        Draft tokens per step for prompt-lookup speculative decoding (0: off)
     """
 
+    # stop_counts key of streams closed by the consumer without a cancellation
+    CLOSED = "closed"
+
     def __init__(
         self,
         faiss_index_path: str,
         meta_path: str,
         llm_model_path: str,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        background: bool = False,
+        mmap_index: bool = False,
+        verbose: bool = True,
+        llm_workers: int = 1,
+        llm_threads: Optional[int] = None,
+        llm_prompt_lookup_tokens: int = 0,
     ):
-        self.retriever: ComplaintRetriever = build_retriever(faiss_index_path, meta_path)
-        self.generator: RAGGenerator = build_generator(llm_model_path)
+        self.answer_cache = answer_cache
+        self.llm_workers = llm_workers
+        # Generations stopped early, by CancellationToken reason (or CLOSED)
+        self.stop_counts: Dict[str, int] = {CancellationToken.CANCELLED: 0, CancellationToken.DEADLINE: 0,
+                                            CancellationToken.MAX_TOKENS: 0, self.CLOSED: 0}
+        generator_options: Dict[str, Any] = {}
+        if llm_workers > 1:
+            generator_options["n_workers"] = llm_workers
+        if llm_threads is not None:
+            generator_options["n_threads"] = llm_threads
+        if llm_prompt_lookup_tokens > 0:
+            generator_options["prompt_lookup_tokens"] = llm_prompt_lookup_tokens
+        self._retriever: Optional[ComplaintRetriever] = None
+        self._generator: Optional[RAGGenerator] = None
+        # The vector store (index, metadata), the embedder and the LLM load in parallel
+        self.loader = BackgroundLoader({
+            "vector_store": lambda: load_vector_store(faiss_index_path, meta_path, mmap=mmap_index),
+            "embedder": build_embedder,
+            "generator": lambda: build_generator(llm_model_path, **generator_options),
+        }, verbose=verbose)
+        if not background:
+            self.retriever = self._build_retriever()
+            self.generator = self.loader.result("generator")
+
+    def _build_retriever(self) -> ComplaintRetriever:
+        return ComplaintRetriever(vector_store=self.loader.result("vector_store"),
+                                  embedder=self.loader.result("embedder"))
+
+    @property
+    def retriever(self) -> ComplaintRetriever:
+        if self._retriever is None:
+            self._retriever = self._build_retriever()
+        return self._retriever
+
+    @retriever.setter
+    def retriever(self, value: ComplaintRetriever) -> None:
+        self._retriever = value
+
+    @property
+    def generator(self) -> RAGGenerator:
+        if self._generator is None:
+            self._generator = self.loader.result("generator")
+        return self._generator
+
+    @generator.setter
+    def generator(self, value: RAGGenerator) -> None:
+        self._generator = value
+
+    @property
+    def ready(self) -> bool:
+        """True once every component has loaded."""
+        return self.loader.ready.is_set()
 
-    def run(self, question: str, k: int = 5) -> str:
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        return self.loader.wait(timeout)
+
+    def run(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+            cancellation: Optional[CancellationToken] = None) -> str:
         """
         Retrieve top-k relevant chunks and generate a grounded answer.
 
@@ -51,14 +140,142 @@ class RAGPipeline:
             User question
         k : int
             Number of chunks to retrieve
+        filters : dict, optional
+            Metadata restrictions (see ComplaintRetriever.retrieve)
+        cancellation : CancellationToken, optional
+            Stops generation early when cancelled, past its deadline or
+            over its token budget (the partial answer is returned)
 
         Returns
         -------
         str
             LLM-generated answer
         """
-        retrieved_chunks: List[Dict[str, Any]] = self.retriever.retrieve(question, k=k)
-        return self.generator.generate(question, retrieved_chunks)
+        if self.answer_cache is not None:
+            return self.answer(question, k=k, filters=filters, cancellation=cancellation)["answer"]
+        retrieved_chunks: List[Dict[str, Any]] = self.retrieve(question, k=k, filters=filters)
+        answer = self.generator.generate(question, retrieved_chunks, **self._generation_options(cancellation))
+        self._record_stop(cancellation)
+        return answer
+
+    def answer(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+               cancellation: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """
+        Like run(), but also returns the sources and whether the answer came
+        from the semantic answer cache.
+
+        Returns
+        -------
+        dict with keys: answer, sources, cached (and stop_reason when
+        ``cancellation`` stopped the generation early)
+        """
+        retrieved_chunks = self.retrieve(question, k=k, filters=filters)
+        hit = self.cached_answer(question, retrieved_chunks)
+        if hit is not None:
+            return hit
+
+        answer = self.generator.generate(question, retrieved_chunks, **self._generation_options(cancellation))
+        stop_reason = self._record_stop(cancellation)
+        if stop_reason is not None:
+            # Partial answers are not cached
+            return {"answer": answer, "sources": retrieved_chunks, "cached": False, "stop_reason": stop_reason}
+        self.remember_answer(question, retrieved_chunks, answer)
+        return {"answer": answer, "sources": retrieved_chunks, "cached": False}
+
+    def stream(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+               cancellation: Optional[CancellationToken] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Like answer(), but yields the result as it is produced.
+
+        Yields
+        ------
+        ("sources", chunks)
+            The retrieved chunks, before generation starts
+        ("token", text)
+            Answer pieces (a cached answer comes as a single piece)
+        ("done", dict)
+            answer()-style dict plus ``metrics`` (GenerationMetrics: time
+            to first token, tokens/sec, total latency from the call, and
+            ``stop_reason`` if ``cancellation`` stopped it early)
+
+        Closing the iterator early stops the generation. It is counted under
+        the reason of ``cancellation`` if that was already stopped, and as
+        "closed" otherwise.
+        """
+        start = time.perf_counter()
+        retrieved_chunks = self.retrieve(question, k=k, filters=filters)
+        yield "sources", retrieved_chunks
+
+        hit = self.cached_answer(question, retrieved_chunks)
+        if hit is not None:
+            elapsed = time.perf_counter() - start
+            yield "token", hit["answer"]
+            yield "done", {**hit, "metrics": GenerationMetrics(first_token_seconds=elapsed,
+                                                               total_seconds=elapsed, tokens=1)}
+            return
+
+        pieces = self.generator.stream(question, retrieved_chunks, **self._generation_options(cancellation))
+        tokens = MeteredStream(pieces, start=start)
+        try:
+            for piece in tokens:
+                yield "token", piece
+        except GeneratorExit:
+            # The consumer went away: stop the model now rather than at max_tokens
+            if self._record_stop(cancellation) is None:
+                self.stop_counts[self.CLOSED] = self.stop_counts.get(self.CLOSED, 0) + 1
+                if cancellation is not None:
+                    cancellation.cancel(self.CLOSED)
+            getattr(pieces, "close", lambda: None)()
+            raise
+        answer = tokens.text.strip()
+        tokens.metrics.stop_reason = self._record_stop(cancellation)
+        if tokens.metrics.stop_reason is None:
+            self.remember_answer(question, retrieved_chunks, answer)
+        yield "done", {"answer": answer, "sources": retrieved_chunks, "cached": False,
+                       "metrics": tokens.metrics}
+
+    def astream(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                cancellation: Optional[CancellationToken] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """stream() for asyncio: retrieval and generation run in a worker thread."""
+        return iterate_in_thread(self.stream(question, k=k, filters=filters, cancellation=cancellation))
+
+    @staticmethod
+    def _generation_options(cancellation: Optional[CancellationToken]) -> Dict[str, Any]:
+        return {} if cancellation is None else {"cancellation": cancellation}
+
+    def _record_stop(self, cancellation: Optional[CancellationToken]) -> Optional[str]:
+        """Count a generation stopped early; returns the reason (None if it ran to the end)."""
+        if cancellation is None or cancellation.reason is None:
+            return None
+        self.stop_counts[cancellation.reason] = self.stop_counts.get(cancellation.reason, 0) + 1
+        return cancellation.reason
+
+    def retrieve(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Top-k chunks for a question (the retrieval half of run())."""
+        if filters:
+            return self.retriever.retrieve(question, k=k, filters=filters)
+        return self.retriever.retrieve(question, k=k)
+
+    def cached_answer(self, question: str, retrieved_chunks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """answer()-style result from the semantic answer cache, or None."""
+        if self.answer_cache is None:
+            return None
+        # The retriever's embedding cache makes this a lookup, not a second forward pass
+        embedding = self.retriever.embed_question(question)
+        version = getattr(self.retriever.vector_store, "version", None)
+        hit = self.answer_cache.lookup(embedding, retrieved_chunks, version)
+        if hit is None:
+            return None
+        answer, sources = hit
+        return {"answer": answer, "sources": sources, "cached": True}
+
+    def remember_answer(self, question: str, retrieved_chunks: List[Dict[str, Any]], answer: str) -> None:
+        """Add a generated answer to the semantic answer cache (if any)."""
+        if self.answer_cache is None:
+            return
+        embedding = self.retriever.embed_question(question)
+        version = getattr(self.retriever.vector_store, "version", None)
+        self.answer_cache.store(embedding, retrieved_chunks, answer, version)
 
 
 # ----------------------------
@@ -69,8 +286,17 @@ def build_rag_pipeline(
     faiss_index_path: str,
     meta_path: str,
     llm_model_path: str,
+    answer_cache: Optional[SemanticAnswerCache] = None,
+    background: bool = False,
+    mmap_index: bool = False,
+    llm_workers: int = 1,
+    llm_threads: Optional[int] = None,
+    llm_prompt_lookup_tokens: int = 0,
 ) -> RAGPipeline:
     """Build and return a reusable RAGPipeline instance."""
-    return RAGPipeline(faiss_index_path, meta_path, llm_model_path)
+    return RAGPipeline(faiss_index_path, meta_path, llm_model_path, answer_cache=answer_cache,
+                       background=background, mmap_index=mmap_index,
+                       llm_workers=llm_workers, llm_threads=llm_threads,
+                       llm_prompt_lookup_tokens=llm_prompt_lookup_tokens)
 
 
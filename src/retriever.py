@@ -8,21 +8,26 @@ pipelines, notebooks, or RAG systems.
 
 Responsibilities:
 - Load an existing ComplaintVectorStore
-- Embed user questions with all-MiniLM-L6-v2
-- Run top-k similarity search
+- Embed user questions with all-MiniLM-L6-v2 (cached by normalised question)
+- Run top-k similarity search, optionally restricted by metadata filters
+- Batch many questions into one encoder call and one matrix search
+- Hybrid mode: BM25 candidates (lexical_index.py) scored densely, or fused
+  with the dense ranking
 
 Public API:
 - ComplaintRetriever
 - build_retriever(...)
+- build_embedder(...), load_vector_store(...)
 """
 
 from __future__ import annotations
 
-from typing import List, Dict, Any, Protocol
+from typing import Callable, List, Dict, Any, Optional, Protocol
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
+from .cache import CachedEmbedder
+from .lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
 from .vector_store import ComplaintVectorStore
 
 
@@ -33,16 +38,31 @@ from .vector_store import ComplaintVectorStore
 class Embedder(Protocol):
     def encode(self, text: str) -> np.ndarray: ...
 
+    # Optional: encode_batch(texts: List[str]) -> np.ndarray of shape (len(texts), dim).
+    # Embedders without it are called once per text by retrieve_many.
+
 
 # ----------------------------
 # Default embedder
 # ----------------------------
 
+# sentence_transformers pulls in torch, so it is imported on first use
+SentenceTransformer = None
+
+
+def _sentence_transformer_class():
+    global SentenceTransformer
+    if SentenceTransformer is None:
+        from sentence_transformers import SentenceTransformer as _SentenceTransformer
+        SentenceTransformer = _SentenceTransformer
+    return SentenceTransformer
+
+
 class MiniLMEmbedder:
     """Reusable embedder wrapper for all-MiniLM-L6-v2."""
 
     def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+        self.model = _sentence_transformer_class()(model_name)
 
     def encode(self, text: str) -> np.ndarray:
         embedding = self.model.encode(
@@ -53,6 +73,16 @@ class MiniLMEmbedder:
         )
         return embedding.astype("float32")
 
+    def encode_batch(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=False,
+        )
+        return embeddings.astype("float32")
+
 
 # ----------------------------
 # Retriever
@@ -68,40 +98,185 @@ class ComplaintRetriever:
         Loaded FAISS vector store
     embedder : Embedder
         Any object implementing encode(text) -> np.ndarray
+    lexical_index : BM25Index, optional
+        BM25 index over the same chunks (row id = FAISS id), needed by the
+        "hybrid" and "fusion" modes
+    mode : str
+        Default retrieval mode:
+        - "dense": FAISS search only
+        - "hybrid": top ``num_candidates`` BM25 chunks, re-scored densely
+        - "fusion": reciprocal rank fusion of the dense and BM25 rankings
+    num_candidates : int
+        Number of BM25 candidates for "hybrid" / "fusion"
+    query_transform : callable, optional
+        Applied to the question before the BM25 lookup. The index is built
+        over preprocessed chunks (stopwords removed, lemmatized), so pass
+        ComplaintPreprocessor.clean_text for "fees" to match "fee".
     """
 
+    MODES = ("dense", "hybrid", "fusion")
+
     def __init__(
         self,
         vector_store: ComplaintVectorStore,
         embedder: Embedder,
+        lexical_index: Optional[BM25Index] = None,
+        mode: str = "dense",
+        num_candidates: int = 200,
+        query_transform: Optional[Callable[[str], str]] = None,
     ):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {self.MODES}")
         self.vector_store = vector_store
         self.embedder = embedder
+        self.lexical_index = lexical_index
+        self.mode = mode
+        self.num_candidates = num_candidates
+        self.query_transform = query_transform
 
     def embed_question(self, question: str) -> np.ndarray:
         """Convert a user question into an embedding vector."""
         return self.embedder.encode(question)
 
-    def retrieve(self, question: str, k: int = 5) -> List[Dict[str, Any]]:
+    def retrieve(
+        self,
+        question: str,
+        k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
         """
         Retrieve top-k most relevant chunks for a user question.
 
+        Parameters
+        ----------
+        filters : dict, optional
+            Metadata restrictions applied inside the search, e.g.
+            ``{"product_category": "Credit card", "company": "X",
+            "date_received": ("2023-01-01", "2023-12-31")}``.
+            See ComplaintVectorStore.search.
+        mode : str, optional
+            Overrides the retriever's default mode for this call
+
         Returns
         -------
         List[dict] with keys: score, text, metadata
         """
 
+        mode = mode or self.mode
         query_embedding = self.embed_question(question)
+        if mode != "dense" and self.lexical_index is not None:
+            return self._retrieve_lexical(question, query_embedding, k, filters, mode)
+        if filters:
+            return self.vector_store.search(query_embedding, k=k, normalize=True, filters=filters)
         return self.vector_store.search(query_embedding, k=k, normalize=True)
 
+    def _retrieve_lexical(self, question: str, query_embedding: np.ndarray, k: int,
+                          filters: Optional[Dict[str, Any]], mode: str) -> List[Dict[str, Any]]:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {self.MODES}")
+        store = self.vector_store
+        allowed = store.filter_ids(filters) if filters else None
+        deleted = np.fromiter(store.deleted_ids, dtype="int64", count=len(store.deleted_ids))
+        query = question
+        if self.query_transform is not None:
+            # Punctuation is split off first, so "fees?" is lemmatized as "fees"
+            query = self.query_transform(" ".join(tokenize(question)))
+        candidates, _ = self.lexical_index.search(query, self.num_candidates, exclude=deleted, allowed=allowed)
+
+        if mode == "hybrid":
+            if not len(candidates):
+                # No query term is in the index: fall back to dense search
+                return store.search(query_embedding, k=k, normalize=True, filters=filters)
+            return store.search_subset(query_embedding, candidates, k=k, normalize=True)
+
+        _, dense_ids = store.search_ids(query_embedding, k=self.num_candidates, normalize=True, filters=filters)
+        ids, scores = reciprocal_rank_fusion([dense_ids[0][dense_ids[0] != -1], candidates], k)
+        return store.results_for_ids(ids, scores)
+
+    def embed_questions(self, questions: List[str]) -> np.ndarray:
+        """Embed several questions, in one encoder batch when the embedder supports it."""
+        encode_batch = getattr(self.embedder, "encode_batch", None)
+        if encode_batch is not None:
+            return np.asarray(encode_batch(list(questions)), dtype="float32")
+        return np.vstack([self.embedder.encode(q) for q in questions]).astype("float32")
+
+    def retrieve_many(
+        self,
+        questions: List[str],
+        k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve top-k chunks for every question with one batched encode and
+        one matrix search; results are returned in question order.
+
+        In "hybrid" / "fusion" mode (default: the retriever's mode) the
+        encode is still batched, and each question then takes the same
+        lexical path as retrieve().
+        """
+        if not questions:
+            return []
+        mode = mode or self.mode
+        query_embeddings = self.embed_questions(questions)
+        if mode != "dense" and self.lexical_index is not None:
+            return [self._retrieve_lexical(question, embedding, k, filters, mode)
+                    for question, embedding in zip(questions, query_embeddings)]
+        return self.vector_store.search_batch(query_embeddings, k=k, normalize=True, filters=filters)
+
 
 # ----------------------------
 # Factory
 # ----------------------------
 # Add this to the end of src/retriever.py
-def build_retriever(index_path: str, meta_path: str) -> ComplaintRetriever:
-    """Factory function used by the RAGPipeline."""
-    from .vector_store import ComplaintVectorStore
-    v_store = ComplaintVectorStore.load(index_path, meta_path)
-    embedder = MiniLMEmbedder() # Ensure this class is defined above
-    return ComplaintRetriever(vector_store=v_store, embedder=embedder)
+def build_embedder(embedding_cache_size: int = 1024, embedding_cache_path: Optional[str] = None) -> Embedder:
+    """MiniLM embedder, behind a question cache unless ``embedding_cache_size`` is 0."""
+    embedder = MiniLMEmbedder()
+    if embedding_cache_size:
+        embedder = CachedEmbedder(embedder, max_size=embedding_cache_size, persist_path=embedding_cache_path)
+    return embedder
+
+
+def load_vector_store(index_path: str, meta_path: str, partition_field: Optional[str] = None,
+                      mmap: bool = False) -> ComplaintVectorStore:
+    """Load the vector store (memory-mapping the index if ``mmap``) and build partitions."""
+    v_store = ComplaintVectorStore.load(index_path, meta_path, mmap=mmap)
+    if partition_field:
+        v_store.build_partitions(partition_field)
+    return v_store
+
+
+def build_retriever(index_path: str, meta_path: str,
+                    partition_field: Optional[str] = None,
+                    embedding_cache_size: int = 1024,
+                    embedding_cache_path: Optional[str] = None,
+                    mmap: bool = False,
+                    lexical_index_path: Optional[str] = None,
+                    mode: str = "dense",
+                    boilerplate_file: Optional[str] = None,
+                    stopwords_file: Optional[str] = None) -> ComplaintRetriever:
+    """
+    Factory function used by the RAGPipeline.
+
+    ``partition_field`` (e.g. "product_category") builds per-value
+    sub-indexes so queries filtered on that field search fewer vectors.
+
+    Question embeddings are kept in an LRU cache of ``embedding_cache_size``
+    entries (0 disables it), persisted to ``embedding_cache_path`` if given.
+    Hit / miss counters are on ``retriever.embedder.stats``.
+
+    ``lexical_index_path`` loads a BM25Index saved with BM25Index.save for
+    the "hybrid" / "fusion" modes. Questions are then cleaned for the BM25
+    lookup by a ComplaintPreprocessor with the ``boilerplate_file`` /
+    ``stopwords_file`` the chunks were preprocessed with.
+    """
+    v_store = load_vector_store(index_path, meta_path, partition_field, mmap)
+    embedder = build_embedder(embedding_cache_size, embedding_cache_path)
+    lexical_index, query_transform = None, None
+    if lexical_index_path:
+        from .data_preprocessing import ComplaintPreprocessor
+        lexical_index = BM25Index.load(lexical_index_path)
+        query_transform = ComplaintPreprocessor(boilerplate_file, stopwords_file, verbose=False).clean_text
+    return ComplaintRetriever(vector_store=v_store, embedder=embedder, lexical_index=lexical_index, mode=mode,
+                              query_transform=query_transform)
@@ -0,0 +1,84 @@
+"""
+startup.py
+
+Background loading of the heavy RAG components.
+
+Responsibilities:
+- Run each component's loader (vector store, embedder, LLM) in its own
+  thread so they load in parallel instead of one after another
+- Expose a readiness signal so a UI can start before the models are in
+- Record and print how long each component took
+
+Public API:
+- BackgroundLoader
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class BackgroundLoader:
+    """
+    Start named loader callables in parallel threads.
+
+    ``result(name)`` blocks until that component is loaded (re-raising its
+    error); ``ready`` is set once every component has finished, successfully
+    or not. Load times in seconds are collected in ``timings``.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], Any]], verbose: bool = True):
+        self.verbose = verbose
+        self.timings: Dict[str, float] = {}
+        self.ready = threading.Event()
+        self._start = time.perf_counter()
+        self._pending = len(loaders)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(loaders)), thread_name_prefix="loader")
+        self._futures: Dict[str, Future] = {
+            name: self._executor.submit(self._timed, name, loader) for name, loader in loaders.items()
+        }
+        for future in self._futures.values():
+            future.add_done_callback(self._on_done)
+        self._executor.shutdown(wait=False)
+        if not self._futures:
+            self.ready.set()
+
+    def _timed(self, name: str, loader: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return loader()
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            if self.verbose:
+                print(f"⏱  {name} loaded in {self.timings[name]:.2f}s")
+
+    def _on_done(self, _future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0:
+                self.timings["total"] = time.perf_counter() - self._start
+                if self.verbose:
+                    print(f"✅ All components ready in {self.timings['total']:.2f}s")
+                self.ready.set()
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        return self._futures[name].result(timeout)
+
+    def is_loaded(self, name: str) -> bool:
+        future = self._futures[name]
+        return future.done() and future.exception() is None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every component has finished; False on timeout."""
+        return self.ready.wait(timeout)
+
+    def status(self) -> Dict[str, str]:
+        """Per-component state: loading, ready or failed."""
+        return {
+            name: "loading" if not f.done() else ("failed" if f.exception() is not None else "ready")
+            for name, f in self._futures.items()
+        }
@@ -0,0 +1,179 @@
+"""
+streaming.py
+
+Token streams with latency metrics, in sync and async form.
+
+Perceived latency of a chat answer is the time to its first token, not to
+its last, so every streamed answer is timed from the start of the request.
+
+Responsibilities:
+- Time a stream of answer pieces: time to first token, decode speed and
+  total latency
+- Stop a generation early: cancelled by the client, past its deadline or
+  out of its token budget
+- Iterate a blocking stream (llama.cpp) from asyncio without blocking the
+  event loop
+
+Public API:
+- GenerationMetrics
+- MeteredStream
+- CancellationToken
+- iterate_in_thread(...)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class GenerationMetrics:
+    """Latency of one answer, in seconds from the start of the request."""
+
+    first_token_seconds: Optional[float] = None  # None: nothing was streamed
+    total_seconds: float = 0.0
+    tokens: int = 0                              # streamed pieces (one per llama.cpp token)
+    queue_seconds: float = 0.0                   # part of the above spent waiting for the model
+    stop_reason: Optional[str] = None            # CancellationToken reason if stopped early
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Decode speed: tokens after the first over the time they took."""
+        if self.first_token_seconds is None or self.tokens < 2:
+            return 0.0
+        decode_seconds = self.total_seconds - self.first_token_seconds
+        return (self.tokens - 1) / decode_seconds if decode_seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {"first_token_seconds": self.first_token_seconds, "total_seconds": self.total_seconds,
+                "tokens": self.tokens, "tokens_per_second": self.tokens_per_second,
+                "queue_seconds": self.queue_seconds, "stop_reason": self.stop_reason}
+
+    def __str__(self) -> str:
+        first = f"{self.first_token_seconds:.2f}s" if self.first_token_seconds is not None else "-"
+        return (f"first token {first} | {self.tokens_per_second:.1f} tokens/s | "
+                f"{self.total_seconds:.2f}s total")
+
+
+class MeteredStream:
+    """
+    Iterator over answer pieces that fills ``metrics`` as they arrive.
+
+    Parameters
+    ----------
+    pieces : iterable of str
+        Token stream, e.g. RAGGenerator.stream(...)
+    start : float, optional
+        ``time.perf_counter()`` at the start of the request (default: now)
+    """
+
+    def __init__(self, pieces: Iterable[str], start: Optional[float] = None):
+        self.start = time.perf_counter() if start is None else start
+        self.metrics = GenerationMetrics()
+        self.pieces: List[str] = []
+        self._iterator = iter(pieces)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pieces)
+
+    def __iter__(self) -> "MeteredStream":
+        return self
+
+    def __next__(self) -> str:
+        try:
+            piece = next(self._iterator)
+        except StopIteration:
+            self.metrics.total_seconds = time.perf_counter() - self.start
+            raise
+        if self.metrics.first_token_seconds is None:
+            self.metrics.first_token_seconds = time.perf_counter() - self.start
+        self.metrics.tokens += 1
+        self.pieces.append(piece)
+        return piece
+
+
+class CancellationToken:
+    """
+    Thread-safe stop signal for one generation.
+
+    The generator checks ``cancelled`` after every token (it is also a
+    llama.cpp stopping criterion), so a cancelled or expired request frees
+    the model within one token. Prompt evaluation itself is not interrupted.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Seconds from now after which the generation stops (reason "deadline")
+    max_tokens : int, optional
+        Answer token budget (reason "max_tokens" when it is used up)
+
+    Attributes
+    ----------
+    reason : str or None
+        "cancelled", "deadline" or "max_tokens" once stopped
+    """
+
+    CANCELLED = "cancelled"
+    DEADLINE = "deadline"
+    MAX_TOKENS = "max_tokens"
+
+    def __init__(self, timeout: Optional[float] = None, max_tokens: Optional[int] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.max_tokens = max_tokens
+        self.reason: Optional[str] = None
+        self._stopped = threading.Event()
+
+    def cancel(self, reason: str = CANCELLED) -> None:
+        if not self._stopped.is_set():
+            self.reason = reason
+            self._stopped.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._stopped.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(self.DEADLINE)
+        return self._stopped.is_set()
+
+    def remaining_seconds(self) -> Optional[float]:
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def token_limit(self, default: int) -> int:
+        """Answer length to request from the model."""
+        return default if self.max_tokens is None else min(default, self.max_tokens)
+
+    def __call__(self, input_ids=None, logits=None) -> bool:
+        """llama.cpp StoppingCriteria signature."""
+        return self.cancelled
+
+
+_END = object()
+
+
+async def iterate_in_thread(iterator: Iterator[T], executor: Optional[Executor] = None) -> AsyncIterator[T]:
+    """
+    Async form of a blocking iterator: each ``next()`` runs in ``executor``
+    (default: the loop's), so the event loop keeps serving other requests.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, _END)
+            if item is _END:
+                return
+            yield item
+    finally:
+        # A consumer that stops early also stops the blocking stream
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                pass  # cancelled while next() still runs in the executor
@@ -1,121 +1,943 @@
 from tqdm import tqdm
 import numpy as np
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import faiss
 import os
 import json
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .data_loader import stream_batches
+from .metadata_store import (
+    ArrowMetadataWriter,
+    is_arrow_path,
+    metadata_field,
+    open_metadata_arrow,
+    take_rows,
+    write_metadata_arrow,
+)
 
 EMBEDDING_DIM = 384
 
+# Metadata fields kept per chunk, with the value used when a field is missing
+METADATA_DEFAULTS: Dict[str, Any] = {
+    "complaint_id": "N/A",
+    "product_category": "N/A",
+    "product": "N/A",
+    "issue": "N/A",
+    "sub_issue": "N/A",
+    "company": "N/A",
+    "state": "N/A",
+    "date_received": "N/A",
+    "chunk_index": 0,
+    "total_chunks": 0,
+}
+
+
+def embedding_matrix(column) -> np.ndarray:
+    """
+    Contiguous (rows, dim) float32 matrix from an Arrow list / fixed-size-list
+    column. float32 fixed-size lists are converted without copying.
+    """
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    if pa.types.is_fixed_size_list(column.type):
+        dim = column.type.list_size
+    else:
+        lengths = pc.list_value_length(column).to_numpy(zero_copy_only=False)
+        dim = int(lengths[0]) if len(lengths) else EMBEDDING_DIM
+        if (lengths != dim).any():
+            raise ValueError("All embeddings must have the same dimension")
+    values = column.flatten()
+    if values.type != pa.float32():
+        values = values.cast(pa.float32())
+    return values.to_numpy(zero_copy_only=values.null_count == 0).reshape(-1, dim)
+
+
+def flatten_metadata(metadata, num_rows: int) -> pa.StructArray:
+    """
+    Pick the METADATA_DEFAULTS fields out of the nested metadata struct column
+    with columnar operations; fields the struct does not have get their default.
+    """
+    if isinstance(metadata, pa.ChunkedArray):
+        metadata = metadata.combine_chunks()
+    present = set(metadata.type.names) if metadata is not None and pa.types.is_struct(metadata.type) else set()
+    arrays = []
+    for name, default in METADATA_DEFAULTS.items():
+        if name in present:
+            arrays.append(pc.struct_field(metadata, name))
+        else:
+            arrays.append(pa.array(np.full(num_rows, default)))
+    return pa.StructArray.from_arrays(arrays, names=list(METADATA_DEFAULTS))
+
+
+# ----------------------------
+# Index types
+# ----------------------------
+
+INDEX_TYPES = ("flat", "sq_fp16", "sq8", "pq", "ivf_flat", "ivf_pq", "hnsw")
+
+# Scalar quantiser of each compressed flat index type
+_SQ_TYPES = {"sq_fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def default_nlist(num_vectors: int) -> int:
+    """Number of IVF lists for a corpus: ~4*sqrt(n), with at least 39 training points per list."""
+    return max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+
+
+def default_train_size(index_type: str, nlist: Optional[int] = None, pq_bits: int = 8) -> int:
+    """Training sample size for an index type: 100 points per IVF list or PQ centroid."""
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return 100 * nlist
+    if index_type == "pq":
+        return 100 * 2 ** pq_bits
+    return 20_000  # sq8: only per-dimension ranges are learned
+
+
+def create_index(index_type: str = "flat", dim: int = EMBEDDING_DIM, normalize: bool = True,
+                 nlist: int = 1024, pq_m: int = 48, pq_bits: int = 8,
+                 hnsw_m: int = 32, ef_construction: int = 200):
+    """
+    Empty FAISS index of the given type, using inner product when vectors are
+    L2-normalised and L2 distance otherwise.
+
+    - ``flat``: exact brute-force search (4 bytes per dimension)
+    - ``sq_fp16`` / ``sq8``: brute-force search over float16 / int8 scalar
+      quantised vectors (2 / 1 bytes per dimension; sq8 needs training)
+    - ``pq``: brute-force search over ``pq_m`` product-quantiser codes of
+      ``pq_bits`` bits (needs training). Built as a single IVF list, because
+      IndexPQ does not support the ID selectors used for tombstones and filters
+    - ``ivf_flat``: ``nlist`` k-means lists, full vectors (needs training)
+    - ``ivf_pq``: ``nlist`` lists, vectors compressed to ``pq_m`` codes of
+      ``pq_bits`` bits (needs training; ``dim`` must be divisible by ``pq_m``)
+    - ``hnsw``: graph with ``hnsw_m`` links per node, no training
+
+    The compressed types lose some recall; store.search(rerank=...) restores
+    it from full-precision vectors kept on disk.
+    """
+    metric = faiss.METRIC_INNER_PRODUCT if normalize else faiss.METRIC_L2
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim) if normalize else faiss.IndexFlatL2(dim)
+    if index_type in _SQ_TYPES:
+        return faiss.IndexScalarQuantizer(dim, _SQ_TYPES[index_type], metric)
+    if index_type == "pq":
+        return faiss.index_factory(dim, f"IVF1,PQ{pq_m}x{pq_bits}", metric)
+    if index_type == "ivf_flat":
+        return faiss.index_factory(dim, f"IVF{nlist},Flat", metric)
+    if index_type == "ivf_pq":
+        return faiss.index_factory(dim, f"IVF{nlist},PQ{pq_m}x{pq_bits}", metric)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+
+def index_type_of(index) -> str:
+    """Inverse of create_index for a loaded index."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return next((name for name, qtype in _SQ_TYPES.items() if qtype == index.sq.qtype), "flat")
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq" if index.nlist == 1 else "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def search_parameters(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None, sel=None):
+    """
+    Per-query FAISS search parameters: ``nprobe`` for IVF indexes,
+    ``ef_search`` for HNSW, plus an optional ID selector. Returns None when
+    there is nothing to set.
+
+    IVF indexes reject plain SearchParameters, so a selector on an IVF index
+    always comes with IVF parameters (carrying the index's current nprobe).
+    """
+    kwargs = {"sel": sel} if sel is not None else {}
+    if isinstance(index, faiss.IndexIVF) and (nprobe is not None or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe if nprobe is not None else index.nprobe, **kwargs)
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search, **kwargs)
+    return faiss.SearchParameters(**kwargs) if kwargs else None
+
+
+# ----------------------------
+# Metadata filters
+# ----------------------------
+
+# Metadata fields that search() can filter on; date_received takes a (start, end) range
+FILTER_FIELDS = ("product_category", "product", "company", "state")
+DATE_FIELD = "date_received"
+
+# Filters matching at most this many rows are scored exactly over just those rows
+EXACT_FILTER_MAX_ROWS = 50_000
+
+
+class FilterIndex:
+    """
+    Posting lists of FAISS ids for the filterable metadata fields.
+
+    Categorical fields map each value to a sorted id array; dates are kept as
+    one id array sorted by ISO date, so a range is two binary searches.
+    Built once from the metadata columns and extended on add().
+    """
+
+    def __init__(self, metadatas: Sequence[Dict[str, Any]]):
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}
+        for name in FILTER_FIELDS:
+            values = np.array([str(v) for v in metadata_field(metadatas, name)], dtype=object)
+            self.postings[name] = _group_ids(values, 0)
+        self.dates = np.empty(0, dtype="<U10")
+        self.date_ids = np.empty(0, dtype="int64")
+        self._add_dates(metadata_field(metadatas, DATE_FIELD), 0)
+
+    def _add_dates(self, dates: Sequence[Any], start: int) -> None:
+        # ISO dates order correctly as strings; "N/A" and other non-dates are left out
+        days = np.array([str(d)[:10] if d is not None and str(d)[:1].isdigit() else "" for d in dates], dtype="<U10")
+        valid = days != ""
+        days = np.concatenate([self.dates, days[valid]])
+        ids = np.concatenate([self.date_ids, np.flatnonzero(valid).astype("int64") + start])
+        order = np.argsort(days, kind="stable")
+        self.dates, self.date_ids = days[order], ids[order]
+
+    def extend(self, metadatas: Sequence[Dict[str, Any]], start: int) -> None:
+        for name in FILTER_FIELDS:
+            values = np.array([str(meta.get(name)) for meta in metadatas], dtype=object)
+            for value, ids in _group_ids(values, start).items():
+                existing = self.postings[name].get(value)
+                self.postings[name][value] = ids if existing is None else np.concatenate([existing, ids])
+        self._add_dates([meta.get(DATE_FIELD) for meta in metadatas], start)
+
+    def ids(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Sorted ids matching every filter (a value or list of values per field)."""
+        result = None
+        for name, wanted in filters.items():
+            if name == DATE_FIELD:
+                start, end = wanted
+                lo = 0 if start is None else np.searchsorted(self.dates, str(start)[:10], side="left")
+                hi = len(self.dates) if end is None else np.searchsorted(self.dates, str(end)[:10], side="right")
+                ids = np.sort(self.date_ids[lo:hi])
+            elif name in self.postings:
+                values = [wanted] if isinstance(wanted, str) or not isinstance(wanted, Iterable) else list(wanted)
+                lists = [self.postings[name].get(str(v)) for v in values]
+                lists = [ids for ids in lists if ids is not None]
+                ids = np.unique(np.concatenate(lists)) if len(lists) > 1 else (lists[0] if lists else np.empty(0, dtype="int64"))
+            else:
+                raise ValueError(f"Cannot filter on '{name}'; expected one of {FILTER_FIELDS + (DATE_FIELD,)}")
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        return result
+
+
+def _group_ids(values: np.ndarray, start: int) -> Dict[str, np.ndarray]:
+    """value -> sorted int64 ids (offset by ``start``) at which it occurs."""
+    if not len(values):
+        return {}
+    uniques, inverse = np.unique(values, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(uniques) + 1))
+    return {str(value): (order[bounds[i]:bounds[i + 1]] + start).astype("int64")
+            for i, value in enumerate(uniques)}
+
+
+def _training_sample(parquet_path: str, train_size: int, seed: int = 42) -> np.ndarray:
+    """Uniform random sample of embeddings from a parquet file or shard directory."""
+    dataset = ds.dataset(parquet_path, format="parquet")
+    total = dataset.count_rows()
+    rows = np.sort(np.random.default_rng(seed).choice(total, size=min(train_size, total), replace=False))
+    return embedding_matrix(dataset.take(pa.array(rows), columns=["embedding"]).column("embedding"))
+
+
 class ComplaintVectorStore:
+    """
+    FAISS index plus the chunk texts and metadata its row ids point to.
+
+    The store supports incremental ingestion: ``add`` appends new chunks and
+    ``remove`` tombstones every chunk of the given complaint ids. FAISS row ids
+    are never reused, so ``complaint_id`` is the stable key for removal.
+    ``save_delta`` persists only what changed since the last save or load as a
+    numbered delta under ``<index_path>.deltas/``; ``load`` replays deltas and
+    ``compact`` folds them (and drops tombstoned rows) into a fresh base.
+
+    ``search`` takes metadata ``filters`` (see FilterIndex); ``build_partitions``
+    adds per-value sub-indexes for the most common filter field.
+
+    ``from_parquet`` can build approximate indexes (IVF-Flat, IVF-PQ, HNSW;
+    see create_index) instead of the exact flat index; ``search`` accepts
+    ``nprobe`` / ``ef_search`` per query and ``tune`` sets their defaults.
+    index_evaluation.py reports the recall / latency of each configuration.
+
+    Compressed indexes (fp16 / int8 scalar quantisation, PQ) cut the memory
+    per chunk by 2x to 30x. With ``keep_full_vectors=True`` the float32
+    vectors are also written next to the index (see full_vectors_path) and
+    memory-mapped on load; ``search(rerank=r)`` then re-scores the top
+    ``r * k`` compressed hits exactly, reading only those rows from disk.
+
+    A ``meta_path`` ending in ``.arrow`` selects the memory-mapped columnar
+    metadata store (see metadata_store.py): texts and metadata are then read
+    lazily by FAISS id instead of being parsed from JSON at load time.
+    Existing JSON files can be converted with ``migrate_metadata_json``.
+    """
+
     def __init__(self, index=None, texts=None, metadatas=None):
         self.index = index
-        self.texts = texts or []
-        self.metadatas = metadatas or []
+        self.texts = texts if texts is not None else []
+        self.metadatas = metadatas if metadatas is not None else []
+        self.deleted_ids = set()
+        # Bumped on every add / remove so caches can detect a changed store
+        self.version = 0
+        self._complaint_rows = None
+        self._search_params = None
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_start = len(self.texts)
+        self._pending_deletes: List[int] = []
+        self._filter_index: Optional[FilterIndex] = None
+        # (field, {value: IndexIDMap2 holding that value's rows under their global ids})
+        self._partitions = None
+        self._partition_template = None  # empty copy of the index, cloned for new partitions
+        # True while the index is memory-mapped (read-only) by load(mmap=True)
+        self._mapped = False
+        # Optional float32 copy of the vectors (memory-mapped) for re-ranking compressed indexes
+        self.full_vectors: Optional[np.ndarray] = None
+        self._tail_vectors: List[np.ndarray] = []
+        self._rerank = 0
 
     @classmethod
     def from_parquet(cls, parquet_path: str, index_path: str, meta_path: str,
-                     batch_size: int = 5000, normalize: bool = True):
+                     batch_size: int = 5000, normalize: bool = True,
+                     index_type: str = "flat", index_options: Optional[Dict[str, Any]] = None,
+                     train_size: Optional[int] = None, keep_full_vectors: bool = False):
         """
         Build FAISS index from parquet file in batches and save to disk incrementally.
+
+        ``parquet_path`` may be a single file or a directory of Parquet shards
+        (e.g. the output of embedding.embed_chunks). Row groups are streamed
+        with pyarrow, so the file is never loaded whole: embeddings are turned
+        into contiguous float32 matrices without per-row copies, and the nested
+        metadata struct is flattened column by column.
+
+        With a ``.arrow`` meta_path each batch of texts and metadata is appended
+        to the columnar store as it is built, instead of re-serialising the
+        whole JSON payload at every checkpoint.
+
+        ``index_type`` and ``index_options`` are passed to create_index. Indexes
+        that need training (IVF, sq8, PQ) are trained on a random sample of
+        ``train_size`` embeddings (default: default_train_size) before any
+        vector is added; ``nlist`` defaults to default_nlist(rows).
+
+        ``keep_full_vectors`` also writes the (normalised) float32 embeddings
+        to full_vectors_path(index_path), for re-ranking compressed indexes.
         """
 
         if not os.path.exists(parquet_path):
             raise FileNotFoundError(parquet_path)
 
-        df = pd.read_parquet(parquet_path)
-        total_rows = len(df)
+        dataset = ds.dataset(parquet_path, format="parquet")
+        total_rows = dataset.count_rows()
+        columns = [c for c in ("embedding", "chunk_text", "metadata") if c in dataset.schema.names]
+        if "embedding" not in columns:
+            raise ValueError(f"No 'embedding' column in {parquet_path}")
 
         # Initialize FAISS index
-        index = faiss.IndexFlatIP(EMBEDDING_DIM) if normalize else faiss.IndexFlatL2(EMBEDDING_DIM)
+        index_options = dict(index_options or {})
+        if index_type in ("ivf_flat", "ivf_pq"):
+            index_options.setdefault("nlist", default_nlist(total_rows))
+        index = create_index(index_type, EMBEDDING_DIM, normalize, **index_options)
+        if not index.is_trained:
+            sample = _training_sample(parquet_path, train_size or default_train_size(
+                index_type, index_options.get("nlist"), index_options.get("pq_bits", 8)))
+            if normalize:
+                sample = sample.copy()
+                faiss.normalize_L2(sample)
+            print(f"Training {index_type} index on {len(sample):,} vectors...")
+            index.train(sample)
 
         texts = []
         metadatas = []
+        arrow_writer = ArrowMetadataWriter(meta_path) if is_arrow_path(meta_path) else None
 
         # Ensure directories exist
         os.makedirs(os.path.dirname(index_path), exist_ok=True)
         os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        # Deltas belong to the index being replaced
+        _clear_deltas(index_path)
+        full_vectors = None
+        if keep_full_vectors:
+            full_vectors = np.lib.format.open_memmap(f"{full_vectors_path(index_path)}.tmp", mode="w+",
+                                                     dtype="float32", shape=(total_rows, EMBEDDING_DIM))
 
-        for start in tqdm(range(0, total_rows, batch_size), desc="Building FAISS index"):
-            end = min(start + batch_size, total_rows)
-            batch = df.iloc[start:end]
-
+        progress = tqdm(total=total_rows, desc="Building FAISS index", unit="chunks")
+        for batch_num, batch in enumerate(stream_batches(parquet_path, columns=columns, batch_size=batch_size), 1):
             # ---- Embeddings ----
-            emb_list = [np.array(emb, dtype="float32") for emb in batch["embedding"].values]
-            batch_embeddings = np.vstack(emb_list)
+            batch_embeddings = embedding_matrix(batch.column("embedding"))
             if normalize:
+                batch_embeddings = batch_embeddings.copy()  # Arrow buffers are read-only
                 faiss.normalize_L2(batch_embeddings)
 
+            if full_vectors is not None:
+                full_vectors[index.ntotal:index.ntotal + len(batch_embeddings)] = batch_embeddings
             index.add(batch_embeddings)
 
             # ---- Texts ----
-            if "chunk_text" in batch.columns:
-                texts.extend(batch["chunk_text"].astype(str).tolist())
+            if "chunk_text" in batch.schema.names:
+                batch_texts = pc.fill_null(batch.column("chunk_text").cast(pa.string()), "")
             else:
-                texts.extend([""] * len(batch))
+                batch_texts = pa.array([""] * batch.num_rows, type=pa.string())
 
             # ---- Metadata ----
-                        # ---- New Metadata Extraction Logic ----
-            # We must reach INSIDE the "metadata" column to get the values
-            for _, row in batch.iterrows():
-                # 1. Grab the dictionary stored in the 'metadata' column
-                nested_meta = row.get("metadata", {})
-
-                # 2. Extract our specific fields from that dictionary
-                entry = {
-                    "complaint_id": nested_meta.get("complaint_id", "N/A"),
-                    "product_category": nested_meta.get("product_category", "N/A"),
-                    "product": nested_meta.get("product", "N/A"),
-                    "issue": nested_meta.get("issue", "N/A"),
-                    "sub_issue": nested_meta.get("sub_issue", "N/A"),
-                    "company": nested_meta.get("company", "N/A"),
-                    "state": nested_meta.get("state", "N/A"),
-                    "date_received": nested_meta.get("date_received", "N/A"),
-                    "chunk_index": nested_meta.get("chunk_index", 0),
-                    "total_chunks": nested_meta.get("total_chunks", 0)
-                }
-                metadatas.append(entry)
-
-
-            # ---- Save incrementally (optional, every batch) ----
-            if (start // batch_size + 1) % 5 == 0 or end == total_rows:
-                # Save FAISS index
+            batch_metadatas = flatten_metadata(
+                batch.column("metadata") if "metadata" in batch.schema.names else None, batch.num_rows
+            )
+
+            if arrow_writer is not None:
+                arrow_writer.write_arrays(batch_texts, batch_metadatas)
+            else:
+                texts.extend(batch_texts.to_pylist())
+                metadatas.extend(batch_metadatas.to_pylist())
+
+            # ---- Save incrementally (every 5 batches) ----
+            progress.update(batch.num_rows)
+            if batch_num % 5 == 0:
                 faiss.write_index(index, index_path)
+                if arrow_writer is None:
+                    with open(meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"texts": texts, "metadatas": metadatas}, f)
+        progress.close()
 
-                # Save metadata and texts
-                payload = {"texts": texts, "metadatas": metadatas}
-                with open(meta_path, "w", encoding="utf-8") as f:
-                    json.dump(payload, f)
+        faiss.write_index(index, index_path)
+        if full_vectors is not None:
+            full_vectors.flush()
+            del full_vectors
+            os.replace(f"{full_vectors_path(index_path)}.tmp", full_vectors_path(index_path))
+        elif os.path.exists(full_vectors_path(index_path)):
+            os.remove(full_vectors_path(index_path))  # belongs to the replaced index
+        if arrow_writer is not None:
+            arrow_writer.close()
+            texts, metadatas, _ = open_metadata_arrow(meta_path)
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"texts": texts, "metadatas": metadatas}, f)
 
         print(f"✅ FAISS index built and saved to {index_path}")
         print(f"✅ Metadata saved to {meta_path}")
 
-        return cls(index=index, texts=texts, metadatas=metadatas)
+        store = cls(index=index, texts=texts, metadatas=metadatas)
+        if keep_full_vectors:
+            store.attach_full_vectors(full_vectors_path(index_path))
+        return store
 
     # ---------- Load from disk ----------
     @classmethod
-    def load(cls, index_path: str, meta_path: str):
-        index = faiss.read_index(index_path)
-        with open(meta_path, "r", encoding="utf-8") as f:
-            payload = json.load(f)
-        return cls(index=index, texts=payload["texts"], metadatas=payload["metadatas"])
+    def load(cls, index_path: str, meta_path: str, mmap: bool = False):
+        """
+        Open a saved store. With ``mmap=True`` the index file is memory-mapped
+        instead of read into RAM, so opening is near-instant and pages are
+        loaded on first use.
+
+        The mapping is read-only: the first change (a replayed delta, add()
+        or compact()) copies the index into RAM.
+
+        Full-precision vectors saved next to the index (full_vectors_path)
+        are memory-mapped for re-ranking.
+        """
+        # IO_FLAG_MMAP_IFC maps the codes of every index type; IO_FLAG_MMAP only maps IVF lists
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC) if mmap else faiss.read_index(index_path)
+        if is_arrow_path(meta_path):
+            texts, metadatas, deleted_ids = open_metadata_arrow(meta_path)
+        else:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            texts, metadatas = payload["texts"], payload["metadatas"]
+            deleted_ids = payload.get("deleted_ids", [])
+        store = cls(index=index, texts=texts, metadatas=metadatas)
+        store._mapped = mmap
+        store.deleted_ids.update(deleted_ids)
+        if os.path.exists(full_vectors_path(index_path)):
+            store.attach_full_vectors(full_vectors_path(index_path))
+        store._replay_deltas(index_path)
+        return store
+
+    def attach_full_vectors(self, path: str) -> None:
+        """
+        Memory-map the float32 vectors of rows 0..n-1 (a .npy file) for
+        re-ranking and exact filtered search. Rows added later are kept in
+        memory until the next save().
+        """
+        self.full_vectors = np.load(path, mmap_mode="r")
+        if self.full_vectors.ndim != 2 or len(self.full_vectors) > (self.index.ntotal if self.index else 0):
+            raise ValueError(f"{path} does not match the index ({self.index.ntotal if self.index else 0} vectors)")
+        self._tail_vectors = []
+
+    # ---------- Incremental updates ----------
+    def add(self, embeddings: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]],
+            normalize: bool = True) -> np.ndarray:
+        """
+        Append chunks to the index; returns the FAISS ids assigned to them.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        if not (len(embeddings) == len(texts) == len(metadatas)):
+            raise ValueError("embeddings, texts and metadatas must have the same length")
+        if normalize:
+            embeddings = embeddings.copy()
+            faiss.normalize_L2(embeddings)
+
+        if self.index is None:
+            self.index = faiss.IndexFlatIP(embeddings.shape[1]) if normalize else faiss.IndexFlatL2(embeddings.shape[1])
+        self._copy_mapped_index()
+        start = self.index.ntotal
+        self.index.add(embeddings)
+        self._pending_vectors.append(embeddings)
+        if self.full_vectors is not None:
+            self._tail_vectors.append(embeddings)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+
+        if self._complaint_rows is not None:
+            for row, meta in enumerate(metadatas, start):
+                self._complaint_rows.setdefault(str(meta.get("complaint_id")), []).append(row)
+        if self._filter_index is not None:
+            self._filter_index.extend(metadatas, start)
+        if self._partitions is not None:
+            self._add_to_partitions(embeddings, metadatas, start)
+        self.version += 1
+        return np.arange(start, start + len(texts), dtype="int64")
+
+    def _rows_by_complaint(self) -> Dict[str, List[int]]:
+        if self._complaint_rows is None:
+            rows: Dict[str, List[int]] = {}
+            for row, complaint_id in enumerate(metadata_field(self.metadatas, "complaint_id")):
+                rows.setdefault(str(complaint_id), []).append(row)
+            self._complaint_rows = rows
+        return self._complaint_rows
+
+    def remove(self, complaint_ids: Iterable[Any]) -> int:
+        """
+        Tombstone every chunk of the given complaints; returns the number of
+        chunks removed. Removed rows are skipped by search until ``compact``.
+        """
+        rows_by_complaint = self._rows_by_complaint()
+        removed = []
+        for complaint_id in complaint_ids:
+            for row in rows_by_complaint.pop(str(complaint_id), []):
+                if row not in self.deleted_ids:
+                    removed.append(row)
+        if removed:
+            self.deleted_ids.update(removed)
+            self._pending_deletes.extend(removed)
+            self._search_params = None
+            self.version += 1
+        return len(removed)
+
+    @property
+    def num_active(self) -> int:
+        return len(self.texts) - len(self.deleted_ids)
+
+    # ---------- Persistence ----------
+    def save(self, index_path: str, meta_path: str) -> None:
+        """Write the full index and metadata, replacing any deltas."""
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        os.makedirs(os.path.dirname(meta_path) or ".", exist_ok=True)
+        _write_index(self.index, index_path)
+        if self.full_vectors is not None:
+            self._save_full_vectors(full_vectors_path(index_path))
+        if is_arrow_path(meta_path):
+            write_metadata_arrow(meta_path, self.texts, self.metadatas, self.deleted_ids)
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"texts": list(self.texts), "metadatas": list(self.metadatas),
+                           "deleted_ids": sorted(self.deleted_ids)}, f)
+        _clear_deltas(index_path)
+        self._mark_persisted()
+
+    def save_delta(self, index_path: str, meta_path: str) -> Optional[str]:
+        """
+        Persist only the chunks added and removed since the last save / load.
+
+        Cost is proportional to the change, not the corpus. Returns the delta
+        name, or None when there was nothing to write.
+        """
+        if not self._pending_vectors and not self._pending_deletes:
+            return None
+        delta_dir = _delta_dir(index_path)
+        os.makedirs(delta_dir, exist_ok=True)
+        name = f"delta-{len(_list_deltas(index_path)) + 1:05d}"
+
+        vectors = (np.vstack(self._pending_vectors) if self._pending_vectors
+                   else np.empty((0, self.index.d), dtype="float32"))
+        np.save(os.path.join(delta_dir, f"{name}.npy"), vectors)
+        payload = {
+            "start": self._pending_start,
+            "texts": self.texts[self._pending_start:],
+            "metadatas": self.metadatas[self._pending_start:],
+            "deleted_ids": self._pending_deletes,
+        }
+        # The JSON file is written last and renamed into place: it marks the delta as complete
+        tmp_path = os.path.join(delta_dir, f".{name}.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, os.path.join(delta_dir, f"{name}.json"))
+        self._mark_persisted()
+        return name
+
+    def compact(self, index_path: str, meta_path: str) -> None:
+        """Drop tombstoned rows, renumber the remaining ones and save a fresh base."""
+        if self.deleted_ids:
+            keep = np.array([i for i in range(self.index.ntotal) if i not in self.deleted_ids], dtype="int64")
+            vectors = self._full_precision(keep)
+            index = _empty_copy(self.index)
+            index.add(vectors)
+            self.index, self._mapped = index, False
+            if self.full_vectors is not None:
+                self.full_vectors, self._tail_vectors = vectors, []
+            self.texts = take_rows(self.texts, keep.tolist())
+            self.metadatas = take_rows(self.metadatas, keep.tolist())
+            self.deleted_ids = set()
+            self._complaint_rows = None
+            self._search_params = None
+            self._filter_index = None
+            if self._partitions is not None:
+                self.build_partitions(self._partitions[0])
+            self.version += 1
+        self.save(index_path, meta_path)
+
+    def _copy_mapped_index(self) -> None:
+        """Read a memory-mapped index into RAM before it is changed (its mapping is read-only)."""
+        if self._mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self._mapped = False
+            self._search_params = None
+
+    def _mark_persisted(self) -> None:
+        self._pending_vectors = []
+        self._pending_start = len(self.texts)
+        self._pending_deletes = []
+
+    def _replay_deltas(self, index_path: str) -> None:
+        for name in _list_deltas(index_path):
+            base = os.path.join(_delta_dir(index_path), name)
+            with open(f"{base}.json", "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            vectors = np.load(f"{base}.npy")
+            if len(vectors):
+                self._copy_mapped_index()
+                self.index.add(vectors)
+                if self.full_vectors is not None:
+                    self._tail_vectors.append(vectors)
+            self.texts.extend(payload["texts"])
+            self.metadatas.extend(payload["metadatas"])
+            self.deleted_ids.update(payload["deleted_ids"])
+        self._mark_persisted()
 
     # ---------- Search ----------
-    def search(self, query_embedding: np.ndarray, k: int = 5, normalize: bool = True):
+    def tune(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+             rerank: Optional[int] = None) -> None:
+        """Set the default nprobe (IVF) / efSearch (HNSW) / rerank factor used by every search."""
+        if rerank is not None:
+            self._check_rerank(rerank)
+            self._rerank = rerank
+        space = faiss.ParameterSpace()
+        indexes = [self.index]
+        if self._partitions is not None:
+            indexes += [faiss.downcast_index(p.index) for p in self._partitions[1].values()]
+        for index in indexes:
+            if nprobe is not None and isinstance(index, faiss.IndexIVF):
+                space.set_index_parameter(index, "nprobe", nprobe)
+                self._search_params = None  # cached tombstone parameters carry nprobe
+            if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+                space.set_index_parameter(index, "efSearch", ef_search)
+
+    def search(self, query_embedding: np.ndarray, k: int = 5, normalize: bool = True,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None, rerank: Optional[int] = None):
+        """
+        Top-k chunks for a query. ``nprobe`` (IVF) and ``ef_search`` (HNSW)
+        override the index defaults for this query only; larger values trade
+        latency for recall. They are ignored by index types that lack them.
+
+        ``rerank`` (needs full-precision vectors, see attach_full_vectors)
+        fetches ``rerank * k`` candidates from the index and re-scores them
+        exactly; 0 or 1 disables it.
+
+        ``filters`` restricts the search to matching chunks inside FAISS, so
+        up to k hits are returned whenever enough chunks match, e.g.
+        ``{"product_category": "Credit card", "company": ["X", "Y"],
+        "date_received": ("2023-01-01", "2023-12-31")}``. A selective filter
+        is scored exactly over only its rows, so it makes the query cheaper.
+        """
         if query_embedding.ndim == 1:
             query_embedding = query_embedding.reshape(1, -1)
-        query_embedding = query_embedding.astype("float32")
+        return self.search_batch(query_embedding[:1], k, normalize, nprobe, ef_search, filters, rerank)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5, normalize: bool = True,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None,
+                     rerank: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search many queries with one matrix search; returns one result list
+        (as for ``search``) per row of ``query_embeddings``, in row order.
+        """
+        return self._decode(*self.search_ids(query_embeddings, k, normalize, nprobe, ef_search, filters, rerank))
+
+    def search_ids(self, query_embeddings: np.ndarray, k: int = 5, normalize: bool = True,
+                   nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                   filters: Optional[Dict[str, Any]] = None, rerank: Optional[int] = None):
+        """
+        Like search_batch, but returns the raw (scores, ids) arrays of shape
+        (queries, k), padded with id -1, without decoding texts / metadata.
+        """
+        queries = np.array(query_embeddings, dtype="float32", ndmin=2)  # copy: normalised in place
+        if normalize:
+            faiss.normalize_L2(queries)
+
+        rerank = self._rerank if rerank is None else rerank
+        if rerank > 1 and not filters:  # filtered searches are already exact over full vectors
+            self._check_rerank(rerank)
+            _, candidates = self.search_ids(queries, rerank * k, False, nprobe, ef_search, rerank=0)
+            scores, indices = zip(*(self._exact_subset_search(query[None], k, row[row != -1])
+                                    for query, row in zip(queries, candidates)))
+            return np.vstack(scores), np.vstack(indices)
+
+        if filters:
+            scores, indices = self._filtered_search(queries, k, filters, nprobe, ef_search)
+        elif nprobe is not None or ef_search is not None:
+            params = search_parameters(self.index, nprobe, ef_search,
+                                       self._tombstone_params().sel if self.deleted_ids else None)
+            scores, indices = self.index.search(queries, k, params=params)
+        elif self.deleted_ids:
+            scores, indices = self.index.search(queries, k, params=self._tombstone_params())
+        else:
+            scores, indices = self.index.search(queries, k)
+
+        return scores, indices
+
+    def search_subset(self, query_embedding: np.ndarray, ids: np.ndarray, k: int = 5,
+                      normalize: bool = True) -> List[Dict[str, Any]]:
+        """
+        Score only the given FAISS ids (e.g. lexical candidates) exactly and
+        return the top-k; cost is proportional to ``len(ids)``.
+        """
+        queries = np.array(query_embedding, dtype="float32", ndmin=2)[:1]
         if normalize:
-            faiss.normalize_L2(query_embedding)
+            faiss.normalize_L2(queries)
+        return self._decode(*self._exact_subset_search(queries, k, np.asarray(ids, dtype="int64")))[0]
 
-        scores, indices = self.index.search(query_embedding, k)
+    def results_for_ids(self, ids: Sequence[int], scores: Sequence[float]) -> List[Dict[str, Any]]:
+        """Result dicts (as returned by search) for the given ids and scores."""
+        return self._decode(np.array([scores], dtype="float32"), np.array([ids], dtype="int64"))[0]
+
+    def _decode(self, scores: np.ndarray, indices: np.ndarray) -> List[List[Dict[str, Any]]]:
+        # Decode every hit in one pass (a single take() for memory-mapped metadata)
+        found = indices[indices != -1].tolist()
+        texts = iter(take_rows(self.texts, found))
+        metadatas = iter(take_rows(self.metadatas, found))
         results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx == -1:
-                continue
-            results.append({
-                "score": float(score),
-                "text": self.texts[idx],
-                "metadata": self.metadatas[idx]
-            })
+        for row_scores, row_indices in zip(scores, indices):
+            results.append([
+                {"score": float(score), "text": next(texts), "metadata": next(metadatas)}
+                for score, idx in zip(row_scores, row_indices) if idx != -1
+            ])
         return results
+
+    # ---------- Filtered search ----------
+    def filter_ids(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Sorted FAISS ids of the live chunks matching ``filters``."""
+        if self._filter_index is None:
+            self._filter_index = FilterIndex(self.metadatas)
+        ids = self._filter_index.ids(filters)
+        if self.deleted_ids and len(ids):
+            ids = ids[~np.isin(ids, self._deleted_array())]
+        return ids
+
+    def build_partitions(self, field: str = "product_category") -> None:
+        """
+        Split the index into one sub-index per value of ``field``, so queries
+        filtered on a single value only search that value's vectors. The
+        sub-indexes are kept in memory and follow later add() calls and
+        tune() settings.
+
+        Memory: the sub-indexes together hold a second copy of the index's
+        codes in RAM (also when the index itself is memory-mapped), built
+        from one value's reconstructed float32 vectors at a time.
+        """
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Cannot partition on '{field}'; expected one of {FILTER_FIELDS}")
+        self._partitions = (field, {})
+        self._partition_template = _empty_copy(self.index)
+        self._add_to_partitions(None, None, 0)
+
+    def _add_to_partitions(self, embeddings: Optional[np.ndarray], metadatas, start: int) -> None:
+        field, partitions = self._partitions
+        values = metadata_field(self.metadatas if metadatas is None else metadatas, field)
+        for value, ids in _group_ids(np.array([str(v) for v in values], dtype=object), start).items():
+            if value not in partitions:
+                partitions[value] = faiss.IndexIDMap2(faiss.clone_index(self._partition_template))
+            vectors = self._reconstruct(ids) if embeddings is None else embeddings[ids - start]
+            partitions[value].add_with_ids(vectors, ids)
+
+    def _reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+        return self.index.reconstruct_batch(ids)
+
+    def _filtered_search(self, query: np.ndarray, k: int, filters: Dict[str, Any],
+                         nprobe: Optional[int], ef_search: Optional[int]):
+        ids = self.filter_ids(filters)
+        if len(ids) <= EXACT_FILTER_MAX_ROWS:
+            return self._exact_subset_search(query, k, ids)
+
+        index, sel = self.index, faiss.IDSelectorBatch(ids)
+        if self._partitions is not None:
+            field, partitions = self._partitions
+            value = filters.get(field)
+            if isinstance(value, str) and value in partitions:
+                index = partitions[value]
+                if set(filters) == {field}:
+                    # Only the partition filter: the sub-index holds exactly the wanted rows
+                    sel = self._tombstone_params().sel if self.deleted_ids else None
+        params = search_parameters(faiss.downcast_index(index.index) if index is not self.index else index,
+                                   nprobe, ef_search, sel)
+        return index.search(query, k, params=params)
+
+    def _exact_subset_search(self, queries: np.ndarray, k: int, ids: np.ndarray):
+        """Score only the given rows; cost is proportional to the filter size."""
+        higher_is_better = self._higher_is_better()
+        scores = np.full((len(queries), k), -np.inf if higher_is_better else np.inf, dtype="float32")
+        indices = np.full((len(queries), k), -1, dtype="int64")
+        if not len(ids):
+            return scores, indices
+        vectors = self._full_precision(ids)
+        if higher_is_better:
+            order_by = -(queries @ vectors.T)
+        else:
+            order_by = ((queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ vectors.T
+                        + (vectors ** 2).sum(axis=1))
+        top = np.argpartition(order_by, k - 1, axis=1)[:, :k] if len(ids) > k else np.tile(np.arange(len(ids)), (len(queries), 1))
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(order_by, top, axis=1), axis=1, kind="stable"), axis=1)
+        best = np.take_along_axis(order_by, top, axis=1)
+        scores[:, :top.shape[1]] = -best if higher_is_better else best
+        indices[:, :top.shape[1]] = ids[top]
+        return scores, indices
+
+    def _higher_is_better(self) -> bool:
+        return self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    # ---------- Full-precision vectors ----------
+    def _check_rerank(self, rerank: int) -> None:
+        if rerank > 1 and self.full_vectors is None:
+            raise ValueError("rerank needs full-precision vectors: build with keep_full_vectors=True "
+                             "or call attach_full_vectors()")
+
+    def _full_precision(self, ids: np.ndarray) -> np.ndarray:
+        """
+        float32 vectors of the given rows: from the memory-mapped file and the
+        in-memory tail when attached, otherwise decoded from the index.
+        """
+        ids = np.asarray(ids, dtype="int64")
+        if not len(ids):
+            return np.empty((0, self.index.d), dtype="float32")
+        if self.full_vectors is None:
+            return self._reconstruct(ids)
+        if len(self._tail_vectors) > 1:
+            self._tail_vectors = [np.vstack(self._tail_vectors)]
+        stored = len(self.full_vectors)
+        tail = self._tail_vectors[0] if self._tail_vectors else np.empty((0, self.index.d), dtype="float32")
+
+        vectors = np.empty((len(ids), self.index.d), dtype="float32")
+        on_disk = ids < stored
+        in_tail = ~on_disk & (ids < stored + len(tail))
+        vectors[on_disk] = self.full_vectors[ids[on_disk]]
+        vectors[in_tail] = tail[ids[in_tail] - stored]
+        unknown = ~(on_disk | in_tail)
+        if unknown.any():
+            # Rows added before the vectors were attached: best available is the index copy
+            vectors[unknown] = self._reconstruct(ids[unknown])
+        return vectors
+
+    def _save_full_vectors(self, path: str, rows_per_copy: int = 65_536) -> None:
+        # Written next to the target and renamed: the old file may still be memory-mapped
+        tmp_path = f"{path}.tmp"
+        total = self.index.ntotal
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype="float32", shape=(total, self.index.d))
+        for start in range(0, total, rows_per_copy):
+            out[start:start + rows_per_copy] = self._full_precision(np.arange(start, min(start + rows_per_copy, total)))
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+        self.attach_full_vectors(path)
+
+    def _deleted_array(self) -> np.ndarray:
+        return np.fromiter(self.deleted_ids, dtype="int64", count=len(self.deleted_ids))
+
+    def _tombstone_params(self):
+        if self._search_params is None:
+            sel = faiss.IDSelectorNot(faiss.IDSelectorBatch(self._deleted_array()))
+            # IVF indexes only accept IVF parameters, which also carry the current nprobe
+            ivf = faiss.try_extract_index_ivf(self.index)
+            self._search_params = (faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe) if ivf is not None
+                                   else faiss.SearchParameters(sel=sel))
+        return self._search_params
+
+
+def full_vectors_path(index_path: str) -> str:
+    """Where the float32 vectors used for re-ranking are kept for an index file."""
+    return f"{index_path}.f32.npy"
+
+
+def _empty_copy(index):
+    """
+    Copy of ``index`` without its vectors (same trained quantizer and search
+    settings). A memory-mapped index cannot be reset in place, so an IVF
+    index is cloned with empty lists swapped in and any other index is
+    copied through serialisation.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        empty = faiss.deserialize_index(faiss.serialize_index(index))
+        empty.reset()
+        return empty
+    lists, own = ivf.invlists, ivf.own_invlists
+    placeholder = faiss.ArrayInvertedLists(ivf.nlist, ivf.code_size)
+    ivf.own_invlists = False  # keep replace_invlists from freeing the real lists
+    ivf.replace_invlists(placeholder, True)
+    placeholder.this.disown()
+    try:
+        empty = faiss.clone_index(index)
+    finally:
+        ivf.replace_invlists(lists, own)
+    empty.reset()
+    return empty
+
+
+def _write_index(index, index_path: str) -> None:
+    # Written next to the target and renamed: the old file may still be memory-mapped
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+# ----------------------------
+# Delta files
+# ----------------------------
+
+def _delta_dir(index_path: str) -> str:
+    return f"{index_path}.deltas"
+
+
+def _list_deltas(index_path: str) -> List[str]:
+    """Names of the complete deltas for an index, in write order."""
+    delta_dir = _delta_dir(index_path)
+    if not os.path.isdir(delta_dir):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(delta_dir)
+                  if name.startswith("delta-") and name.endswith(".json"))
+
+
+def _clear_deltas(index_path: str) -> None:
+    shutil.rmtree(_delta_dir(index_path), ignore_errors=True)
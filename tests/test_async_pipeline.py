@@ -0,0 +1,288 @@
+# tests/test_async_pipeline.py
+
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from src.async_pipeline import AsyncRAGPipeline, QueueFullError
+
+dummy_chunks = [
+    {"text": "Complaint about product A", "metadata": {"company": "Company A", "issue": "Late delivery"}},
+]
+
+
+# -----------------------------
+# Fixture: pipeline whose generator blocks until released
+# -----------------------------
+class GateGenerator:
+    def __init__(self):
+        self.gate = threading.Semaphore(0)
+        self.order = []
+        self.threads = set()
+
+    def generate(self, question, chunks, cancellation=None):
+        self.threads.add(threading.current_thread().name)
+        for _ in range(500):  # up to 5s
+            if self.gate.acquire(timeout=0.01):
+                break
+            if cancellation is not None and cancellation.cancelled:
+                self.order.append(f"stopped {question}")
+                return "partial"
+        self.order.append(question)
+        return f"answer to {question}"
+
+    def stream(self, question, chunks, cancellation=None):
+        self.threads.add(threading.current_thread().name)
+        for piece in ["answer ", "to ", question]:
+            yield piece
+
+
+@pytest.fixture
+def pipeline():
+    mock = MagicMock()
+    mock.retrieve.return_value = dummy_chunks
+    mock.cached_answer.return_value = None
+    mock.generator = GateGenerator()
+    return mock
+
+
+async def _until(predicate, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+# -----------------------------
+# Test FIFO queue and admission control
+# -----------------------------
+def test_queue_is_fifo_bounded_and_reports_positions(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline, max_queue=2, initial_generation_seconds=10.0)
+        first = await server.submit("q1")
+        await _until(lambda: first.started)
+        second = await server.submit("q2")
+        third = await server.submit("q3")
+
+        assert first.status()["state"] == "generating"
+        assert second.status() == {"state": "queued", "position": 1, "ahead": 1,
+                                   "estimated_wait_seconds": pytest.approx(10.0, abs=0.5)}
+        assert third.status()["position"] == 2 and third.status()["ahead"] == 2
+
+        with pytest.raises(QueueFullError) as error:
+            await server.submit("q4")
+        assert error.value.capacity == 2
+
+        for _ in range(3):
+            pipeline.generator.gate.release()
+        results = [await t.result() for t in (first, second, third)]
+        assert [r["answer"] for r in results] == ["answer to q1", "answer to q2", "answer to q3"]
+        assert pipeline.generator.order == ["q1", "q2", "q3"]
+        assert pipeline.generator.threads == {"generation_0"}  # one thread owns the model
+        await _until(lambda: pipeline.remember_answer.call_count == 3)
+
+        status = server.queue_status()
+        assert status["completed"] == 3 and status["rejected"] == 1 and status["waiting"] == 0
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_generation_workers_answer_in_parallel(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline, initial_generation_seconds=10.0, generation_workers=2)
+        first = await server.submit("q1")
+        second = await server.submit("q2")
+        await _until(lambda: first.started and second.started)
+        third = await server.submit("q3")
+
+        assert server.queue_status()["generating"] == 2
+        assert third.status()["position"] == 1 and third.status()["ahead"] == 2
+        assert third.status()["estimated_wait_seconds"] == pytest.approx(10.0, abs=0.5)
+
+        for _ in range(3):
+            pipeline.generator.gate.release()
+        results = [await t.result() for t in (first, second, third)]
+        assert [r["answer"] for r in results] == ["answer to q1", "answer to q2", "answer to q3"]
+        assert pipeline.generator.threads == {"generation_0", "generation_1"}
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_retrieval_runs_concurrently(pipeline):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def retrieve(question, k, filters):
+        barrier.wait()  # only passes if three retrievals overlap
+        return dummy_chunks
+
+    pipeline.retrieve.side_effect = retrieve
+
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline, retrieval_workers=3)
+        results = await asyncio.gather(*(server.retrieve(f"q{i}") for i in range(3)))
+        assert results == [dummy_chunks] * 3
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+# -----------------------------
+# Test streaming, cache hits and withdrawal
+# -----------------------------
+def test_events_stream_tokens_after_queue_updates(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline)
+        blocker = await server.submit("q1")
+        await _until(lambda: blocker.started)
+        ticket = await server.submit("q2", stream=True)
+
+        events = []
+        async for kind, value in ticket.events(interval=0.05):
+            events.append((kind, value))
+            if len(events) == 1:
+                pipeline.generator.gate.release()
+
+        assert events[0][0] == "queued" and events[0][1]["position"] == 1
+        assert [v for k, v in events if k == "token"] == ["answer ", "to ", "q2"]
+        assert events[-1] == ("done", "answer to q2")
+        result = await ticket.result()
+        assert result["sources"] == dummy_chunks
+        assert result["metrics"].tokens == 3 and result["metrics"].queue_seconds > 0
+        assert 0 < result["metrics"].first_token_seconds <= result["metrics"].total_seconds
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_cache_hits_skip_the_queue(pipeline):
+    pipeline.cached_answer.return_value = {"answer": "cached", "sources": dummy_chunks, "cached": True}
+
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline, max_queue=1)
+        answers = [await server.answer("q") for _ in range(3)]
+        assert all(a.pop("metrics").total_seconds >= 0 for a in answers)
+        assert all(a == {"answer": "cached", "sources": dummy_chunks, "cached": True} for a in answers)
+        assert server.queue_status()["cached"] == 3 and pipeline.generator.order == []
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_stream_yields_sources_then_tokens_then_metrics(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline)
+        events = [event async for event in server.stream("q1")]
+
+        assert events[0] == ("sources", dummy_chunks)
+        assert [v for k, v in events if k == "token"] == ["answer ", "to ", "q1"]
+        kind, result = events[-1]
+        assert kind == "done" and result["answer"] == "answer to q1" and result["cached"] is False
+        assert result["metrics"].tokens == 3
+
+        pipeline.cached_answer.return_value = {"answer": "cached", "sources": dummy_chunks, "cached": True}
+        events = [event async for event in server.stream("q1")]
+        assert [k for k, _ in events] == ["sources", "token", "done"] and events[1] == ("token", "cached")
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_closing_a_stream_stops_its_generation(pipeline):
+    stopped = threading.Event()
+
+    def endless(question, chunks, cancellation=None):
+        while not cancellation.cancelled:  # llama.cpp checks after every token
+            yield "token "
+            time.sleep(0.01)
+        stopped.set()
+
+    pipeline.generator.stream = endless
+
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline)
+        stream = server.stream("q1")
+        tokens = 0
+        async for kind, _ in stream:
+            tokens += kind == "token"
+            if tokens == 2:
+                break
+        await stream.aclose()  # client closed the tab mid-answer
+
+        await _until(stopped.is_set)
+        await _until(lambda: server.queue_status()["cancelled"] == 1)
+        assert server.queue_status()["generating"] == 0
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_request_leaves_the_queue(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline)
+        blocker = await server.submit("q1")
+        await _until(lambda: blocker.started)
+        waiting = await server.submit("q2")
+        behind = await server.submit("q3")
+
+        events = waiting.events(interval=0.05)
+        assert (await events.__anext__())[0] == "queued"
+        await events.aclose()  # client went away
+
+        assert server.queue_status()["cancelled"] == 1
+        assert behind.status()["position"] == 1
+        with pytest.raises(asyncio.CancelledError):
+            await waiting.result()
+        pipeline.generator.gate.release()
+        pipeline.generator.gate.release()
+        assert (await behind.result())["answer"] == "answer to q3"
+        assert pipeline.generator.order == ["q1", "q3"]
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+# -----------------------------
+# Test cancellation and deadlines
+# -----------------------------
+def test_cancelling_a_running_generation_frees_the_model(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline)
+        running = await server.submit("q1")
+        await _until(lambda: running.started)
+        waiting = await server.submit("q2")
+
+        assert running.cancel() is True
+        with pytest.raises(asyncio.CancelledError):
+            await running.result()
+        pipeline.generator.gate.release()
+        assert (await waiting.result())["answer"] == "answer to q2"
+        assert pipeline.generator.order == ["stopped q1", "q2"]
+        assert server.queue_status()["cancelled"] == 1
+        assert pipeline.remember_answer.call_count <= 1  # the stopped answer is never cached
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_deadline_stops_generation_and_expires_queued_requests(pipeline):
+    async def scenario():
+        server = AsyncRAGPipeline(pipeline, request_timeout=0.3)
+        running = await server.submit("q1")
+        await _until(lambda: running.started)
+        expired = await server.submit("q2", timeout=0.05)  # expires before q1 stops
+
+        result = await running.result()
+        assert result["answer"] == "partial" and result["metrics"].stop_reason == "deadline"
+        with pytest.raises(TimeoutError):
+            await expired.result()
+        assert pipeline.generator.order == ["stopped q1"]
+        assert server.queue_status()["timed_out"] == 2
+        pipeline.remember_answer.assert_not_called()
+        await server.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,196 @@
+# tests/test_cache.py
+
+import os
+
+import numpy as np
+import pytest
+from src.cache import CachedEmbedder, LRUCache, PromptPrefixCache, normalize_question
+
+# -----------------------------
+# Counting embedder stub
+# -----------------------------
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, text):
+        self.calls.append(text)
+        return np.full(4, len(text), dtype="float32")
+
+# -----------------------------
+# Tests for LRUCache
+# -----------------------------
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+
+    assert "b" not in cache and cache.get("c") == 3
+    assert cache.get("b") is None
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (2, 1, 1)
+    assert cache.stats.hit_rate == pytest.approx(2 / 3)
+
+def test_lru_cache_rejects_zero_size():
+    with pytest.raises(ValueError):
+        LRUCache(max_size=0)
+
+# -----------------------------
+# Tests for CachedEmbedder
+# -----------------------------
+def test_normalize_question():
+    assert normalize_question("  Why  was my\tCard\ncharged? ") == "why was my card charged?"
+
+def test_cached_embedder_skips_repeated_questions():
+    inner = CountingEmbedder()
+    embedder = CachedEmbedder(inner, max_size=10)
+
+    first = embedder.encode("Why was my card charged?")
+    second = embedder.encode("why was my   card charged?")
+
+    assert inner.calls == ["Why was my card charged?"]
+    assert second is first
+    assert (embedder.stats.hits, embedder.stats.misses) == (1, 1)
+
+def test_cached_embedder_batch_encodes_only_misses():
+    inner = CountingEmbedder()
+    embedder = CachedEmbedder(inner)
+    embedder.encode("cached")
+
+    vectors = embedder.encode_batch(["new one", "Cached", "new one"])
+
+    assert inner.calls == ["cached", "new one"]
+    assert vectors.shape == (3, 4) and vectors[1, 0] == len("cached")
+
+def test_cached_embedder_persists_to_disk(tmp_path):
+    path = str(tmp_path / "cache" / "embeddings.npz")
+    embedder = CachedEmbedder(CountingEmbedder(), persist_path=path)
+    embedder.encode("late fees")
+    embedder.save()
+
+    inner = CountingEmbedder()
+    restored = CachedEmbedder(inner, persist_path=path)
+    np.testing.assert_array_equal(restored.encode("Late fees"), np.full(4, 9))
+    assert inner.calls == []
+
+# -----------------------------
+# Tests for SemanticAnswerCache
+# -----------------------------
+CHUNKS = [{"text": "charged twice", "metadata": {"complaint_id": "1", "chunk_index": 0}},
+          {"text": "no refund", "metadata": {"complaint_id": "2", "chunk_index": 0}}]
+
+def test_answer_cache_hits_near_duplicate_with_same_chunks():
+    from src.cache import SemanticAnswerCache
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store(np.array([1.0, 0.0]), CHUNKS, "Fees were charged twice.", version=0)
+
+    assert cache.lookup(np.array([1.0, 0.1]), CHUNKS[::-1], version=0) == ("Fees were charged twice.", CHUNKS)
+    assert cache.lookup(np.array([0.0, 1.0]), CHUNKS, version=0) is None  # not similar enough
+    assert cache.lookup(np.array([1.0, 0.0]), CHUNKS[:1], version=0) is None  # different evidence
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+def test_answer_cache_expires_and_invalidates(monkeypatch):
+    from src import cache as cache_module
+    clock = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: clock[0])
+    cache = cache_module.SemanticAnswerCache(ttl_seconds=60)
+
+    cache.store(np.ones(2), CHUNKS, "answer", version=1)
+    assert cache.lookup(np.ones(2), CHUNKS, version=2) is None  # vector store changed
+    cache.store(np.ones(2), CHUNKS, "answer", version=2)
+    clock[0] += 61
+    assert cache.lookup(np.ones(2), CHUNKS, version=2) is None
+    assert len(cache.cache) == 0
+
+
+# -----------------------------
+# Tests for PromptPrefixCache
+# -----------------------------
+class FakeLlama:
+    """Records evaluated tokens; its 'KV cache' is input_ids[:n_tokens]."""
+
+    def __init__(self, n_ctx=64):
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.n_tokens = 0
+        self.evaluated = []
+        self.loads = 0
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return ([1] if add_bos else []) + list(text)
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.evaluated.extend(tokens)
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+
+    def save_state(self):
+        from llama_cpp.llama import LlamaState
+        return LlamaState(input_ids=self.input_ids.copy(), scores=np.zeros((self.n_tokens, 3), dtype=np.single),
+                          n_tokens=self.n_tokens, llama_state=b"kv" * self.n_tokens,
+                          llama_state_size=2 * self.n_tokens, seed=7)
+
+    def load_state(self, state):
+        self.input_ids = state.input_ids.copy()
+        self.n_tokens = state.n_tokens
+        self.loads += 1
+
+
+def test_prompt_prefix_cache_persists_state(tmp_path):
+    path = str(tmp_path / "model.prefix.npz")
+    first = FakeLlama()
+    cache = PromptPrefixCache(first, "You are an analyst.", persist_path=path, fingerprint="model-a")
+    assert cache.source == "evaluated" and len(first.evaluated) == len(cache.tokens)
+
+    restarted = FakeLlama()
+    cache = PromptPrefixCache(restarted, "You are an analyst.", persist_path=path, fingerprint="model-a")
+    assert cache.source == "disk" and restarted.evaluated == []
+    assert cache.state.llama_state == first.save_state().llama_state and cache.state.seed == 7
+
+    # A different model or prefix invalidates the saved state
+    for prefix, fingerprint in [("You are an analyst.", "model-b"), ("You are a lawyer.", "model-a")]:
+        other = FakeLlama()
+        assert PromptPrefixCache(other, prefix, persist_path=path, fingerprint=fingerprint).source == "evaluated"
+        assert other.evaluated
+
+
+def test_prompt_prefix_cache_save_is_safe_across_workers(tmp_path, monkeypatch):
+    import threading
+    path = str(tmp_path / "model.prefix.npz")
+
+    # Pool workers evaluate the prefix at the same time and all try to save it
+    barrier = threading.Barrier(4)
+    caches = []
+    def warm():
+        barrier.wait()
+        caches.append(PromptPrefixCache(FakeLlama(), "You are an analyst.", persist_path=path, fingerprint="m"))
+    threads = [threading.Thread(target=warm) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert os.listdir(tmp_path) == ["model.prefix.npz"]  # no temporary files left behind
+    assert PromptPrefixCache(FakeLlama(), "You are an analyst.", persist_path=path, fingerprint="m").source == "disk"
+
+    # A valid saved state is not rewritten
+    monkeypatch.setattr(np, "savez", lambda *args, **kwargs: pytest.fail("state saved twice"))
+    caches[0].save()
+
+
+def test_prompt_prefix_cache_restores_only_when_overwritten():
+    model = FakeLlama()
+    cache = PromptPrefixCache(model, "prefix", fingerprint="m")
+
+    model.eval(list(b" question 1"))  # a completion appends after the prefix
+    cache.restore()
+    assert model.loads == 0 and cache.stats.hits == 1
+
+    model.reset()
+    model.eval(list(b"something else"))
+    cache.restore()
+    assert model.loads == 1 and cache.stats.misses == 1
+    assert model.input_ids[:model.n_tokens].tolist() == cache.tokens
@@ -0,0 +1,60 @@
+# tests/test_chunking.py
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from src.chunking import CHUNK_SCHEMA, build_splitter, chunk_file, chunk_record_batch
+
+# -----------------------------
+# Fixture for a sample batch of complaints
+# -----------------------------
+@pytest.fixture
+def complaints_batch():
+    long_text = " ".join(f"the bank charged fee number {i} without notice." for i in range(60))
+    return pa.RecordBatch.from_pandas(pd.DataFrame({
+        "Complaint ID": [101, 102, 103],
+        "Product_category": ["Credit card", "Personal loan", "Credit card"],
+        "Company": ["Bank A", None, "Bank C"],
+        "Consumer complaint narrative": [long_text, "   ", "short complaint"],
+    }), preserve_index=False)
+
+# -----------------------------
+# Test chunking one batch
+# -----------------------------
+def test_chunk_record_batch_matches_splitter(complaints_batch):
+    splitter = build_splitter()
+    chunks = chunk_record_batch(complaints_batch, splitter)
+
+    assert chunks.schema == CHUNK_SCHEMA
+    texts = complaints_batch.column("Consumer complaint narrative").to_pylist()
+    expected = splitter.split_text(texts[0]) + splitter.split_text(texts[2])
+    assert chunks.column("chunk_text").to_pylist() == expected
+
+    rows = chunks.to_pylist()
+    first, last = rows[0], rows[-1]
+    assert first["metadata"]["complaint_id"] == "101"
+    assert first["metadata"]["chunk_index"] == 0
+    assert first["metadata"]["total_chunks"] == len(expected) - 1
+    assert first["metadata"]["state"] == "N/A"  # column absent from the batch
+    assert last["metadata"]["complaint_id"] == "103"
+    assert last["metadata"]["total_chunks"] == 1
+
+    # Offsets point back into the original narrative
+    for row in rows[:-1]:
+        assert texts[0][row["start_char"]:row["end_char"]] == row["chunk_text"]
+
+# -----------------------------
+# Test the multi-process file stage
+# -----------------------------
+def test_chunk_file_writes_parquet(tmp_path, complaints_batch):
+    input_path = tmp_path / "complaints.parquet"
+    pq.write_table(pa.Table.from_batches([complaints_batch]), input_path)
+    output_path = tmp_path / "chunks.parquet"
+
+    stats = chunk_file(input_path, output_path, batch_size=2, n_workers=2, verbose=False)
+
+    out = pd.read_parquet(output_path)
+    expected = chunk_record_batch(complaints_batch, build_splitter()).column("chunk_text").to_pylist()
+    assert out["chunk_text"].tolist() == expected
+    assert sum(w.rows_in for w in stats.values()) == 3
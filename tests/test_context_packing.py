@@ -0,0 +1,74 @@
+# tests/test_context_packing.py
+
+import pytest
+from src.context_packing import merge_overlapping, pack_context
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def chunk(text, complaint_id, chunk_index, company="Company A", issue="Late delivery"):
+    return {"text": text, "metadata": {"complaint_id": complaint_id, "chunk_index": chunk_index,
+                                       "company": company, "issue": issue}}
+
+
+# -----------------------------
+# Test merging of overlapping chunks
+# -----------------------------
+def test_merge_overlapping_drops_the_shared_text():
+    left = "I was charged twice for the same payment and the bank refused to refund me."
+    right = "the bank refused to refund me. They closed my account without notice."
+    assert merge_overlapping(left, right) == (
+        "I was charged twice for the same payment and the bank refused to refund me. "
+        "They closed my account without notice.")
+    assert merge_overlapping("first part.", "second part.") == "first part. second part."
+
+
+def test_chunks_of_one_complaint_share_an_excerpt():
+    chunks = [
+        chunk("the bank refused to refund me. They closed my account.", "7", 1),
+        chunk("Unrelated complaint text.", "9", 0, issue="Fees"),
+        chunk("I was charged twice and the bank refused to refund me.", "7", 0),
+        chunk("Much later the fee came back.", "7", 5),
+    ]
+    packed = pack_context(chunks, count_words)
+
+    assert packed.text == (
+        "All excerpts: Company: Company A\n\n"
+        "[Excerpt 1] Issue: Late delivery\n"
+        "I was charged twice and the bank refused to refund me. They closed my account. [...] "
+        "Much later the fee came back.\n\n"
+        "[Excerpt 2] Issue: Fees\n"
+        "Unrelated complaint text.")
+    assert packed.included == [0, 1, 2, 3] and packed.dropped == []
+    assert packed.tokens == count_words(packed.text)
+
+
+# -----------------------------
+# Test the token budget
+# -----------------------------
+def test_budget_is_filled_in_score_order():
+    chunks = [
+        chunk("best " * 10, "1", 0, company="A"),
+        chunk("long " * 50, "2", 0, company="B"),
+        chunk("short " * 5, "3", 0, company="C"),
+    ]
+    packed = pack_context(chunks, count_words, budget=40)
+
+    assert packed.included == [0, 2] and packed.dropped == [1]
+    assert packed.tokens <= 40 and "long" not in packed.text and "Company: C" in packed.text
+
+
+def test_best_chunk_is_truncated_when_nothing_fits():
+    packed = pack_context([chunk("word " * 100, "1", 0)], count_words, budget=30)
+    assert packed.included == [0] and packed.tokens <= 30
+    assert packed.text.endswith("[...]") and packed.text.count("word") > 10
+
+
+@pytest.mark.parametrize("budget", [None, 1000])
+def test_distinct_chunks_keep_full_headers(budget):
+    chunks = [chunk("Text A", "1", 0), chunk("Text B", "2", 0, company="Company B", issue="Damaged item")]
+    assert pack_context(chunks, count_words, budget).text == (
+        "[Excerpt 1] Company: Company A | Issue: Late delivery\nText A\n\n"
+        "[Excerpt 2] Company: Company B | Issue: Damaged item\nText B")
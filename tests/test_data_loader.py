@@ -0,0 +1,105 @@
+# tests/test_data_loader.py
+
+import pandas as pd
+import pytest
+from src.data_loader import stream_batches, write_partitioned_parquet
+
+# -----------------------------
+# Fixture for a sample DataFrame
+# -----------------------------
+@pytest.fixture
+def complaints_df():
+    return pd.DataFrame({
+        "Complaint ID": range(10),
+        "Product_category": ["Credit card", "Personal loan"] * 5,
+        "Consumer complaint narrative": ["charged twice\nno refund"] * 10,
+    })
+
+# -----------------------------
+# Tests for stream_batches
+# -----------------------------
+def test_stream_csv_batches_and_columns(tmp_path, complaints_df):
+    path = tmp_path / "complaints.csv"
+    complaints_df.to_csv(path, index=False)
+
+    batches = list(stream_batches(path, columns=["Complaint ID", "Consumer complaint narrative"], batch_size=4))
+
+    assert [b.num_rows for b in batches] == [4, 4, 2]
+    assert batches[0].schema.names == ["Complaint ID", "Consumer complaint narrative"]
+    # Quoted line breaks stay inside the narrative
+    assert batches[0].column(1)[0].as_py() == "charged twice\nno refund"
+
+def test_stream_csv_sparse_columns_after_first_block(tmp_path):
+    import pyarrow as pa
+
+    # Arrow infers CSV types from the first block (1 MB): Tags is empty there
+    rows = 150_000
+    path = tmp_path / "complaints.csv"
+    pd.DataFrame({
+        "Complaint ID": range(rows),
+        "ZIP code": ["01234"] * rows,
+        "Tags": [None] * (rows - 1) + ["Older American"],
+    }).to_csv(path, index=False)
+
+    df = pd.concat(b.to_pandas() for b in stream_batches(path, batch_size=50_000,
+                                                         column_types={"Complaint ID": pa.int64()}))
+
+    assert df["Tags"].iloc[-1] == "Older American" and df["Tags"].iloc[0] is None
+    assert (df["ZIP code"] == "01234").all()  # leading zeros are kept
+    assert df["Complaint ID"].tolist() == list(range(rows))
+
+def test_stream_json_lines_sparse_fields_after_first_block(tmp_path):
+    # Tags is null throughout the first block (1 MB) and filled in later
+    rows = 60_000
+    path = tmp_path / "complaints.jsonl"
+    pd.DataFrame({
+        "Complaint ID": range(rows),
+        "Tags": [None] * (rows - 1) + ["Older American"],
+    }).to_json(path, orient="records", lines=True)
+
+    batches = list(stream_batches(path, columns=["Tags"], batch_size=20_000))
+    df = pd.concat(b.to_pandas() for b in batches)
+
+    assert batches[0].schema.names == ["Tags"]  # projected while parsing
+    assert df["Tags"].iloc[-1] == "Older American" and df["Tags"].iloc[0] is None
+
+def test_stream_json_lines(tmp_path, complaints_df):
+    path = tmp_path / "complaints.jsonl"
+    complaints_df.to_json(path, orient="records", lines=True)
+
+    df = pd.concat(b.to_pandas() for b in stream_batches(path, columns=["Complaint ID"], batch_size=3))
+
+    assert df["Complaint ID"].tolist() == list(range(10))
+    assert list(df.columns) == ["Complaint ID"]
+
+def test_stream_unsupported_type(tmp_path):
+    path = tmp_path / "complaints.xlsx"
+    path.write_text("")
+    with pytest.raises(ValueError):
+        list(stream_batches(path))
+
+# -----------------------------
+# Tests for write_partitioned_parquet
+# -----------------------------
+def test_partitioned_parquet_round_trip(tmp_path, complaints_df):
+    out = write_partitioned_parquet([complaints_df.iloc[:5], complaints_df.iloc[5:]], tmp_path / "dataset")
+
+    assert len(list(out.iterdir())) == 2  # one directory per category
+    df = pd.concat(
+        b.to_pandas()
+        for b in stream_batches(out, columns=["Complaint ID"], filters={"Product_category": "Credit card"})
+    )
+    assert sorted(df["Complaint ID"].tolist()) == [0, 2, 4, 6, 8]
+
+def test_partitioned_parquet_missing_column(tmp_path, complaints_df):
+    with pytest.raises(ValueError):
+        write_partitioned_parquet(complaints_df, tmp_path / "dataset", partition_col="state")
+
+def test_partitioned_parquet_column_empty_in_first_batch(tmp_path, complaints_df):
+    first, rest = complaints_df.iloc[:5].copy(), complaints_df.iloc[5:].copy()
+    first["Tags"], rest["Tags"] = None, "Older American"
+
+    out = write_partitioned_parquet([first, rest], tmp_path / "dataset")
+
+    df = pd.concat(b.to_pandas() for b in stream_batches(out, columns=["Complaint ID", "Tags"]))
+    assert sorted(df.loc[df["Tags"].notna(), "Complaint ID"].tolist()) == [5, 6, 7, 8, 9]
@@ -1,8 +1,9 @@
 # tests/test_data_preprocessing.py
 
 import pandas as pd
+import pyarrow as pa
 import pytest
-from src.data_preprocessing import ComplaintPreprocessor
+from src.data_preprocessing import ComplaintPreprocessor, TokenTransform, preprocess_file_parallel
 
 # -----------------------------
 # Fixture for a sample DataFrame
@@ -58,3 +59,98 @@ def test_preprocess_pipeline(sample_df):
     # Check that the final output is string
     assert isinstance(df_cleaned.iloc[0, 0], str)
 
+
+# -----------------------------
+# Test the fused fast mode
+# -----------------------------
+class SuffixLemmatizer:
+    """Stand-in for WordNet so the test does not need the corpus."""
+    def lemmatize(self, word):
+        return word[:-1] if word.endswith("s") and len(word) > 3 else word
+
+@pytest.fixture
+def resource_files(tmp_path):
+    boilerplate = tmp_path / "boilerplate.txt"
+    boilerplate.write_text("I am writing to file a complaint\nThank you for your time\nunkn\nown\n")
+    stopwords = tmp_path / "stopwords.txt"
+    stopwords.write_text("the\na\nof\nto\n")
+    return str(boilerplate), str(stopwords)
+
+def test_fast_mode_matches_pipeline(resource_files):
+    narratives = [
+        "I am writing to file a complaint about the FEES on my accounts!!",
+        "Email john@example.com or call (555) 123-4567, thank you for your time.",
+        "The bank said N/A and xxxxxxx --- unknanown financial loss?",
+        "Ünïcode naïve text... with\ttabs\nand newlines",
+        None,
+        "   ",
+    ]
+    preprocessor = ComplaintPreprocessor(*resource_files, verbose=False)
+    preprocessor.lemmatizer = SuffixLemmatizer()
+
+    expected = preprocessor.preprocess(pd.DataFrame({"text": narratives}), "text")
+    fast = preprocessor.preprocess(pd.DataFrame({"text": narratives}), "text", fast=True)
+
+    assert fast.equals(expected)
+
+# -----------------------------
+# Test parallel file preprocessing
+# -----------------------------
+@pytest.mark.parametrize("output_name", ["cleaned.csv", "cleaned.parquet"])
+def test_preprocess_file_parallel_preserves_order(tmp_path, monkeypatch, resource_files, output_name):
+    # Workers are forked, so they inherit the patched lemmatizer class
+    monkeypatch.setattr("src.data_preprocessing.WordNetLemmatizer", SuffixLemmatizer)
+    narratives = [f"Complaint number {i} about the FEES of xxxx accounts" for i in range(25)] + [None, "  "]
+    input_path = tmp_path / "complaints.csv"
+    pd.DataFrame({"id": range(len(narratives)), "text": narratives}).to_csv(input_path, index=False)
+    output_path = tmp_path / output_name
+
+    stats = preprocess_file_parallel(input_path, output_path, "text", *resource_files,
+                                     batch_size=4, n_workers=2, verbose=False,
+                                     column_types={"id": pa.int64()})
+
+    preprocessor = ComplaintPreprocessor(*resource_files, verbose=False)
+    expected = preprocessor.preprocess(pd.read_csv(input_path), "text").reset_index(drop=True)
+    result = pd.read_csv(output_path) if output_name.endswith(".csv") else pd.read_parquet(output_path)
+
+    assert result["id"].tolist() == expected["id"].tolist()
+    assert result["text"].tolist() == expected["text"].tolist()
+    assert sum(w.rows_in for w in stats.values()) == len(narratives)
+    assert sum(w.batches for w in stats.values()) == 7
+
+# -----------------------------
+# Test the memoized token transform
+# -----------------------------
+def test_token_transform_resolves_each_token_once():
+    calls = []
+    def lemmatize(word):
+        calls.append(word)
+        return word.rstrip("s")
+    transform = TokenTransform(["the"], lemmatize, ["xxxx"])
+
+    assert transform.transform("the fees the fees xxxxs") == "fee fee"
+    assert calls == ["fees", "xxxxs"]
+    assert transform.table == {"the": "", "fees": "fee", "xxxxs": ""}
+
+def test_token_transform_max_size():
+    transform = TokenTransform([], str.upper, max_size=2)
+    transform.transform("a b c")
+    assert list(transform.table) == ["b", "c"]
+
+def test_token_transform_save_and_load(tmp_path):
+    path = tmp_path / "vocab.json"
+    transform = TokenTransform(["the"], str.upper)
+    transform.transform("the loans")
+    transform.save(path)
+
+    reloaded = TokenTransform(["the"], lambda word: pytest.fail("should hit the saved table"))
+    reloaded.load(path)
+    assert reloaded.transform("the loans") == "LOANS"
+
+    with pytest.raises(ValueError):
+        TokenTransform(["a"], str.upper).load(path)
+
+    # A bounded table stays bounded when a larger saved table is loaded
+    bounded = TokenTransform(["the"], str.upper, max_size=1)
+    bounded.load(path)
+    assert list(bounded.table) == ["loans"]
@@ -0,0 +1,129 @@
+# tests/test_deduplication.py
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from src.chunking import CHUNK_SCHEMA
+from src.deduplication import (
+    _permutations,
+    deduplicate_chunks,
+    load_duplicate_map,
+    minhash_signature,
+    with_duplicate_sources,
+)
+
+BASE = " ".join(f"the bank charged an overdraft fee number {i} without any notice" for i in range(20))
+
+
+def _chunk(text, complaint_id, chunk_index=0):
+    return {
+        "chunk_text": text,
+        "metadata": {
+            "complaint_id": complaint_id, "product_category": "Credit card", "product": "N/A",
+            "issue": "N/A", "sub_issue": "N/A", "company": "Bank A", "state": "N/A",
+            "date_received": "N/A", "chunk_index": chunk_index, "total_chunks": 1,
+        },
+        "start_char": 0,
+        "end_char": len(text),
+    }
+
+
+# -----------------------------
+# Fixture for a chunk file with duplicates
+# -----------------------------
+@pytest.fixture
+def chunk_file(tmp_path):
+    rows = [
+        _chunk(BASE, "1"),
+        _chunk("my mortgage servicer lost my payment twice and reported me late", "2"),
+        _chunk(BASE, "3"),                                       # exact copy of 1
+        _chunk("  " + BASE.replace(" ", "  ") + " ", "4"),         # whitespace only
+        _chunk(BASE.replace("fee number 7", "fee number 70"), "5"),  # near copy of 1
+        _chunk("a completely different complaint about a debt collector calling", "6"),
+    ]
+    path = tmp_path / "chunks.parquet"
+    pq.write_table(pa.Table.from_pylist(rows, schema=CHUNK_SCHEMA), path)
+    return path
+
+
+# -----------------------------
+# Test MinHash similarity estimate
+# -----------------------------
+def test_minhash_estimates_jaccard():
+    a, b = _permutations(256)
+    same = minhash_signature(BASE, a, b)
+    near = minhash_signature(BASE.replace("fee number 7", "fee number 70"), a, b)
+    other = minhash_signature("my mortgage servicer lost my payment twice", a, b)
+
+    assert np.array_equal(same, minhash_signature(BASE, a, b))
+    assert np.mean(same == near) > 0.8
+    assert np.mean(same == other) < 0.1
+
+
+# -----------------------------
+# Test the dedup stage
+# -----------------------------
+def test_deduplicate_chunks(tmp_path, chunk_file):
+    output = tmp_path / "deduped.parquet"
+    report = deduplicate_chunks(chunk_file, output, batch_size=2, n_workers=2, verbose=False)
+
+    kept = pq.read_table(output)
+    assert kept.schema == CHUNK_SCHEMA
+    assert [m["complaint_id"] for m in kept.column("metadata").to_pylist()] == ["1", "2", "6"]
+    assert report.input_chunks == 6
+    assert report.exact_duplicates == 2
+    assert report.near_duplicates == 1
+    assert report.kept_chunks == 3
+    assert report.shrink == pytest.approx(0.5)
+    assert report.complaints_fully_duplicated == 3
+    assert report.index_bytes_saved(dim=384) == 3 * 384 * 4
+
+    mapping = pq.read_table(tmp_path / "deduped.duplicates.parquet").to_pylist()
+    assert [(m["row"], m["canonical_id"], m["kind"]) for m in mapping] == [
+        (2, 0, "exact"), (3, 0, "exact"), (4, 0, "near"),
+    ]
+    assert all(m["canonical_complaint_id"] == "1" for m in mapping)
+
+
+def test_duplicate_sources_are_attributed(tmp_path, chunk_file):
+    output = tmp_path / "deduped.parquet"
+    deduplicate_chunks(chunk_file, output, mapping_path=tmp_path / "map.parquet", n_workers=1, verbose=False)
+    duplicates = load_duplicate_map(tmp_path / "map.parquet")
+
+    results = [{"text": BASE, "metadata": {"complaint_id": "1", "chunk_index": 0}, "score": 1.0},
+               {"text": "x", "metadata": {"complaint_id": "2", "chunk_index": 0}, "score": 0.5}]
+    attributed = with_duplicate_sources(results, duplicates)
+
+    assert attributed[0]["metadata"]["duplicate_complaint_ids"] == ["3", "4", "5"]
+    assert attributed[1]["metadata"]["duplicate_complaint_ids"] == []
+    assert "duplicate_complaint_ids" not in results[0]["metadata"]
+
+
+def test_deduplicate_rejects_uneven_bands(tmp_path, chunk_file):
+    with pytest.raises(ValueError):
+        deduplicate_chunks(chunk_file, tmp_path / "out.parquet", num_perm=10, bands=4, verbose=False)
+
+
+def test_deduplicate_exact_copy_of_near_duplicate(tmp_path):
+    near = BASE.replace("fee number 7", "fee number 70")
+    path = tmp_path / "chunks.parquet"
+    pq.write_table(pa.Table.from_pylist([_chunk(BASE, "1"), _chunk(near, "2"), _chunk(near, "3")],
+                                        schema=CHUNK_SCHEMA), path)
+
+    report = deduplicate_chunks(path, tmp_path / "deduped.parquet", n_workers=1, verbose=False)
+
+    mapping = pq.read_table(tmp_path / "deduped.duplicates.parquet").to_pylist()
+    assert [(m["row"], m["canonical_id"], m["kind"]) for m in mapping] == [(1, 0, "near"), (2, 0, "exact")]
+    assert (report.exact_duplicates, report.near_duplicates) == (1, 1)
+
+
+def test_deduplicate_empty_input_writes_both_files(tmp_path):
+    path = tmp_path / "chunks.parquet"
+    pq.write_table(CHUNK_SCHEMA.empty_table(), path)
+
+    report = deduplicate_chunks(path, tmp_path / "deduped.parquet", n_workers=1, verbose=False)
+
+    assert report.input_chunks == 0
+    assert pq.read_table(tmp_path / "deduped.parquet").schema == CHUNK_SCHEMA
+    assert pq.read_table(tmp_path / "deduped.duplicates.parquet").num_rows == 0
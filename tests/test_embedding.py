@@ -0,0 +1,62 @@
+# tests/test_embedding.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.embedding import embed_chunks, length_buckets
+
+# -----------------------------
+# Fake encoder (module level so spawned workers can import it)
+# -----------------------------
+class FakeEncoder:
+    """Deterministic stand-in for SentenceTransformer: embeds text length."""
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True):
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype="float32")
+
+def fake_encoder_factory(model_name):
+    return FakeEncoder()
+
+@pytest.fixture
+def chunks_parquet(tmp_path):
+    path = tmp_path / "chunks.parquet"
+    texts = [f"chunk {'x' * (i % 7)} {i}" for i in range(10)]
+    pd.DataFrame({"chunk_text": texts, "metadata": [{"complaint_id": str(i)} for i in range(10)]}).to_parquet(path)
+    return path, texts
+
+# -----------------------------
+# Test length bucketing
+# -----------------------------
+def test_length_buckets_sorts_and_respects_token_budget():
+    lengths = [50, 5, 10, 40, 6, 45]
+    batches = length_buckets(lengths, max_batch_tokens=100, max_batch_size=10)
+
+    assert sorted(i for b in batches for i in b) == list(range(6))
+    for batch in batches:
+        assert len(batch) * max(lengths[i] for i in batch) <= 100
+    assert batches[0] == [1, 4, 2]  # shortest rows share a batch
+
+# -----------------------------
+# Test sharded, resumable embedding
+# -----------------------------
+def test_embed_chunks_writes_shards_and_resumes(tmp_path, chunks_parquet):
+    input_path, texts = chunks_parquet
+    out = tmp_path / "embeddings"
+
+    embed_chunks(input_path, out, shard_size=4, n_workers=1, threads_per_worker=1,
+                 encoder_factory=fake_encoder_factory, verbose=False)
+    shards = sorted(out.glob("shard-*.parquet"))
+    assert len(shards) == 3
+
+    df = pd.read_parquet(out)
+    assert df["chunk_text"].tolist() == texts
+    assert [e[0] for e in df["embedding"]] == [len(t) for t in texts]
+    assert df["embedding"].iloc[0].dtype == np.float32
+
+    # A finished shard is not recomputed
+    shards[0].unlink()
+    stats = embed_chunks(input_path, out, shard_size=4, n_workers=1, threads_per_worker=1,
+                         encoder_factory=fake_encoder_factory, verbose=False)
+    assert sum(w.rows_in for w in stats.values()) == 4
+
+    with pytest.raises(ValueError):
+        embed_chunks(input_path, out, shard_size=5, encoder_factory=fake_encoder_factory, verbose=False)
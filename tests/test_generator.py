@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from unittest.mock import MagicMock, patch
 
@@ -48,3 +49,75 @@ def test_build_generator():
         from src.generator import build_generator
         gen = build_generator("fake/path/model.gguf")
         assert isinstance(gen, RAGGenerator)
+
+# -----------------------------
+# Test prompt prefix reuse
+# -----------------------------
+def test_prompt_starts_with_static_prefix(dummy_chunks):
+    gen = RAGGenerator.__new__(RAGGenerator)
+    gen.model = MagicMock()
+    gen.model.return_value = {"choices": [{"text": "Mocked answer"}]}
+    gen.prefix_cache = MagicMock()
+
+    prompt = gen.build_prompt("What happened?", dummy_chunks)
+    assert prompt.startswith(gen.prompt_prefix()) and prompt.endswith(" [/INST]")
+    assert "financial analyst" in gen.prompt_prefix() and "What happened?" not in gen.prompt_prefix()
+    assert "[Excerpt 1] Company: Company A" in prompt[len(gen.prompt_prefix()):]
+
+    gen.generate("What happened?", dummy_chunks)
+    gen.prefix_cache.restore.assert_called_once()
+
+
+def test_prompt_context_respects_token_budget(dummy_chunks):
+    gen = RAGGenerator.__new__(RAGGenerator)
+    gen.model = MagicMock()
+    gen.model.tokenize.side_effect = lambda text, add_bos=False, special=False: text.split()
+    gen.context_tokens = 14  # one excerpt: 9 header words + 4 text words
+
+    prompt = gen.build_prompt("What happened?", dummy_chunks)
+    assert "Complaint about product A" in prompt and "Complaint about product B" not in prompt
+
+
+# -----------------------------
+# Test cancellation
+# -----------------------------
+def test_generate_passes_cancellation_to_the_model(dummy_chunks):
+    from src.streaming import CancellationToken
+
+    gen = RAGGenerator.__new__(RAGGenerator)
+    gen.model = MagicMock()
+    gen.model.return_value = {"choices": [{"text": "Partial", "finish_reason": "length"}]}
+    token = CancellationToken(max_tokens=32)
+
+    assert gen.generate("What happened?", dummy_chunks, cancellation=token) == "Partial"
+    kwargs = gen.model.call_args.kwargs
+    assert kwargs["max_tokens"] == 32 and kwargs["stopping_criteria"] is token
+    assert token.reason == "max_tokens"
+
+    gen.model.reset_mock()
+    cancelled = CancellationToken()
+    cancelled.cancel()
+    assert gen.generate("What happened?", dummy_chunks, cancellation=cancelled) == ""
+    assert list(gen.stream("What happened?", dummy_chunks, cancellation=cancelled)) == []
+    gen.model.assert_not_called()
+
+
+# -----------------------------
+# Test prompt-lookup speculative decoding
+# -----------------------------
+def test_prompt_lookup_decoding_is_opt_in(tmp_path):
+    from src.generator import build_generator
+
+    with patch("src.generator.Llama") as MockLlama:
+        RAGGenerator(model_path=str(tmp_path / "model.gguf"), cache_prefix=False)
+        assert MockLlama.call_args.kwargs["draft_model"] is None
+
+        RAGGenerator(model_path=str(tmp_path / "model.gguf"), cache_prefix=False, prompt_lookup_tokens=8)
+        draft = MockLlama.call_args.kwargs["draft_model"]
+        assert draft.num_pred_tokens == 8
+        # Drafts the tokens that followed the last n-gram earlier in the prompt
+        assert draft(np.array([5, 6, 7, 8, 9, 5, 6], dtype=np.intc)).tolist() == [7, 8, 9, 5, 6]
+
+    with patch("src.generator_pool.GeneratorPool") as MockPool:
+        build_generator("model.gguf", n_workers=2, prompt_lookup_tokens=8)
+        assert MockPool.call_args.kwargs["generator_factory"].keywords == {"prompt_lookup_tokens": 8}
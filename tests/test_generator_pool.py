@@ -0,0 +1,109 @@
+# tests/test_generator_pool.py
+
+import os
+import threading
+import time
+
+import pytest
+from src.generator_pool import GeneratorPool, print_generator_pool_stats
+
+dummy_chunks = [{"text": "Complaint about product A", "metadata": {"company": "Company A"}}]
+
+
+# -----------------------------
+# Fake generator built inside each worker process
+# -----------------------------
+class FakeGenerator:
+    def __init__(self, n_threads):
+        self.n_threads = n_threads
+
+    def generate(self, question, chunks, cancellation=None):
+        if question == "boom":
+            raise ValueError("bad prompt")
+        if question == "crash":
+            os._exit(3)
+        if question == "endless":
+            while not cancellation.cancelled:  # like llama.cpp's per-token stopping criterion
+                time.sleep(0.01)
+            return "partial"
+        time.sleep(0.2)
+        return f"{os.getpid()}:{self.n_threads}:{question}:{len(chunks)}"
+
+    def stream(self, question, chunks, cancellation=None):
+        for word in ["answer ", "to ", question]:
+            yield word
+
+
+def fake_factory(model_path, n_threads):
+    return FakeGenerator(n_threads)
+
+
+def failing_factory(model_path, n_threads):
+    raise FileNotFoundError(model_path)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with GeneratorPool("model.gguf", n_workers=2, threads_per_worker=3, generator_factory=fake_factory,
+                       start_timeout=60) as pool:
+        yield pool
+
+
+# -----------------------------
+# Test dispatch across workers
+# -----------------------------
+def test_concurrent_requests_use_every_worker(pool):
+    answers = [None] * 4
+    def ask(i):
+        answers[i] = pool.generate(f"q{i}", dummy_chunks)
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    pids = {a.split(":")[0] for a in answers}
+    assert pids == {str(s.pid) for s in pool.stats}  # least-loaded dispatch spreads the load
+    assert all(a.split(":")[1:] == ["3", f"q{i}", "1"] for i, a in enumerate(answers))
+    assert all(s.completed == 2 and s.in_flight == 0 and len(s.latencies) == 2 for s in pool.stats)
+    assert all(s.busy_seconds >= 0.4 for s in pool.stats)
+    print_generator_pool_stats(pool)
+
+
+def test_stream_yields_pieces(pool):
+    assert list(pool.stream("q", dummy_chunks)) == ["answer ", "to ", "q"]
+
+
+def test_worker_errors_are_raised_in_the_caller(pool):
+    with pytest.raises(RuntimeError, match="bad prompt"):
+        pool.generate("boom", dummy_chunks)
+    assert sum(s.failed for s in pool.stats) == 1
+    assert pool.generate("again", dummy_chunks).endswith(":again:1")
+
+
+def test_cancellation_reaches_the_worker(pool):
+    from src.streaming import CancellationToken
+
+    cancellation = CancellationToken()
+    threading.Timer(0.3, cancellation.cancel).start()
+    assert pool.generate("endless", dummy_chunks, cancellation=cancellation) == "partial"
+    assert cancellation.reason == "cancelled"
+
+    cancellation = CancellationToken(timeout=0.3)
+    assert pool.generate("endless", dummy_chunks, cancellation=cancellation) == "partial"
+    assert cancellation.reason == "deadline"
+
+
+# -----------------------------
+# Test failures of worker processes
+# -----------------------------
+def test_dead_worker_fails_its_request():
+    with GeneratorPool("model.gguf", n_workers=1, threads_per_worker=1, generator_factory=fake_factory,
+                       start_timeout=60) as pool:
+        with pytest.raises(RuntimeError, match="died"):
+            pool.generate("crash", dummy_chunks)
+
+
+def test_model_load_failure_is_reported():
+    with pytest.raises(RuntimeError, match="failed to load"):
+        GeneratorPool("missing.gguf", n_workers=1, generator_factory=failing_factory, start_timeout=60)
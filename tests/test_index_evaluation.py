@@ -0,0 +1,48 @@
+# tests/test_index_evaluation.py
+
+import numpy as np
+from src.index_evaluation import evaluate_index_configs, recall_at_k
+
+# -----------------------------
+# Tests for recall_at_k
+# -----------------------------
+def test_recall_at_k_ignores_missing_results():
+    truth = np.array([[1, 2], [3, 4]])
+    found = np.array([[2, 1], [3, -1]])
+    assert recall_at_k(found, truth) == 0.75
+
+# -----------------------------
+# Tests for evaluate_index_configs
+# -----------------------------
+def test_evaluate_index_configs_sweeps_query_knobs():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype("float32")
+    queries = vectors[:20] + 0.01
+
+    reports = evaluate_index_configs(vectors, queries, [
+        {"index_type": "flat"},
+        {"index_type": "ivf_flat", "nlist": 8, "nprobe": [1, 8]},
+        {"index_type": "hnsw", "hnsw_m": 8, "ef_search": [64]},
+    ], k=3)
+
+    assert [r.config for r in reports] == [
+        "flat", "ivf_flat(nlist=8) nprobe=1", "ivf_flat(nlist=8) nprobe=8", "hnsw(hnsw_m=8) ef_search=64",
+    ]
+    assert reports[0].recall == 1.0
+    assert reports[2].recall == 1.0  # probing every list is exact
+    assert all(r.p99_ms >= r.p50_ms > 0 for r in reports)
+
+def test_evaluate_index_configs_reports_compression_and_rerank():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 32)).astype("float32")
+    queries = vectors[:20] + 0.01
+
+    reports = evaluate_index_configs(vectors, queries, [
+        {"index_type": "sq_fp16"},
+        {"index_type": "pq", "pq_m": 8, "pq_bits": 4, "rerank": [0, 200]},
+    ], k=3)
+
+    assert [r.config for r in reports] == ["sq_fp16", "pq(pq_m=8, pq_bits=4)", "pq(pq_m=8, pq_bits=4) rerank=200"]
+    assert reports[0].compression > 1.5 and reports[1].compression > 5
+    assert reports[2].recall == 1.0 > reports[1].recall  # re-ranking restores exact results
+    assert reports[2].disk_mb == vectors.nbytes / 1e6 and reports[1].disk_mb == 0
@@ -0,0 +1,63 @@
+# tests/test_lexical_index.py
+
+import numpy as np
+import pytest
+from src.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "overdraft fee charged twice on checking account",
+    "wire transfer delayed for a week",
+    "credit card interest rate increased",
+    "overdraft protection not explained, overdraft fee again",
+    "",
+]
+
+@pytest.fixture
+def index():
+    return BM25Index.build(TEXTS)
+
+# -----------------------------
+# Tests for building and searching
+# -----------------------------
+def test_tokenize():
+    assert tokenize("Wire-transfer of $500, delayed!") == ["wire", "transfer", "of", "500", "delayed"]
+
+def test_csr_layout(index):
+    term = index.vocabulary["overdraft"]
+    postings = index.doc_ids[index.indptr[term]:index.indptr[term + 1]]
+    assert postings.tolist() == [0, 3]
+    assert len(index.doc_ids) == len(index.impacts) == index.indptr[-1]
+
+def test_build_in_batches_matches_single_batch(index):
+    batched = BM25Index.build(iter(TEXTS), batch_size=2)
+    assert batched.vocabulary == index.vocabulary
+    assert batched.indptr.tolist() == index.indptr.tolist()
+    assert batched.doc_ids.tolist() == index.doc_ids.tolist()
+    np.testing.assert_allclose(batched.impacts, index.impacts)
+    assert batched.doc_ids.dtype == np.int32 and len(batched) == len(TEXTS)
+
+def test_search_ranks_by_bm25(index):
+    docs, scores = index.search("overdraft fee", k=10)
+    # Chunk 3 mentions overdraft twice
+    assert docs.tolist() == [3, 0]
+    assert scores[0] > scores[1] > 0
+
+def test_search_exclude_allowed_and_unknown_terms(index):
+    assert index.search("overdraft", exclude=np.array([3]))[0].tolist() == [0]
+    assert index.search("overdraft wire", allowed=np.array([1, 2]))[0].tolist() == [1]
+    assert len(index.search("mortgage")[0]) == 0
+
+def test_save_and_load(tmp_path, index):
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.num_docs == 5
+    np.testing.assert_array_equal(loaded.search("wire transfer")[0], index.search("wire transfer")[0])
+
+# -----------------------------
+# Tests for reciprocal_rank_fusion
+# -----------------------------
+def test_reciprocal_rank_fusion():
+    ids, scores = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=2)
+    assert ids == [1, 3]
+    assert scores[0] == pytest.approx(1 / 61 + 1 / 62)
@@ -1,8 +1,16 @@
 import pytest
+from contextlib import contextmanager
 from unittest.mock import MagicMock, patch
 
 from src.rag_pipeline import RAGPipeline, build_rag_pipeline
 
+@contextmanager
+def patch_retriever():
+    """Patch the vector store and embedder loaders; yields the mocked ComplaintRetriever class."""
+    with patch("src.rag_pipeline.load_vector_store"), patch("src.rag_pipeline.build_embedder"), \
+         patch("src.rag_pipeline.ComplaintRetriever") as mock_retriever_class:
+        yield mock_retriever_class
+
 # -----------------------------
 # Dummy data for retrieval
 # -----------------------------
@@ -16,13 +24,13 @@ dummy_chunks = [
 # -----------------------------
 def test_rag_pipeline_run():
     # Mock the retriever and generator
-    with patch("src.rag_pipeline.build_retriever") as mock_build_retriever, \
+    with patch_retriever() as mock_retriever_class, \
          patch("src.rag_pipeline.build_generator") as mock_build_generator:
 
         # Create dummy retriever
         mock_retriever = MagicMock()
         mock_retriever.retrieve.return_value = dummy_chunks
-        mock_build_retriever.return_value = mock_retriever
+        mock_retriever_class.return_value = mock_retriever
 
         # Create dummy generator
         mock_generator = MagicMock()
@@ -40,11 +48,132 @@ def test_rag_pipeline_run():
         mock_generator.generate.assert_called_once_with("What happened?", dummy_chunks)
         assert answer == "Mocked answer"
 
+# -----------------------------
+# Test the semantic answer cache skips generation for repeat questions
+# -----------------------------
+def test_rag_pipeline_answer_cache():
+    import numpy as np
+    from src.cache import SemanticAnswerCache
+
+    with patch_retriever() as mock_retriever_class, \
+         patch("src.rag_pipeline.build_generator") as mock_build_generator:
+        mock_retriever = MagicMock()
+        mock_retriever.retrieve.return_value = dummy_chunks
+        mock_retriever.embed_question.return_value = np.ones(384, dtype="float32")
+        mock_retriever.vector_store.version = 0
+        mock_retriever_class.return_value = mock_retriever
+        mock_generator = MagicMock()
+        mock_generator.generate.return_value = "Mocked answer"
+        mock_build_generator.return_value = mock_generator
+
+        pipeline = RAGPipeline("dummy.index", "dummy.json", "dummy_model.gguf",
+                               answer_cache=SemanticAnswerCache())
+
+        assert pipeline.run("What happened?") == "Mocked answer"
+        repeat = pipeline.answer("What happened there?")
+        assert repeat == {"answer": "Mocked answer", "sources": dummy_chunks, "cached": True}
+        assert mock_generator.generate.call_count == 1
+
+        # Re-indexing invalidates cached answers
+        mock_retriever.vector_store.version = 1
+        assert pipeline.answer("What happened?")["cached"] is False
+        assert mock_generator.generate.call_count == 2
+
+# -----------------------------
+# Test streaming (sync and async)
+# -----------------------------
+def test_rag_pipeline_stream_yields_sources_tokens_and_metrics():
+    import asyncio
+
+    with patch_retriever() as mock_retriever_class, \
+         patch("src.rag_pipeline.build_generator") as mock_build_generator:
+        mock_retriever_class.return_value.retrieve.return_value = dummy_chunks
+        mock_build_generator.return_value.stream.side_effect = lambda q, c: iter(["Mocked ", "answer "])
+        pipeline = RAGPipeline("dummy.index", "dummy.json", "dummy_model.gguf")
+
+        events = list(pipeline.stream("What happened?", k=2))
+        assert events[:3] == [("sources", dummy_chunks), ("token", "Mocked "), ("token", "answer ")]
+        kind, result = events[3]
+        assert kind == "done" and result["answer"] == "Mocked answer" and result["cached"] is False
+        metrics = result["metrics"]
+        assert metrics.tokens == 2 and 0 < metrics.first_token_seconds <= metrics.total_seconds
+
+        async def collect():
+            return [event async for event in pipeline.astream("What happened?", k=2)]
+        assert [k for k, _ in asyncio.run(collect())] == ["sources", "token", "token", "done"]
+
+def test_rag_pipeline_counts_stopped_generations():
+    from src.streaming import CancellationToken
+
+    with patch_retriever() as mock_retriever_class, \
+         patch("src.rag_pipeline.build_generator") as mock_build_generator:
+        mock_retriever_class.return_value.retrieve.return_value = dummy_chunks
+        generator = mock_build_generator.return_value
+
+        def generate(question, chunks, cancellation):
+            cancellation.cancel(CancellationToken.DEADLINE)
+            return "Partial"
+        generator.generate.side_effect = generate
+        generator.stream.side_effect = lambda q, c: iter(["Mocked ", "answer "])
+        pipeline = RAGPipeline("dummy.index", "dummy.json", "dummy_model.gguf")
+        pipeline.answer_cache = MagicMock()
+        pipeline.answer_cache.lookup.return_value = None
+
+        result = pipeline.answer("What happened?", cancellation=CancellationToken(timeout=30))
+        assert result["answer"] == "Partial" and result["stop_reason"] == "deadline"
+        pipeline.answer_cache.store.assert_not_called()
+
+        stream = pipeline.stream("What happened?")
+        assert [next(stream)[0], next(stream)[0]] == ["sources", "token"]
+        stream.close()  # consumer stopped reading: not a cancellation
+        assert pipeline.stop_counts == {"cancelled": 0, "deadline": 1, "max_tokens": 0, "closed": 1}
+
+        cancellation = CancellationToken()
+        generator.stream.side_effect = lambda q, c, cancellation: iter(["Mocked ", "answer "])
+        stream = pipeline.stream("What happened?", cancellation=cancellation)
+        assert [next(stream)[0], next(stream)[0]] == ["sources", "token"]
+        cancellation.cancel()  # client pressed Stop
+        stream.close()
+        assert pipeline.stop_counts == {"cancelled": 1, "deadline": 1, "max_tokens": 0, "closed": 1}
+
+# -----------------------------
+# Test background loading
+# -----------------------------
+def test_rag_pipeline_background_loading():
+    import threading
+    release = threading.Event()
+
+    def slow_generator(path):
+        release.wait(5)
+        return MagicMock(generate=MagicMock(return_value="Mocked answer"))
+
+    with patch_retriever() as mock_retriever_class, \
+         patch("src.rag_pipeline.load_vector_store") as mock_load_vector_store, \
+         patch("src.rag_pipeline.build_generator", side_effect=slow_generator):
+        mock_retriever_class.return_value.retrieve.return_value = dummy_chunks
+
+        pipeline = RAGPipeline("dummy.index", "dummy.json", "dummy_model.gguf", background=True, verbose=False)
+        assert not pipeline.ready
+        assert pipeline.retriever.retrieve("What happened?", k=2) == dummy_chunks  # usable before the LLM
+        release.set()
+
+        assert pipeline.run("What happened?", k=2) == "Mocked answer"
+        assert pipeline.wait_until_ready(timeout=5) and pipeline.ready
+        assert mock_load_vector_store.call_args.kwargs == {"mmap": False}
+        # Every component loads in its own thread and gets its own timing
+        assert set(pipeline.loader.timings) == {"vector_store", "embedder", "generator", "total"}
+
 # -----------------------------
 # Test factory function
 # -----------------------------
 def test_build_rag_pipeline():
-    with patch("src.rag_pipeline.build_retriever"), patch("src.rag_pipeline.build_generator"):
+    with patch_retriever(), patch("src.rag_pipeline.build_generator"):
         pipeline = build_rag_pipeline("dummy.index", "dummy.json", "dummy_model.gguf")
         from src.rag_pipeline import RAGPipeline
         assert isinstance(pipeline, RAGPipeline)
+
+
+def test_llm_workers_build_a_generator_pool():
+    with patch_retriever(), patch("src.rag_pipeline.build_generator") as mock_build_generator:
+        build_rag_pipeline("dummy.index", "dummy.json", "dummy_model.gguf", llm_workers=3, llm_threads=4)
+        mock_build_generator.assert_called_once_with("dummy_model.gguf", n_workers=3, n_threads=4)
@@ -54,6 +54,109 @@ def test_retrieve_top_k(retriever):
     # Check that top result is correct
     assert results[0]["score"] >= results[1]["score"]
 
+# -----------------------------
+# Test filters are passed to the vector store
+# -----------------------------
+def test_retrieve_with_filters():
+    store = MagicMock()
+    store.search.return_value = []
+    retriever = ComplaintRetriever(vector_store=store, embedder=MagicMock())
+    filters = {"product_category": "Credit card", "date_received": ("2023-01-01", "2023-12-31")}
+
+    retriever.retrieve("Late fees?", k=3, filters=filters)
+
+    assert store.search.call_args.kwargs == {"k": 3, "normalize": True, "filters": filters}
+
+# -----------------------------
+# Test batched retrieval
+# -----------------------------
+def test_retrieve_many_uses_one_batch_encode_and_search():
+    store = MagicMock()
+    store.search_batch.return_value = [["a"], ["b"], ["c"]]
+    embedder = MagicMock()
+    embedder.encode_batch.return_value = np.ones((3, 384), dtype="float32")
+    retriever = ComplaintRetriever(vector_store=store, embedder=embedder)
+
+    results = retriever.retrieve_many(["q1", "q2", "q3"], k=2)
+
+    assert results == [["a"], ["b"], ["c"]]
+    embedder.encode_batch.assert_called_once_with(["q1", "q2", "q3"])
+    embedder.encode.assert_not_called()
+    assert store.search_batch.call_args.args[0].shape == (3, 384)
+
+def test_retrieve_many_falls_back_to_encode(retriever):
+    retriever.vector_store.search_batch = MagicMock(return_value=[[], []])
+    retriever.retrieve_many(["q1", "q2"], k=2)
+    assert retriever.vector_store.search_batch.call_args.args[0].shape == (2, 384)
+    assert retriever.retrieve_many([], k=2) == []
+
+# -----------------------------
+# Test hybrid (BM25 + dense) retrieval
+# -----------------------------
+@pytest.fixture
+def hybrid_retriever():
+    from src.lexical_index import BM25Index
+    from src.vector_store import ComplaintVectorStore
+
+    texts = ["overdraft fee charged", "wire transfer delayed", "overdraft protection", "card interest"]
+    vectors = np.eye(4, 384, dtype="float32")
+    store = ComplaintVectorStore()
+    store.add(vectors, texts, [{"complaint_id": str(i), "product_category": "Checking"} for i in range(4)])
+
+    class RowEmbedder:
+        # "Dense" model that prefers chunk 2 for every question
+        def encode(self, text):
+            return vectors[2] + 0.1 * vectors[1]
+
+    return ComplaintRetriever(store, RowEmbedder(), lexical_index=BM25Index.build(texts), mode="hybrid")
+
+def test_hybrid_scores_only_lexical_candidates(hybrid_retriever):
+    results = hybrid_retriever.retrieve("wire transfer", k=3)
+    assert [r["text"] for r in results] == ["wire transfer delayed"]
+
+    # No indexed term: falls back to dense search
+    assert hybrid_retriever.retrieve("mortgage", k=1)[0]["text"] == "overdraft protection"
+    assert hybrid_retriever.retrieve("wire transfer", k=1, mode="dense")[0]["text"] == "overdraft protection"
+
+def test_hybrid_respects_tombstones_and_filters(hybrid_retriever):
+    hybrid_retriever.vector_store.remove(["2"])
+    assert [r["text"] for r in hybrid_retriever.retrieve("overdraft", k=3)] == ["overdraft fee charged"]
+    assert hybrid_retriever.retrieve("overdraft", k=3, filters={"product_category": "Savings"}) == []
+
+def test_fusion_combines_both_rankings(hybrid_retriever):
+    results = hybrid_retriever.retrieve("overdraft fee", k=2, mode="fusion")
+    # Chunk 0 is the best lexical match, chunk 2 the best dense match
+    assert {r["text"] for r in results} == {"overdraft fee charged", "overdraft protection"}
+
+def test_hybrid_query_is_cleaned_like_the_chunks():
+    from src.data_preprocessing import ComplaintPreprocessor
+    from src.lexical_index import BM25Index
+    from src.vector_store import ComplaintVectorStore
+
+    # Indexed chunks are preprocessed: lemmatized, stopwords removed
+    texts = ["fee charged twice", "complaint ignored", "card interest"]
+    store = ComplaintVectorStore()
+    store.add(np.eye(3, 384, dtype="float32"), texts, [{"complaint_id": str(i)} for i in range(3)])
+    embedder = MagicMock()
+    embedder.encode.return_value = np.eye(3, 384, dtype="float32")[2]
+    preprocessor = ComplaintPreprocessor(verbose=False)
+    preprocessor.lemmatizer = MagicMock(lemmatize=lambda w: w[:-1] if w.endswith("s") else w)
+    retriever = ComplaintRetriever(store, embedder, lexical_index=BM25Index.build(texts), mode="hybrid",
+                                   query_transform=preprocessor.clean_text)
+
+    assert retriever.retrieve("Fees?", k=1)[0]["text"] == "fee charged twice"
+    assert retriever.retrieve("complaints", k=1)[0]["text"] == "complaint ignored"
+
+def test_retrieve_many_honours_mode(hybrid_retriever):
+    questions = ["wire transfer", "card"]
+    assert hybrid_retriever.retrieve_many(questions, k=1) == [hybrid_retriever.retrieve(q, k=1) for q in questions]
+    dense = hybrid_retriever.retrieve_many(questions, k=1, mode="dense")
+    assert [r[0]["text"] for r in dense] == ["overdraft protection"] * 2
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        ComplaintRetriever(MagicMock(), MagicMock(), mode="sparse")
+
 # -----------------------------
 # Test default MiniLM embedder can be instantiated
 # -----------------------------
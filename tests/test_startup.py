@@ -0,0 +1,41 @@
+# tests/test_startup.py
+
+import threading
+import pytest
+from src.startup import BackgroundLoader
+
+# -----------------------------
+# Tests for BackgroundLoader
+# -----------------------------
+def test_components_load_in_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def load(value):
+        barrier.wait()  # only passes if both loaders run at the same time
+        return value
+
+    loader = BackgroundLoader({"a": lambda: load(1), "b": lambda: load(2)}, verbose=False)
+
+    assert loader.wait(timeout=5)
+    assert (loader.result("a"), loader.result("b")) == (1, 2)
+    assert set(loader.timings) == {"a", "b", "total"}
+    assert loader.status() == {"a": "ready", "b": "ready"}
+
+def test_failed_component_reraises_and_still_signals_ready():
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "model"
+
+    def broken():
+        raise OSError("missing file")
+
+    loader = BackgroundLoader({"slow": slow, "broken": broken}, verbose=False)
+    assert not loader.ready.is_set() and loader.status()["slow"] == "loading"
+    release.set()
+
+    assert loader.wait(timeout=5)
+    assert loader.status() == {"slow": "ready", "broken": "failed"}
+    with pytest.raises(OSError):
+        loader.result("broken")
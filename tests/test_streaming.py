@@ -0,0 +1,97 @@
+# tests/test_streaming.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+from src.streaming import CancellationToken, GenerationMetrics, MeteredStream, iterate_in_thread
+
+
+def slow_pieces(delay=0.01):
+    for piece in ["a", "b", "c"]:
+        time.sleep(delay)
+        yield piece
+
+
+# -----------------------------
+# Test MeteredStream
+# -----------------------------
+def test_metered_stream_times_the_pieces():
+    start = time.perf_counter() - 1.0  # request started a second ago (retrieval)
+    stream = MeteredStream(slow_pieces(), start=start)
+    assert list(stream) == ["a", "b", "c"] and stream.text == "abc"
+
+    metrics = stream.metrics
+    assert metrics.tokens == 3
+    assert 1.0 < metrics.first_token_seconds < metrics.total_seconds
+    assert metrics.tokens_per_second == pytest.approx(2 / (metrics.total_seconds - metrics.first_token_seconds))
+    assert "tokens/s" in str(metrics)
+
+
+def test_metrics_without_streamed_tokens():
+    assert GenerationMetrics().tokens_per_second == 0.0
+    assert MeteredStream([]).metrics.first_token_seconds is None
+
+
+# -----------------------------
+# Test the async form
+# -----------------------------
+def test_iterate_in_thread_keeps_the_loop_free():
+    def pieces():
+        for piece in ["a", "b"]:
+            time.sleep(0.05)
+            yield piece, threading.current_thread().name
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        ticker = asyncio.get_running_loop().create_task(tick())
+        items = [item async for item in iterate_in_thread(pieces())]
+        ticker.cancel()
+        assert [piece for piece, _ in items] == ["a", "b"]
+        assert all(thread != threading.current_thread().name for _, thread in items)
+        assert ticks > 5  # the loop kept running while pieces were produced
+
+    asyncio.run(scenario())
+
+
+def test_iterate_in_thread_closes_abandoned_streams():
+    closed = []
+
+    def pieces():
+        try:
+            yield from ["a", "b", "c"]
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        stream = iterate_in_thread(pieces())
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert closed == [True]
+
+
+# -----------------------------
+# Test CancellationToken
+# -----------------------------
+def test_cancellation_token_reasons():
+    token = CancellationToken(max_tokens=64)
+    assert not token.cancelled and token(None, None) is False
+    assert token.token_limit(512) == 64 and token.remaining_seconds() is None
+    token.cancel()
+    token.cancel(CancellationToken.DEADLINE)  # the first reason sticks
+    assert token.cancelled and token.reason == "cancelled"
+
+    token = CancellationToken(timeout=0.05)
+    assert not token.cancelled and token.token_limit(512) == 512
+    time.sleep(0.06)
+    assert token(None, None) is True and token.reason == "deadline"
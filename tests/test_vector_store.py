@@ -85,3 +85,414 @@ def test_load(monkeypatch):
     assert store.index == dummy_index
     assert store.texts == ["X", "Y"]
     assert store.metadatas == [{"id": 1}, {"id": 2}]
+
+# -----------------------------
+# Test incremental add / remove / delta persistence
+# -----------------------------
+def _unit_vectors(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, 8)).astype("float32")
+
+def _metas(ids):
+    return [{"complaint_id": str(i), "chunk_index": 0} for i in ids]
+
+def test_add_remove_and_delta_round_trip(tmp_path):
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.json")
+    vectors = _unit_vectors(6)
+
+    store = ComplaintVectorStore()
+    store.add(vectors[:4], [f"text {i}" for i in range(4)], _metas([1, 1, 2, 3]))
+    store.save(index_path, meta_path)
+
+    # Daily update: one new complaint, one removed
+    ids = store.add(vectors[4:], ["text 4", "text 5"], _metas([4, 4]))
+    assert ids.tolist() == [4, 5]
+    assert store.remove(["1"]) == 2
+    assert store.save_delta(index_path, meta_path) == "delta-00001"
+    assert store.save_delta(index_path, meta_path) is None  # nothing pending
+
+    reloaded = ComplaintVectorStore.load(index_path, meta_path)
+    assert reloaded.index.ntotal == 6
+    assert reloaded.texts[4:] == ["text 4", "text 5"]
+    assert reloaded.deleted_ids == {0, 1}
+
+    # Removed chunks are never returned, even for their own vectors
+    results = reloaded.search(vectors[0], k=6)
+    assert {r["metadata"]["complaint_id"] for r in results} == {"2", "3", "4"}
+
+    reloaded.compact(index_path, meta_path)
+    assert reloaded.index.ntotal == 4
+    assert not (tmp_path / "faiss.index.deltas").exists()
+    assert ComplaintVectorStore.load(index_path, meta_path).texts == ["text 2", "text 3", "text 4", "text 5"]
+
+# -----------------------------
+# Test the columnar (.arrow) metadata store
+# -----------------------------
+def test_from_parquet_arrow_metadata_is_lazy(tmp_path):
+    import pandas as pd
+    from src.metadata_store import LazyColumn
+
+    vectors = _unit_vectors(5)
+    parquet_path = tmp_path / "embeddings.parquet"
+    pd.DataFrame({
+        "chunk_text": [f"chunk {i}" for i in range(5)],
+        "embedding": [np.resize(v, 384) for v in vectors],
+        "metadata": [{"complaint_id": str(i), "product": "Credit card", "chunk_index": 0} for i in range(5)],
+    }).to_parquet(parquet_path)
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+
+    built = ComplaintVectorStore.from_parquet(str(parquet_path), index_path, meta_path, batch_size=2)
+    store = ComplaintVectorStore.load(index_path, meta_path)
+
+    assert isinstance(store.texts, LazyColumn)
+    assert len(store.texts) == 5 and len(built.texts) == 5
+    assert store.texts[3] == "chunk 3"
+    assert store.metadatas[3]["complaint_id"] == "3"
+    assert store.metadatas[3]["issue"] == "N/A"  # default for fields missing from the parquet
+
+    # Incremental updates and compaction work on top of the memory-mapped base
+    store.add(_unit_vectors(1, seed=1).repeat(48, axis=1), ["chunk 5"], _metas([5]))
+    store.remove(["0"])
+    store.save_delta(index_path, meta_path)
+    store = ComplaintVectorStore.load(index_path, meta_path)
+    assert store.texts[5] == "chunk 5" and store.deleted_ids == {0}
+    store.compact(index_path, meta_path)
+    assert list(ComplaintVectorStore.load(index_path, meta_path).texts) == [f"chunk {i}" for i in range(1, 6)]
+
+def test_migrate_metadata_json(tmp_path):
+    from src.metadata_store import migrate_metadata_json, open_metadata_arrow
+
+    json_path, arrow_path = tmp_path / "metadata.json", str(tmp_path / "metadata.arrow")
+    json_path.write_text(json.dumps({
+        "texts": ["A", "B"],
+        "metadatas": [{"complaint_id": 1, "state": "CA"}, {"complaint_id": "x", "state": None}],
+    }))
+
+    assert migrate_metadata_json(str(json_path), arrow_path) == 2
+    texts, metadatas, deleted = open_metadata_arrow(arrow_path)
+    assert list(texts) == ["A", "B"]
+    # Mixed-type fields are stored as strings
+    assert metadatas[0] == {"complaint_id": "1", "state": "CA"}
+    assert metadatas.field("state") == ["CA", None]
+    assert deleted == []
+
+# -----------------------------
+# Test streaming from_parquet over a shard directory
+# -----------------------------
+def test_from_parquet_streams_fixed_size_list_shards(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    vectors = np.resize(_unit_vectors(6), (6, 384)).astype("float32")
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+    for shard, rows in enumerate([range(0, 4), range(4, 6)]):
+        rows = list(rows)
+        pq.write_table(pa.table({
+            "chunk_text": [f"chunk {i}" if i != 5 else None for i in rows],
+            "metadata": [{"complaint_id": str(i), "state": "CA"} for i in rows],
+            "embedding": pa.FixedSizeListArray.from_arrays(pa.array(vectors[rows].reshape(-1)), 384),
+        }), shard_dir / f"shard-{shard:05d}.parquet")
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.json")
+
+    store = ComplaintVectorStore.from_parquet(str(shard_dir), index_path, meta_path, batch_size=3, normalize=False)
+
+    assert store.index.ntotal == 6
+    np.testing.assert_allclose(store.index.reconstruct_n(0, 6), vectors)
+    assert store.texts[4] == "chunk 4" and store.texts[5] == ""
+    assert store.metadatas[1] == {
+        "complaint_id": "1", "product_category": "N/A", "product": "N/A", "issue": "N/A",
+        "sub_issue": "N/A", "company": "N/A", "state": "CA", "date_received": "N/A",
+        "chunk_index": 0, "total_chunks": 0,
+    }
+    assert ComplaintVectorStore.load(index_path, meta_path).metadatas == store.metadatas
+
+# -----------------------------
+# Test approximate index types
+# -----------------------------
+@pytest.mark.parametrize("index_type, options", [
+    ("sq_fp16", {}),
+    ("sq8", {}),
+    ("pq", {"pq_m": 8, "pq_bits": 4}),
+    ("ivf_flat", {"nlist": 4}),
+    ("ivf_pq", {"nlist": 4, "pq_m": 8, "pq_bits": 4}),
+    ("hnsw", {"hnsw_m": 8}),
+])
+def test_from_parquet_approximate_index(tmp_path, index_type, options):
+    import pandas as pd
+    from src.vector_store import index_type_of
+
+    vectors = np.random.default_rng(0).standard_normal((400, 384)).astype("float32")
+    parquet_path = tmp_path / "embeddings.parquet"
+    pd.DataFrame({
+        "chunk_text": [f"chunk {i}" for i in range(400)],
+        "embedding": list(vectors),
+        "metadata": [{"complaint_id": str(i)} for i in range(400)],
+    }).to_parquet(parquet_path)
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+
+    ComplaintVectorStore.from_parquet(str(parquet_path), index_path, meta_path, batch_size=128,
+                                      index_type=index_type, index_options=options)
+    store = ComplaintVectorStore.load(index_path, meta_path)
+
+    assert index_type_of(store.index) == index_type and store.index.ntotal == 400
+    # Exhaustive settings find the query vector itself
+    results = store.search(vectors[7], k=3, nprobe=4, ef_search=400)
+    if index_type not in ("pq", "ivf_pq"):
+        assert results[0]["text"] == "chunk 7"
+    store.tune(nprobe=2, ef_search=32)
+    store.remove(["7"])
+    assert "chunk 7" not in [r["text"] for r in store.search(vectors[7], k=3, nprobe=4, ef_search=400)]
+
+def test_compressed_index_reranks_from_full_vectors(tmp_path):
+    import pandas as pd
+    from src.vector_store import full_vectors_path
+
+    vectors = np.random.default_rng(0).standard_normal((400, 384)).astype("float32")
+    parquet_path = tmp_path / "embeddings.parquet"
+    pd.DataFrame({
+        "chunk_text": [f"chunk {i}" for i in range(400)],
+        "embedding": list(vectors),
+        "metadata": [{"complaint_id": str(i)} for i in range(400)],
+    }).to_parquet(parquet_path)
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+
+    ComplaintVectorStore.from_parquet(str(parquet_path), index_path, meta_path, batch_size=128,
+                                      index_type="pq", index_options={"pq_m": 8, "pq_bits": 4},
+                                      keep_full_vectors=True)
+    store = ComplaintVectorStore.load(index_path, meta_path)
+    assert isinstance(store.full_vectors, np.memmap) and store.full_vectors.shape == (400, 384)
+
+    # Exact scores after re-ranking: the query vector itself comes first with cosine 1
+    hits = store.search(vectors[7], k=3, rerank=50)
+    assert hits[0]["text"] == "chunk 7" and hits[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+    # Rows added after loading are re-ranked from memory, then persisted on save
+    new = np.random.default_rng(1).standard_normal((1, 384)).astype("float32")
+    store.add(new, ["chunk 400"], [{"complaint_id": "400"}])
+    store.tune(rerank=400)
+    assert store.search(new[0], k=1)[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    store.remove(["7"])
+    assert "chunk 7" not in [r["text"] for r in store.search(vectors[7], k=3)]
+    store.compact(index_path, meta_path)
+
+    reloaded = ComplaintVectorStore.load(index_path, meta_path)
+    assert np.load(full_vectors_path(index_path)).shape == (400, 384)
+    reloaded.tune(rerank=400)
+    assert reloaded.search(new[0], k=1)[0]["text"] == "chunk 400"
+
+def test_rerank_requires_full_vectors():
+    store = ComplaintVectorStore()
+    store.add(_unit_vectors(4), [f"text {i}" for i in range(4)], _metas(range(4)))
+    with pytest.raises(ValueError):
+        store.search(_unit_vectors(1)[0], k=1, rerank=4)
+
+def test_create_index_unknown_type():
+    from src.vector_store import create_index
+    with pytest.raises(ValueError):
+        create_index("lsh")
+
+# -----------------------------
+# Test metadata-filtered search
+# -----------------------------
+@pytest.fixture
+def filtered_store():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((60, 384)).astype("float32")
+    metas = [{
+        "complaint_id": str(i),
+        "product_category": ["Credit card", "Personal loan", "Savings account"][i % 3],
+        "company": "Bank A" if i < 30 else "Bank B",
+        "state": "CA",
+        "date_received": f"2023-{i % 12 + 1:02d}-15" if i % 10 else "N/A",
+    } for i in range(60)]
+    store = ComplaintVectorStore()
+    store.add(vectors, [f"chunk {i}" for i in range(60)], metas)
+    return store, vectors, metas
+
+def _matching(metas, predicate):
+    return {f"chunk {i}" for i, m in enumerate(metas) if predicate(m)}
+
+def test_filtered_search_returns_k_matching_hits(filtered_store):
+    store, vectors, metas = filtered_store
+    filters = {"product_category": "Credit card", "company": "Bank B",
+               "date_received": ("2023-03-01", "2023-09-30")}
+    wanted = _matching(metas, lambda m: m["product_category"] == "Credit card" and m["company"] == "Bank B"
+                       and "2023-03" <= m["date_received"][:7] <= "2023-09")
+
+    results = store.search(vectors[0], k=3, filters=filters)
+
+    assert len(results) == 3
+    assert {r["text"] for r in results} <= wanted
+    assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+    # Same ranking as an unfiltered exhaustive search restricted to the matches
+    exhaustive = [r["text"] for r in store.search(vectors[0], k=60) if r["text"] in wanted][:3]
+    assert [r["text"] for r in results] == exhaustive
+
+def test_filtered_search_lists_tombstones_and_adds(filtered_store):
+    store, vectors, metas = filtered_store
+    store.remove(["3"])
+    results = store.search(vectors[3], k=50, filters={"product_category": ["Credit card", "Personal loan"]})
+    assert len(results) == 39 and "chunk 3" not in {r["text"] for r in results}
+
+    store.add(vectors[3], ["chunk 60"], [{"complaint_id": "60", "product_category": "Credit card",
+                                          "date_received": "2024-01-02"}])
+    results = store.search(vectors[3], k=1, filters={"date_received": ("2024-01-01", None)})
+    assert [r["text"] for r in results] == ["chunk 60"]
+    assert store.search(vectors[3], k=5, filters={"company": "Nobody"}) == []
+    with pytest.raises(ValueError):
+        store.search(vectors[3], k=5, filters={"issue": "Fees"})
+
+def test_filtered_search_uses_partitions_and_selectors(filtered_store, monkeypatch):
+    import src.vector_store as vector_store_module
+    store, vectors, metas = filtered_store
+    monkeypatch.setattr(vector_store_module, "EXACT_FILTER_MAX_ROWS", 0)  # force the FAISS paths
+    store.build_partitions("product_category")
+    store.remove(["0"])
+    store.add(vectors[0], ["chunk 60"], [{"complaint_id": "60", "product_category": "Credit card"}])
+
+    results = store.search(vectors[0], k=25, filters={"product_category": "Credit card"})
+    assert {r["text"] for r in results} == _matching(metas, lambda m: m["product_category"] == "Credit card") - {"chunk 0"} | {"chunk 60"}
+    assert results[0]["text"] == "chunk 60"
+
+    results = store.search(vectors[0], k=25, filters={"product_category": "Credit card", "company": "Bank B"})
+    assert {r["text"] for r in results} == _matching(
+        metas, lambda m: m["product_category"] == "Credit card" and m["company"] == "Bank B")
+
+# -----------------------------
+# Test batched search
+# -----------------------------
+def test_search_batch_matches_single_searches(filtered_store):
+    store, vectors, metas = filtered_store
+    store.remove(["1"])
+    queries = vectors[:5] + 0.05
+
+    for filters in (None, {"company": "Bank A"}):
+        batched = store.search_batch(queries, k=4, filters=filters)
+        single = [store.search(q, k=4, filters=filters) for q in queries]
+        assert [[r["text"] for r in rs] for rs in batched] == [[r["text"] for r in rs] for rs in single]
+        np.testing.assert_allclose([[r["score"] for r in rs] for rs in batched],
+                                   [[r["score"] for r in rs] for rs in single], rtol=1e-5)
+    assert np.array_equal(queries, vectors[:5] + 0.05)  # inputs are not normalised in place
+
+# -----------------------------
+# Test memory-mapped loading
+# -----------------------------
+def test_load_memory_mapped_index(tmp_path):
+    vectors = _unit_vectors(4).repeat(48, axis=1)
+    store = ComplaintVectorStore()
+    store.add(vectors, [f"text {i}" for i in range(4)], _metas(range(4)))
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+    store.save(index_path, meta_path)
+
+    mapped = ComplaintVectorStore.load(index_path, meta_path, mmap=True)
+    assert not mapped.index.codes.is_owned  # the flat codes are a view of the mapped file
+    assert mapped.search(vectors[2], k=1)[0]["text"] == "text 2"
+
+    # Growing copies the index into RAM; re-saving over the mapped file is safe
+    mapped.add(vectors[:1], ["text 4"], _metas([4]))
+    assert mapped.index.codes.is_owned
+    mapped.save(index_path, meta_path)
+    assert ComplaintVectorStore.load(index_path, meta_path).index.ntotal == 5
+
+@pytest.mark.parametrize("index_type, options", [
+    ("pq", {"pq_m": 8, "pq_bits": 4}),
+    ("ivf_flat", {"nlist": 4}),
+    ("ivf_pq", {"nlist": 4, "pq_m": 8, "pq_bits": 4}),
+])
+def test_load_memory_mapped_ivf_index_with_delta(tmp_path, index_type, options):
+    import pandas as pd
+
+    vectors = np.random.default_rng(0).standard_normal((400, 384)).astype("float32")
+    parquet_path = tmp_path / "embeddings.parquet"
+    pd.DataFrame({
+        "chunk_text": [f"chunk {i}" for i in range(400)],
+        "embedding": list(vectors),
+        "metadata": [{"complaint_id": str(i)} for i in range(400)],
+    }).to_parquet(parquet_path)
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+    store = ComplaintVectorStore.from_parquet(str(parquet_path), index_path, meta_path, batch_size=128,
+                                              index_type=index_type, index_options=options)
+    store.add(vectors[:2], ["chunk 400", "chunk 401"], _metas([400, 401]))
+    store.save_delta(index_path, meta_path)
+
+    # The read-only mapping is copied into RAM on the first write
+    mapped = ComplaintVectorStore.load(index_path, meta_path, mmap=True)
+    assert mapped.index.ntotal == 402
+    mapped.add(vectors[2:3], ["chunk 402"], _metas([402]))
+    mapped.save(index_path, meta_path)
+    reloaded = ComplaintVectorStore.load(index_path, meta_path, mmap=True)
+    assert reloaded.index.ntotal == 403 and reloaded.texts[402] == "chunk 402"
+
+# -----------------------------
+# Test partial metadata and partition settings
+# -----------------------------
+def test_filtered_search_on_arrow_metadata_missing_a_field(tmp_path):
+    vectors = _unit_vectors(4).repeat(48, axis=1)
+    store = ComplaintVectorStore()
+    # Metadata from add() may lack filter fields entirely
+    store.add(vectors, [f"text {i}" for i in range(4)],
+              [{"complaint_id": str(i), "product_category": "Credit card"} for i in range(4)])
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+    store.save(index_path, meta_path)
+
+    loaded = ComplaintVectorStore.load(index_path, meta_path)
+    assert loaded.search(vectors[1], k=2, filters={"company": "Bank A"}) == []
+    assert loaded.search(vectors[1], k=1, filters={"product_category": "Credit card"})[0]["text"] == "text 1"
+
+def test_partitions_of_memory_mapped_ivf_index_follow_tune(tmp_path, monkeypatch):
+    import faiss
+    import pandas as pd
+    import src.vector_store as vector_store_module
+
+    vectors = np.random.default_rng(0).standard_normal((400, 384)).astype("float32")
+    parquet_path = tmp_path / "embeddings.parquet"
+    pd.DataFrame({
+        "chunk_text": [f"chunk {i}" for i in range(400)],
+        "embedding": list(vectors),
+        "metadata": [{"complaint_id": str(i), "product_category": ["Credit card", "Personal loan"][i % 2]}
+                     for i in range(400)],
+    }).to_parquet(parquet_path)
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+    ComplaintVectorStore.from_parquet(str(parquet_path), index_path, meta_path, batch_size=128,
+                                      index_type="ivf_flat", index_options={"nlist": 4})
+
+    store = ComplaintVectorStore.load(index_path, meta_path, mmap=True)
+    store.build_partitions("product_category")
+    store.tune(nprobe=4)
+    partitions = store._partitions[1]
+    assert {faiss.downcast_index(p.index).nprobe for p in partitions.values()} == {4}
+    assert sum(p.ntotal for p in partitions.values()) == 400
+    monkeypatch.setattr(vector_store_module, "EXACT_FILTER_MAX_ROWS", 0)  # search the partition
+    results = store.search(vectors[8], k=1, filters={"product_category": "Credit card"})
+    assert results[0]["text"] == "chunk 8"
+
+def test_filtered_search_on_ivf_index_uses_ivf_parameters(tmp_path, monkeypatch):
+    import pandas as pd
+    import src.vector_store as vector_store_module
+
+    vectors = np.random.default_rng(0).standard_normal((400, 384)).astype("float32")
+    parquet_path = tmp_path / "embeddings.parquet"
+    categories = ["Credit card", "Personal loan", "Savings account"]
+    pd.DataFrame({
+        "chunk_text": [f"chunk {i}" for i in range(400)],
+        "embedding": list(vectors),
+        "metadata": [{"complaint_id": str(i), "product_category": categories[i % 3]} for i in range(400)],
+    }).to_parquet(parquet_path)
+    index_path, meta_path = str(tmp_path / "faiss.index"), str(tmp_path / "metadata.arrow")
+    ComplaintVectorStore.from_parquet(str(parquet_path), index_path, meta_path, batch_size=128,
+                                      index_type="ivf_flat", index_options={"nlist": 4})
+    store = ComplaintVectorStore.load(index_path, meta_path)
+    store.tune(nprobe=4)
+    monkeypatch.setattr(vector_store_module, "EXACT_FILTER_MAX_ROWS", 0)  # large-filter FAISS path
+
+    # No nprobe given: the selector is passed with IVF parameters
+    results = store.search(vectors[6], k=3, filters={"product_category": "Credit card"})
+    assert results[0]["text"] == "chunk 6"
+    assert all(r["metadata"]["product_category"] == "Credit card" for r in results)
+    results = store.search(vectors[7], k=3, filters={"product_category": ["Personal loan", "Savings account"]})
+    assert results[0]["text"] == "chunk 7"
+
+    store.remove(["7"])
+    results = store.search(vectors[7], k=3, ef_search=64)  # tombstones on an IVF index
+    assert "chunk 7" not in [r["text"] for r in results]